@@ -14,6 +14,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
 import uvicorn
 
@@ -25,6 +26,16 @@ from api.routers import (
     rebalancing_router,
     websocket_router
 )
+from api.responses import AnalysisJSONResponse
+from api.services.response_cache import response_cache
+from api.services.batch_analysis import shutdown_process_pool
+from api.services.rate_limiter import (
+    rate_limiter, request_identity, client_identity, EXEMPT_PATHS, UNRESOLVED_PRINCIPAL
+)
+from api.services.auth_service import get_user_tier, last_used_recorder
+from utils.db_pool import pool_stats, close_all_pools
+from api.routers.websocket import broadcaster as price_broadcaster
+from utils.quote_cache import prefetch_scheduler
 
 app = FastAPI(
     title="Alphalens Portfolio Analyzer API",
@@ -49,6 +60,8 @@ Built for integration with broker platforms.
 ### Rate Limits:
 - 100 requests/minute for standard users
 - 1000 requests/minute for premium users
+- Requests are weighted by endpoint cost (e.g. `/metrics/full` counts as 10, a price quote as 1)
+- Every response carries `X-RateLimit-*` headers; throttled requests get `429` with `Retry-After`
     """,
     version="1.0.0",
     contact={
@@ -60,7 +73,8 @@ Built for integration with broker platforms.
     },
     docs_url="/docs",
     redoc_url="/redoc",
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    default_response_class=AnalysisJSONResponse
 )
 
 app.add_middleware(
@@ -78,9 +92,62 @@ async def add_request_timing(request: Request, call_next):
     response = await call_next(request)
     process_time = (datetime.utcnow() - start_time).total_seconds()
     response.headers["X-Process-Time"] = str(process_time)
+    cache_status = getattr(request.state, "cache_status", None)
+    if cache_status:
+        response.headers["X-Cache"] = cache_status
+        response.headers["X-Cache-Hit-Ratio"] = f"{response_cache.hit_ratio:.4f}"
     return response
 
 
+@app.middleware("http")
+async def enforce_rate_limit(request: Request, call_next):
+    if request.url.path in EXEMPT_PATHS or request.method == "OPTIONS":
+        return await call_next(request)
+    
+    client_host = request.client.host if request.client else None
+    identity, tier_lookup = request_identity(request.headers, client_host)
+    tier = rate_limiter.cached_tier(identity) if tier_lookup else "standard"
+    if tier is None:
+        # Unverified credentials are charged to the client IP, so made-up keys
+        # neither get a fresh bucket nor an unlimited number of tier lookups
+        result = await run_in_threadpool(
+            rate_limiter.check, client_identity(client_host), "standard", request.url.path
+        )
+        if result.allowed:
+            rate_limiter.remember_tier(identity, await run_in_threadpool(get_user_tier, **tier_lookup))
+    else:
+        if tier == UNRESOLVED_PRINCIPAL:
+            identity, tier = client_identity(client_host), "standard"
+        result = await run_in_threadpool(rate_limiter.check, identity, tier, request.url.path)
+    if not result.allowed:
+        return JSONResponse(
+            status_code=429,
+            content={
+                "detail": "Rate limit exceeded",
+                "error_code": "RATE_LIMITED"
+            },
+            headers=result.headers()
+        )
+    
+    response = await call_next(request)
+    response.headers.update(result.headers())
+    return response
+
+
+@app.on_event("startup")
+async def start_workers():
+    await price_broadcaster.start()
+    prefetch_scheduler.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    await price_broadcaster.stop()
+    shutdown_process_pool()
+    last_used_recorder.stop()
+    close_all_pools()
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     return JSONResponse(
@@ -121,7 +188,9 @@ async def health_check():
         "services": {
             "database": "connected",
             "data_feeds": "operational"
-        }
+        },
+        "response_cache": response_cache.stats(),
+        "database_pool": pool_stats()
     }
 
 
@@ -56,6 +56,15 @@ class PortfolioUpload(BaseModel):
     holdings: List[StockHolding]
 
 
+class BatchPortfolio(BaseModel):
+    portfolio_id: str = Field(..., description="Client reference echoed back with the result")
+    holdings: List[StockHolding]
+
+
+class BatchAnalyzeRequest(BaseModel):
+    portfolios: List[BatchPortfolio] = Field(..., min_length=1)
+
+
 class PortfolioSummary(BaseModel):
     total_investment: float
     current_value: float
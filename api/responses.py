@@ -0,0 +1,130 @@
+"""Fast JSON responses for analysis payloads
+
+Analysis results are built from pandas/NumPy objects (np.float64, Timestamps,
+DataFrames) which the stdlib encoder handles slowly or not at all. These
+helpers serialize them with orjson. Clients that opt in (?format=columnar or
+Accept: application/vnd.alphalens.columnar+json) get matrix-shaped payloads as
+columnar arrays, which are far smaller than record dicts for large portfolios;
+everyone else keeps the record-oriented shape.
+"""
+import json
+import math
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.alphalens.columnar+json"
+MATRIX_KEYS = {"correlation_matrix"}
+RECORD_TABLE_KEYS = {"stock_breakdown", "stock_performance"}
+
+
+def matrix_to_columnar(matrix: dict) -> dict:
+    """Convert a DataFrame.to_dict() matrix ({column: {row: value}}) to split orientation"""
+    columns = list(matrix.keys())
+    index = []
+    seen = set()
+    for column in columns:
+        for row in matrix[column].keys():
+            if row not in seen:
+                seen.add(row)
+                index.append(row)
+    data = [[matrix[column].get(row) for column in columns] for row in index]
+    return {"index": index, "columns": columns, "data": data}
+
+
+def records_to_columnar(records: list) -> dict:
+    """Convert a list of record dicts to a column header plus row arrays"""
+    columns = []
+    seen = set()
+    for record in records:
+        for key in record.keys():
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    data = [[record.get(column) for column in columns] for record in records]
+    return {"columns": columns, "data": data}
+
+
+def wants_columnar(request) -> bool:
+    """Whether the client opted in to columnar tables"""
+    return (request.query_params.get("format") == "columnar"
+            or COLUMNAR_MEDIA_TYPE in request.headers.get("accept", ""))
+
+
+def to_columnar(content: Any) -> Any:
+    """Recursively rewrite known matrix and record-table payloads into columnar arrays"""
+    if isinstance(content, dict):
+        result = {}
+        for key, value in content.items():
+            if key in MATRIX_KEYS and isinstance(value, dict) and value \
+                    and all(isinstance(v, dict) for v in value.values()):
+                result[key] = matrix_to_columnar(value)
+            elif key in RECORD_TABLE_KEYS and isinstance(value, list) and value \
+                    and all(isinstance(r, dict) for r in value):
+                result[key] = records_to_columnar(value)
+            else:
+                result[key] = to_columnar(value)
+        return result
+    if isinstance(content, list):
+        return [to_columnar(item) for item in content]
+    return content
+
+
+def _default(obj: Any) -> Any:
+    """Fallback encoder for NumPy, pandas and pydantic values"""
+    if isinstance(obj, np.generic):
+        value = obj.item()
+        if isinstance(value, float) and not math.isfinite(value):
+            return None
+        return value
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if obj is pd.NaT:
+        return None
+    if isinstance(obj, (pd.Timestamp, datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, pd.Timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, pd.DataFrame):
+        return obj.to_dict("records")
+    if isinstance(obj, pd.Series):
+        return obj.tolist()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "dict"):
+        return obj.dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any, columnar: bool = False) -> bytes:
+    """Serialize an analysis payload to JSON bytes, optionally with columnar tables"""
+    if columnar:
+        content = to_columnar(content)
+    if orjson is not None:
+        return orjson.dumps(
+            content,
+            default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(content, default=_default).encode("utf-8")
+
+
+class AnalysisJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson and NumPy/pandas-aware encoding"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
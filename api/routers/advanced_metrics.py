@@ -3,8 +3,8 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Body, Query
+from typing import Dict, Optional
 
 from api.models.schemas import (
     PortfolioUpload, AdvancedMetricsResponse, TaxImpact,
@@ -12,7 +12,9 @@ from api.models.schemas import (
     RiskRadarMetrics, HealthScore
 )
 from api.dependencies import get_current_user
+from api.services.response_cache import analysis_etag, cached_response, store_response
 from api.routers.portfolio import convert_holdings_to_dataframe, get_analyzer_instances
+from utils.intraday_bars import intraday_bars
 
 router = APIRouter(prefix="/metrics", tags=["Advanced Metrics"])
 
@@ -26,6 +28,7 @@ def get_metrics_calculator():
 @router.post("/full")
 async def get_all_metrics(
     portfolio: PortfolioUpload,
+    request: Request,
     include_benchmark: bool = True,
     current_user: dict = Depends(get_current_user)
 ):
@@ -45,6 +48,11 @@ async def get_all_metrics(
     
     Plus: Health Score, Scenario Analysis
     """
+    etag = analysis_etag(request, portfolio.holdings)
+    cached = cached_response(request, etag)
+    if cached is not None:
+        return cached
+    
     try:
         data_fetcher, analyzer = get_analyzer_instances()
         calculator = get_metrics_calculator()
@@ -75,7 +83,7 @@ async def get_all_metrics(
             analyzed_df, historical_data, benchmark_data
         )
         
-        return all_metrics
+        return store_response(request, etag, all_metrics)
         
     except Exception as e:
         raise HTTPException(
@@ -87,9 +95,15 @@ async def get_all_metrics(
 @router.post("/structural")
 async def get_structural_diagnostics(
     portfolio: PortfolioUpload,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Get structural diagnostics - market cap and sector allocation"""
+    etag = analysis_etag(request, portfolio.holdings)
+    cached = cached_response(request, etag)
+    if cached is not None:
+        return cached
+    
     try:
         data_fetcher, analyzer = get_analyzer_instances()
         calculator = get_metrics_calculator()
@@ -105,7 +119,7 @@ async def get_structural_diagnostics(
         portfolio_df["Current Value"] = portfolio_df["Current Price"] * portfolio_df["Quantity"]
         
         structural = calculator.calculate_structural_diagnostics(portfolio_df)
-        return structural
+        return store_response(request, etag, structural)
         
     except Exception as e:
         raise HTTPException(
@@ -117,9 +131,15 @@ async def get_structural_diagnostics(
 @router.post("/concentration-risk")
 async def get_concentration_risk(
     portfolio: PortfolioUpload,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Get concentration risk analysis - identifies over-allocation"""
+    etag = analysis_etag(request, portfolio.holdings)
+    cached = cached_response(request, etag)
+    if cached is not None:
+        return cached
+    
     try:
         data_fetcher, _ = get_analyzer_instances()
         calculator = get_metrics_calculator()
@@ -135,7 +155,7 @@ async def get_concentration_risk(
         portfolio_df["Current Value"] = portfolio_df["Current Price"] * portfolio_df["Quantity"]
         
         concentration = calculator.calculate_concentration_risk(portfolio_df)
-        return concentration
+        return store_response(request, etag, concentration)
         
     except Exception as e:
         raise HTTPException(
@@ -147,10 +167,16 @@ async def get_concentration_risk(
 @router.post("/volatility")
 async def get_volatility_metrics(
     portfolio: PortfolioUpload,
+    request: Request,
     include_benchmark: bool = True,
     current_user: dict = Depends(get_current_user)
 ):
     """Get volatility metrics - beta, Sharpe ratio, Sortino ratio, VaR"""
+    etag = analysis_etag(request, portfolio.holdings)
+    cached = cached_response(request, etag)
+    if cached is not None:
+        return cached
+    
     try:
         data_fetcher, analyzer = get_analyzer_instances()
         calculator = get_metrics_calculator()
@@ -180,7 +206,7 @@ async def get_volatility_metrics(
         volatility = calculator.calculate_volatility_metrics(
             analyzed_df, historical_data, benchmark_data
         )
-        return volatility
+        return store_response(request, etag, volatility)
         
     except Exception as e:
         raise HTTPException(
@@ -192,9 +218,15 @@ async def get_volatility_metrics(
 @router.post("/health-score")
 async def get_health_score(
     portfolio: PortfolioUpload,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Get overall portfolio health score (0-100) with grade"""
+    etag = analysis_etag(request, portfolio.holdings)
+    cached = cached_response(request, etag)
+    if cached is not None:
+        return cached
+    
     try:
         data_fetcher, analyzer = get_analyzer_instances()
         calculator = get_metrics_calculator()
@@ -220,7 +252,7 @@ async def get_health_score(
         all_metrics = calculator.calculate_all_metrics(analyzed_df, historical_data, None)
         health = calculator.calculate_health_score(all_metrics)
         
-        return health
+        return store_response(request, etag, health)
         
     except Exception as e:
         raise HTTPException(
@@ -232,9 +264,15 @@ async def get_health_score(
 @router.post("/tax-impact")
 async def get_tax_impact(
     portfolio: PortfolioUpload,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Calculate tax impact - STCG/LTCG classification and estimated taxes"""
+    etag = analysis_etag(request, portfolio.holdings)
+    cached = cached_response(request, etag)
+    if cached is not None:
+        return cached
+    
     try:
         data_fetcher, analyzer = get_analyzer_instances()
         calculator = get_metrics_calculator()
@@ -254,7 +292,7 @@ async def get_tax_impact(
         analyzed_df = analysis_results.get("portfolio_df", portfolio_df)
         
         tax_impact = calculator.calculate_tax_impact(analyzed_df)
-        return tax_impact
+        return store_response(request, etag, tax_impact)
         
     except Exception as e:
         raise HTTPException(
@@ -266,6 +304,7 @@ async def get_tax_impact(
 @router.post("/risk-radar")
 async def get_risk_radar(
     portfolio: PortfolioUpload,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Get risk radar metrics for spider chart visualization
@@ -278,6 +317,11 @@ async def get_risk_radar(
     - Tail Risk
     - Behavioral Risk
     """
+    etag = analysis_etag(request, portfolio.holdings)
+    cached = cached_response(request, etag)
+    if cached is not None:
+        return cached
+    
     try:
         data_fetcher, analyzer = get_analyzer_instances()
         calculator = get_metrics_calculator()
@@ -323,7 +367,7 @@ async def get_risk_radar(
             "behavioral_risk": 100 - normalize_risk(behavior.get("diversification_score", 0))
         }
         
-        return radar_metrics
+        return store_response(request, etag, radar_metrics)
         
     except Exception as e:
         raise HTTPException(
@@ -335,6 +379,7 @@ async def get_risk_radar(
 @router.post("/benchmark-comparison")
 async def get_benchmark_comparison(
     portfolio: PortfolioUpload,
+    request: Request,
     benchmark: str = "NIFTY50",
     current_user: dict = Depends(get_current_user)
 ):
@@ -342,6 +387,11 @@ async def get_benchmark_comparison(
     
     Available benchmarks: NIFTY50, SENSEX, NIFTYMIDCAP, NIFTYBANK
     """
+    etag = analysis_etag(request, portfolio.holdings)
+    cached = cached_response(request, etag)
+    if cached is not None:
+        return cached
+    
     try:
         data_fetcher, analyzer = get_analyzer_instances()
         calculator = get_metrics_calculator()
@@ -387,7 +437,7 @@ async def get_benchmark_comparison(
         drift = calculator.calculate_drift_analysis(analyzed_df, benchmark_data)
         volatility = calculator.calculate_volatility_metrics(analyzed_df, historical_data, benchmark_data)
         
-        return {
+        return store_response(request, etag, {
             "benchmark_name": benchmark.upper(),
             "benchmark_return": round(benchmark_return, 2),
             "portfolio_return": round(portfolio_return, 2),
@@ -396,7 +446,7 @@ async def get_benchmark_comparison(
             "tracking_error": drift.get("tracking_error", 0),
             "active_share": drift.get("active_share", 0),
             "outperformance": round(portfolio_return - benchmark_return, 2)
-        }
+        })
         
     except Exception as e:
         raise HTTPException(
@@ -408,9 +458,15 @@ async def get_benchmark_comparison(
 @router.post("/scenario-analysis")
 async def get_scenario_analysis(
     portfolio: PortfolioUpload,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Run scenario analysis - bull, bear, and recession cases"""
+    etag = analysis_etag(request, portfolio.holdings)
+    cached = cached_response(request, etag)
+    if cached is not None:
+        return cached
+    
     try:
         data_fetcher, analyzer = get_analyzer_instances()
         calculator = get_metrics_calculator()
@@ -434,10 +490,46 @@ async def get_scenario_analysis(
         analyzed_df = analysis_results.get("portfolio_df", portfolio_df)
         
         scenarios = calculator.calculate_scenario_analysis(analyzed_df, historical_data, None)
-        return scenarios
+        return store_response(request, etag, scenarios)
         
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Scenario analysis failed: {str(e)}"
         )
+
+
+@router.post("/intraday/portfolio")
+async def get_intraday_portfolio_metrics(
+    holdings: Dict[str, float] = Body(..., description="Position size per symbol"),
+    interval: int = Query(60, description="Bar interval in seconds"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Intraday P&L, drawdown and volatility of a portfolio from bars built on live ticks"""
+    if interval not in intraday_bars.intervals:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {list(intraday_bars.intervals)}")
+    metrics = intraday_bars.portfolio_metrics({symbol.upper(): qty for symbol, qty in holdings.items()}, interval=interval)
+    if metrics is None:
+        raise HTTPException(status_code=404, detail="No live ticks received for these symbols today")
+    return metrics
+
+
+@router.get("/intraday/{symbol}")
+async def get_intraday_metrics(
+    symbol: str,
+    interval: int = Query(60, description="Bar interval in seconds"),
+    quantity: float = Query(1, description="Position size for P&L"),
+    include_bars: bool = Query(False),
+    current_user: dict = Depends(get_current_user)
+):
+    """Intraday P&L, drawdown and volatility from bars built on live ticks"""
+    if interval not in intraday_bars.intervals:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {list(intraday_bars.intervals)}")
+    symbol = symbol.upper()
+    metrics = intraday_bars.metrics(symbol, quantity=quantity, interval=interval)
+    if metrics is None:
+        raise HTTPException(status_code=404, detail=f"No live ticks received for {symbol} today")
+    if include_bars:
+        bars = intraday_bars.bars(symbol, interval)
+        metrics["bars_data"] = {key: values.tolist() for key, values in bars.items()}
+    return metrics
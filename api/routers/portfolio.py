@@ -3,7 +3,8 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 import pandas as pd
 from io import StringIO
@@ -11,9 +12,11 @@ from datetime import datetime
 
 from api.models.schemas import (
     PortfolioUpload, PortfolioAnalysisResponse, PortfolioSummary,
-    StockAnalysis, ErrorResponse
+    StockAnalysis, ErrorResponse, BatchAnalyzeRequest
 )
 from api.dependencies import get_current_user
+from api.services.response_cache import analysis_etag, cached_response, store_response
+from api.services.batch_analysis import stream_batch_analysis
 
 router = APIRouter(prefix="/portfolio", tags=["Portfolio Analysis"])
 
@@ -85,9 +88,15 @@ async def upload_portfolio_csv(
 @router.post("/analyze", response_model=PortfolioAnalysisResponse)
 async def analyze_portfolio(
     portfolio: PortfolioUpload,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Analyze portfolio and return comprehensive metrics"""
+    etag = analysis_etag(request, portfolio.holdings)
+    cached = cached_response(request, etag)
+    if cached is not None:
+        return cached
+    
     try:
         data_fetcher, analyzer = get_analyzer_instances()
         
@@ -141,13 +150,13 @@ async def analyze_portfolio(
         
         sector_allocation = results.get("sector_allocation", {})
         
-        return PortfolioAnalysisResponse(
+        return store_response(request, etag, PortfolioAnalysisResponse(
             summary=summary,
             holdings=holdings_list,
             sector_allocation=sector_allocation,
             top_performers=top_performers,
             bottom_performers=bottom_performers
-        )
+        ))
         
     except Exception as e:
         raise HTTPException(
@@ -159,9 +168,15 @@ async def analyze_portfolio(
 @router.post("/quick-analyze")
 async def quick_analyze(
     portfolio: PortfolioUpload,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Quick portfolio analysis with basic metrics (faster response)"""
+    etag = analysis_etag(request, portfolio.holdings)
+    cached = cached_response(request, etag)
+    if cached is not None:
+        return cached
+    
     try:
         data_fetcher, _ = get_analyzer_instances()
         
@@ -201,7 +216,7 @@ async def quick_analyze(
         total_gain_loss = current_value - total_investment
         total_pct = ((current_value - total_investment) / total_investment * 100) if total_investment > 0 else 0
         
-        return {
+        return store_response(request, etag, {
             "summary": {
                 "total_investment": round(total_investment, 2),
                 "current_value": round(current_value, 2),
@@ -210,10 +225,33 @@ async def quick_analyze(
                 "total_stocks": len(holdings_results)
             },
             "holdings": holdings_results
-        }
+        })
         
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Analysis failed: {str(e)}"
         )
+
+
+@router.post("/batch-analyze")
+async def batch_analyze(
+    batch: BatchAnalyzeRequest,
+    include_benchmark: bool = True,
+    current_user: dict = Depends(get_current_user)
+):
+    """Analyze many portfolios in one call, streamed back as NDJSON
+    
+    Market data is fetched once for the union of symbols across all portfolios.
+    Portfolios are evaluated in parallel and each response line is one
+    portfolio's result, emitted as soon as it completes:
+    `{"portfolio_id": "...", "status": "ok", "summary": {...}, "metrics": {...}}`
+    """
+    portfolios = [
+        {"portfolio_id": p.portfolio_id, "holdings": [h.dict() for h in p.holdings]}
+        for p in batch.portfolios
+    ]
+    return StreamingResponse(
+        stream_batch_analysis(portfolios, include_benchmark),
+        media_type="application/x-ndjson"
+    )
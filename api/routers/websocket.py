@@ -2,9 +2,12 @@
 
 Note on Scalability:
 For production deployments with multiple workers:
-- Current implementation uses in-memory connection management
-- For horizontal scaling, integrate Redis pub/sub for cross-worker communication
-- Consider using a message broker (Redis, RabbitMQ) for price update distribution
+- Connection state is in-memory per worker
+- Price updates go through api.services.pubsub: set PUBSUB_BACKEND=unix so
+  workers on one host share a Unix socket bus; one worker polls prices and
+  every worker fans the published ticks out to its own clients
+- Multi-host deployments need a networked backend (e.g. Redis) registered
+  with pubsub.register_backend()
 """
 import sys
 import os
@@ -12,12 +15,17 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspa
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query
 from typing import Dict, List, Set, Optional
+import time
 import asyncio
 import json
+from collections import OrderedDict
 from datetime import datetime
 import jwt
 
 from api.services.auth_service import SECRET_KEY, ALGORITHM
+from api.dependencies import require_permission
+from api.responses import dumps
+from api.services.price_broadcaster import PriceBroadcaster
 
 router = APIRouter(prefix="/ws", tags=["WebSocket"])
 
@@ -38,68 +46,295 @@ async def verify_websocket_token(token: Optional[str] = Query(None)) -> Optional
         return None
 
 
+WS_QUEUE_MAX_MESSAGES = int(os.environ.get("WS_QUEUE_MAX_MESSAGES", "256"))
+WS_SEND_TIMEOUT_SECONDS = float(os.environ.get("WS_SEND_TIMEOUT_SECONDS", "10"))
+# "conflate": keep only the latest price per symbol and shed the oldest updates when full
+# "disconnect": never conflate; a client whose queue overflows is dropped
+WS_SLOW_CONSUMER_POLICY = os.environ.get("WS_SLOW_CONSUMER_POLICY", "conflate")
+# Default price_batch window; 0 sends one price_update per tick. Clients may override with ?batch_ms=
+WS_PRICE_BATCH_MS = int(os.environ.get("WS_PRICE_BATCH_MS", "0"))
+WS_PRICE_BATCH_MAX_MS = 1000
+
+
+class ClientConnection:
+    """One websocket with a bounded outbound queue drained by its own writer task
+    
+    Messages enqueued with a conflation key (e.g. a symbol's price update)
+    replace any still-queued message with the same key, so a slow client gets
+    the latest price rather than a backlog.
+    """
+    
+    def __init__(self, websocket: WebSocket, client_id: str, on_failure, owner: Optional[str] = None,
+                 max_messages: int = WS_QUEUE_MAX_MESSAGES, policy: str = WS_SLOW_CONSUMER_POLICY,
+                 send_timeout: float = WS_SEND_TIMEOUT_SECONDS, batch_ms: int = WS_PRICE_BATCH_MS):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.owner = owner
+        self.max_messages = max_messages
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.batch_window = max(0, min(batch_ms, WS_PRICE_BATCH_MAX_MS)) / 1000
+        self._batch: Dict[str, dict] = {}
+        self._batch_handle: Optional[asyncio.TimerHandle] = None
+        self._on_failure = on_failure
+        self._queue: "OrderedDict[object, tuple]" = OrderedDict()
+        self._sequence = 0
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._writer: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.max_queue_depth = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.batches = 0
+        self.batched_ticks = 0
+    
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+    
+    def enqueue(self, text: str, key=None) -> bool:
+        """Queue a serialized message without waiting; returns False if it was dropped"""
+        if self._closed:
+            return False
+        now = time.monotonic()
+        if key is not None and self.policy == "conflate" and key in self._queue:
+            self._queue[key] = (text, self._queue[key][1])
+            self.conflated += 1
+            return True
+        
+        if len(self._queue) >= self.max_messages:
+            self.dropped += 1
+            if self.policy != "conflate":
+                self._closed = True
+                asyncio.create_task(self._fail("slow consumer"))
+                return False
+            self._shed_oldest()
+        
+        if key is None or self.policy != "conflate":
+            self._sequence += 1
+            key = ("seq", self._sequence)
+        self._queue[key] = (text, now)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+        self._ready.set()
+        return True
+    
+    def _shed_oldest(self):
+        """Make room by dropping the oldest queued price update (or the oldest message if none)"""
+        for queued_key in self._queue:
+            if queued_key[0] != "seq":
+                del self._queue[queued_key]
+                return
+        self._queue.popitem(last=False)
+    
+    async def _write_loop(self):
+        while not self._closed:
+            if not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            _, (text, enqueued_at) = self._queue.popitem(last=False)
+            try:
+                await asyncio.wait_for(self.websocket.send_text(text), self.send_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await self._fail("send failed")
+                return
+            latency = time.monotonic() - enqueued_at
+            self.sent += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+    
+    async def _fail(self, reason: str):
+        self._closed = True
+        try:
+            await self.websocket.close(code=1013, reason=reason)
+        except Exception:
+            pass
+        self._on_failure(self.client_id, self)
+    
+    def add_tick(self, symbol: str, data: dict):
+        """Coalesce a tick into the current batch window, keeping only the latest per symbol"""
+        if self._closed:
+            return
+        self._batch[symbol] = data
+        self.batched_ticks += 1
+        if self._batch_handle is None:
+            self._batch_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush_batch)
+    
+    def _flush_batch(self):
+        self._batch_handle = None
+        if not self._batch or self._closed:
+            return
+        batch, self._batch = self._batch, {}
+        self.batches += 1
+        self.enqueue(dumps({
+            "type": "price_batch",
+            "data": list(batch.values()),
+            "timestamp": datetime.utcnow().isoformat()
+        }).decode("utf-8"))
+    
+    def close(self):
+        self._closed = True
+        self._ready.set()
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        if self._batch_handle is not None:
+            self._batch_handle.cancel()
+            self._batch_handle = None
+    
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self._queue),
+            "max_queue_depth": self.max_queue_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "conflated": self.conflated,
+            "avg_send_latency_ms": round(self.total_latency / self.sent * 1000, 2) if self.sent else 0.0,
+            "max_send_latency_ms": round(self.max_latency * 1000, 2),
+            "batch_window_ms": int(self.batch_window * 1000),
+            "batches": self.batches,
+            "batched_ticks": self.batched_ticks
+        }
+
+
 class ConnectionManager:
-    """Manages WebSocket connections for real-time updates"""
+    """Manages WebSocket connections for real-time updates
+    
+    symbol_subscribers is the inverse of subscriptions (symbol -> client ids),
+    so a tick only touches the clients subscribed to its symbol. Sends never
+    block the caller: each client has its own queue and writer task.
+    """
     
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+        self.active_connections: Dict[str, ClientConnection] = {}
         self.subscriptions: Dict[str, Set[str]] = {}
+        self.symbol_subscribers: Dict[str, Set[str]] = {}
     
-    async def connect(self, websocket: WebSocket, client_id: str):
+    async def connect(self, websocket: WebSocket, client_id: str, owner: Optional[str] = None,
+                      batch_ms: Optional[int] = None) -> bool:
+        """Accept a client; a client_id held by another principal is rejected, not taken over"""
+        current = self.active_connections.get(client_id)
+        if current is not None and current.owner != owner:
+            await websocket.close(code=4003, reason="client_id is already in use")
+            return False
         await websocket.accept()
-        self.active_connections[client_id] = websocket
+        if current is not None:
+            # The same principal reconnecting replaces its previous socket
+            self.disconnect(client_id)
+        connection = ClientConnection(websocket, client_id, self.disconnect, owner=owner,
+                                      batch_ms=WS_PRICE_BATCH_MS if batch_ms is None else batch_ms)
+        self.active_connections[client_id] = connection
         self.subscriptions[client_id] = set()
+        connection.start()
+        return True
     
-    def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
+    def disconnect(self, client_id: str, connection: Optional[ClientConnection] = None):
+        """Forget a client; with connection given, only if it is still the active one"""
+        current = self.active_connections.get(client_id)
+        if current is None or (connection is not None and current is not connection):
+            return
+        current.close()
+        del self.active_connections[client_id]
         if client_id in self.subscriptions:
-            del self.subscriptions[client_id]
+            self._remove_subscribers(client_id, self.subscriptions.pop(client_id))
+    
+    def _remove_subscribers(self, client_id: str, symbols):
+        for symbol in symbols:
+            subscribers = self.symbol_subscribers.get(symbol)
+            if subscribers is not None:
+                subscribers.discard(client_id)
+                if not subscribers:
+                    del self.symbol_subscribers[symbol]
     
     def subscribe(self, client_id: str, symbols: List[str]):
         if client_id in self.subscriptions:
             self.subscriptions[client_id].update(symbols)
+            for symbol in symbols:
+                self.symbol_subscribers.setdefault(symbol, set()).add(client_id)
     
     def unsubscribe(self, client_id: str, symbols: List[str]):
         if client_id in self.subscriptions:
             self.subscriptions[client_id].difference_update(symbols)
+            self._remove_subscribers(client_id, symbols)
     
     async def send_personal_message(self, message: dict, client_id: str):
-        if client_id in self.active_connections:
-            await self.active_connections[client_id].send_json(message)
+        connection = self.active_connections.get(client_id)
+        if connection is not None:
+            connection.enqueue(dumps(message).decode("utf-8"))
+    
+    async def fan_out(self, client_ids, message: dict, key=None):
+        """Serialize once and queue for every client; writers deliver concurrently"""
+        client_ids = list(client_ids)
+        if not client_ids:
+            return
+        text = dumps(message).decode("utf-8")
+        for client_id in client_ids:
+            connection = self.active_connections.get(client_id)
+            if connection is not None:
+                connection.enqueue(text, key)
     
     async def broadcast(self, message: dict):
-        for client_id, connection in self.active_connections.items():
-            try:
-                await connection.send_json(message)
-            except:
-                pass
+        await self.fan_out(self.active_connections.keys(), message)
+    
+    def connection_stats(self) -> Dict[str, dict]:
+        """Queue depth, drops and send latency per client id"""
+        return {client_id: connection.stats() for client_id, connection in list(self.active_connections.items())}
+    
+    def connection_totals(self, per_client: Optional[Dict[str, dict]] = None) -> dict:
+        """Queue and delivery counters summed over all clients"""
+        totals = {"queued": 0, "max_queue_depth": 0, "sent": 0, "dropped": 0,
+                  "conflated": 0, "batches": 0, "batched_ticks": 0, "max_send_latency_ms": 0.0}
+        for stats in (per_client if per_client is not None else self.connection_stats()).values():
+            totals["queued"] += stats["queue_depth"]
+            totals["max_send_latency_ms"] = max(totals["max_send_latency_ms"], stats["max_send_latency_ms"])
+            totals["max_queue_depth"] = max(totals["max_queue_depth"], stats["max_queue_depth"])
+            for key in ("sent", "dropped", "conflated", "batches", "batched_ticks"):
+                totals[key] += stats[key]
+        return totals
     
     async def send_price_update(self, symbol: str, price: float, change: float):
-        message = {
-            "type": "price_update",
-            "data": {
-                "symbol": symbol,
-                "price": price,
-                "change": change,
-                "change_pct": round((change / (price - change)) * 100, 2) if price != change else 0
-            },
-            "timestamp": datetime.utcnow().isoformat()
+        subscribers = self.symbol_subscribers.get(symbol)
+        if not subscribers:
+            return
+        
+        data = {
+            "symbol": symbol,
+            "price": price,
+            "change": change,
+            "change_pct": round((change / (price - change)) * 100, 2) if price != change else 0
         }
+        immediate = []
+        for client_id in subscribers:
+            connection = self.active_connections.get(client_id)
+            if connection is None:
+                continue
+            if connection.batch_window:
+                connection.add_tick(symbol, data)
+            else:
+                immediate.append(client_id)
         
-        for client_id, subscribed_symbols in self.subscriptions.items():
-            if symbol in subscribed_symbols:
-                await self.send_personal_message(message, client_id)
+        if immediate:
+            message = {
+                "type": "price_update",
+                "data": data,
+                "timestamp": datetime.utcnow().isoformat()
+            }
+            await self.fan_out(immediate, message, key=("price", symbol))
 
 
 manager = ConnectionManager()
+broadcaster = PriceBroadcaster(manager)
 
 
 @router.websocket("/portfolio/{client_id}")
 async def websocket_portfolio_updates(
     websocket: WebSocket, 
     client_id: str,
-    token: Optional[str] = Query(None)
+    token: Optional[str] = Query(None),
+    batch_ms: Optional[int] = Query(None)
 ):
     """WebSocket endpoint for real-time portfolio updates
     
@@ -107,6 +342,12 @@ async def websocket_portfolio_updates(
     `ws://host/api/v1/ws/portfolio/{client_id}?token=<jwt_token>`
     
     Connect and subscribe to receive live price updates for portfolio stocks.
+    Prices are pushed by a server-side broadcaster whenever they change; on
+    subscribe the last known prices are sent immediately.
+    
+    **Batching**: pass `?batch_ms=200` (up to 1000) to receive one `price_batch`
+    message per window, holding the latest tick of each symbol that changed,
+    instead of one `price_update` per tick.
     
     Message format (send):
     ```json
@@ -129,13 +370,27 @@ async def websocket_portfolio_updates(
         "timestamp": "2024-01-28T10:30:00Z"
     }
     ```
+    
+    Batched format (receive, with `batch_ms`):
+    ```json
+    {
+        "type": "price_batch",
+        "data": [
+            {"symbol": "RELIANCE", "price": 2450.50, "change": 12.30, "change_pct": 0.50},
+            {"symbol": "TCS", "price": 3890.00, "change": -4.10, "change_pct": -0.11}
+        ],
+        "timestamp": "2024-01-28T10:30:00.200Z"
+    }
+    ```
     """
     user = await verify_websocket_token(token)
     if not user:
         await websocket.close(code=4001, reason="Authentication required")
         return
     
-    await manager.connect(websocket, client_id)
+    if not await manager.connect(websocket, client_id, owner=user.get("user_id"), batch_ms=batch_ms):
+        return
+    connection = manager.active_connections[client_id]
     
     try:
         await manager.send_personal_message({
@@ -161,6 +416,14 @@ async def websocket_portfolio_updates(
                         "symbols": symbols,
                         "timestamp": datetime.utcnow().isoformat()
                     }, client_id)
+                    
+                    known_prices = broadcaster.snapshot(symbols)
+                    if known_prices:
+                        await manager.send_personal_message({
+                            "type": "prices",
+                            "data": known_prices,
+                            "timestamp": datetime.utcnow().isoformat()
+                        }, client_id)
                 
                 elif action == "unsubscribe":
                     symbols = message.get("symbols", [])
@@ -173,14 +436,7 @@ async def websocket_portfolio_updates(
                 
                 elif action == "get_prices":
                     symbols = message.get("symbols", [])
-                    from utils.data_fetcher import DataFetcher
-                    data_fetcher = DataFetcher()
-                    
-                    prices = {}
-                    for symbol in symbols:
-                        price = data_fetcher.get_current_price(symbol)
-                        if price:
-                            prices[symbol] = price
+                    prices = await broadcaster.get_prices(symbols)
                     
                     await manager.send_personal_message({
                         "type": "prices",
@@ -208,14 +464,23 @@ async def websocket_portfolio_updates(
                     "timestamp": datetime.utcnow().isoformat()
                 }, client_id)
                 
-    except WebSocketDisconnect:
-        manager.disconnect(client_id)
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the writer already closed the socket of a slow consumer
+        pass
+    finally:
+        manager.disconnect(client_id, connection)
 
 
 @router.get("/connections")
-async def get_active_connections():
-    """Get count of active WebSocket connections (admin only)"""
+async def get_active_connections(admin: dict = Depends(require_permission("admin"))):
+    """Active WebSocket connections with per-client queue, drop and latency stats (admin only)"""
+    clients = manager.connection_stats()
     return {
         "active_connections": len(manager.active_connections),
-        "total_subscriptions": sum(len(s) for s in manager.subscriptions.values())
+        "total_subscriptions": sum(len(s) for s in manager.subscriptions.values()),
+        "subscribed_symbols": len(manager.symbol_subscribers),
+        "broadcaster": broadcaster.stats(),
+        "slow_consumer_policy": WS_SLOW_CONSUMER_POLICY,
+        "totals": manager.connection_totals(clients),
+        "clients": clients
     }
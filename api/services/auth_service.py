@@ -1,23 +1,129 @@
 """Authentication service for API"""
 import os
+import time
+import atexit
 import secrets
 import hashlib
+import threading
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Dict, Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+
+from utils.db_pool import get_pool
 
 SECRET_KEY = os.environ.get("SESSION_SECRET", secrets.token_hex(32))
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
+AUTH_CACHE_TTL_SECONDS = int(os.environ.get("AUTH_CACHE_TTL_SECONDS", "60"))
+LAST_USED_FLUSH_SECONDS = int(os.environ.get("LAST_USED_FLUSH_SECONDS", "30"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
+class PrincipalCache:
+    """TTL cache of resolved API-key and JWT principals
+    
+    Entries expire after AUTH_CACHE_TTL_SECONDS; revocations in this process
+    invalidate immediately, other workers converge within one TTL.
+    """
+    
+    def __init__(self, ttl: int = AUTH_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[dict, float]] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            return dict(entry[0])
+    
+    def put(self, key: str, principal: dict):
+        with self._lock:
+            self._entries[key] = (dict(principal), time.time() + self.ttl)
+    
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def invalidate_where(self, predicate: Callable[[dict], bool]):
+        with self._lock:
+            for key in [k for k, (p, _) in self._entries.items() if predicate(p)]:
+                del self._entries[key]
+
+
+class LastUsedRecorder:
+    """Buffers api_keys.last_used updates and writes them in batches from a background thread
+    
+    Usage is stamped with the database's NOW(), like created_at, less the time
+    the touch spent in the buffer.
+    """
+    
+    def __init__(self, interval: int = LAST_USED_FLUSH_SECONDS):
+        self.interval = interval
+        self._pending: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+    
+    def touch(self, key_hash: str):
+        with self._lock:
+            self._pending[key_hash] = time.monotonic()
+        if self._thread is None:
+            self._start()
+    
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="api-key-last-used", daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+    
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        now = time.monotonic()
+        try:
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    execute_values(cur, """
+                        UPDATE api_keys AS ak SET last_used = NOW() - v.age * INTERVAL '1 second'
+                        FROM (VALUES %s) AS v(key_hash, age)
+                        WHERE ak.key_hash = v.key_hash
+                    """, [(key_hash, now - used_at) for key_hash, used_at in pending.items()],
+                        template="(%s, %s::double precision)")
+                conn.commit()
+        except Exception as e:
+            print(f"Error flushing API key usage: {e}")
+            with self._lock:
+                for key_hash, used_at in pending.items():
+                    self._pending.setdefault(key_hash, used_at)
+    
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+
+principal_cache = PrincipalCache()
+last_used_recorder = LastUsedRecorder()
+atexit.register(last_used_recorder.stop)
+
+
 def get_db_connection():
-    return psycopg2.connect(os.environ.get("DATABASE_URL"))
+    """Check out a pooled connection; close() or leaving a with block returns it"""
+    return get_pool(os.environ.get("DATABASE_URL")).getconn()
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -63,21 +169,17 @@ def decode_token(token: str) -> Optional[dict]:
 
 
 def authenticate_user(email: str, password: str) -> Optional[dict]:
-    conn = get_db_connection()
-    try:
+    with get_db_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("SELECT * FROM users WHERE email = %s", (email,))
             user = cur.fetchone()
             if user and verify_password(password, user['password_hash']):
                 return dict(user)
-    finally:
-        conn.close()
     return None
 
 
 def create_user(email: str, password: str, full_name: Optional[str] = None) -> Optional[dict]:
-    conn = get_db_connection()
-    try:
+    with get_db_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("SELECT id FROM users WHERE email = %s", (email,))
             if cur.fetchone():
@@ -92,30 +194,29 @@ def create_user(email: str, password: str, full_name: Optional[str] = None) -> O
             user = cur.fetchone()
             conn.commit()
             return dict(user) if user else None
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
 
 
 def get_user_by_email(email: str) -> Optional[dict]:
-    conn = get_db_connection()
-    try:
+    cache_key = f"user:{email}"
+    cached = principal_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    with get_db_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("SELECT id, email, full_name, created_at FROM users WHERE email = %s", (email,))
             user = cur.fetchone()
-            return dict(user) if user else None
-    finally:
-        conn.close()
+            if not user:
+                return None
+            principal_cache.put(cache_key, dict(user))
+            return dict(user)
 
 
 def create_api_key(user_id: int, name: str, permissions: list) -> str:
     api_key = f"al_{secrets.token_hex(32)}"
     api_key_hash = hashlib.sha256(api_key.encode()).hexdigest()
     
-    conn = get_db_connection()
-    try:
+    with get_db_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS api_keys (
@@ -135,60 +236,94 @@ def create_api_key(user_id: int, name: str, permissions: list) -> str:
                 (user_id, name, api_key_hash, permissions)
             )
             conn.commit()
-    finally:
-        conn.close()
     
     return api_key
 
 
 def validate_api_key(api_key: str) -> Optional[dict]:
+    """Resolve an API key to its owner, served from the principal cache when warm
+    
+    last_used is recorded asynchronously by last_used_recorder.
+    """
     api_key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+    cache_key = f"key:{api_key_hash}"
     
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT ak.*, u.email, u.full_name 
-                FROM api_keys ak 
-                JOIN users u ON ak.user_id = u.id 
-                WHERE ak.key_hash = %s AND ak.is_active = TRUE
-            """, (api_key_hash,))
-            result = cur.fetchone()
-            
-            if result:
-                cur.execute(
-                    "UPDATE api_keys SET last_used = NOW() WHERE key_hash = %s",
-                    (api_key_hash,)
-                )
-                conn.commit()
-                return dict(result)
-    finally:
-        conn.close()
-    return None
+    result = principal_cache.get(cache_key)
+    if result is None:
+        with get_db_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("""
+                    SELECT ak.*, u.email, u.full_name 
+                    FROM api_keys ak 
+                    JOIN users u ON ak.user_id = u.id 
+                    WHERE ak.key_hash = %s AND ak.is_active = TRUE
+                """, (api_key_hash,))
+                row = cur.fetchone()
+        if not row:
+            return None
+        result = dict(row)
+        principal_cache.put(cache_key, result)
+    
+    last_used_recorder.touch(api_key_hash)
+    return result
 
 
 def get_user_api_keys(user_id: int) -> list:
-    conn = get_db_connection()
-    try:
+    with get_db_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("""
                 SELECT id, name, permissions, created_at, last_used, is_active 
                 FROM api_keys WHERE user_id = %s ORDER BY created_at DESC
             """, (user_id,))
             return [dict(row) for row in cur.fetchall()]
-    finally:
-        conn.close()
 
 
 def revoke_api_key(user_id: int, key_id: int) -> bool:
-    conn = get_db_connection()
-    try:
+    with get_db_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 "UPDATE api_keys SET is_active = FALSE WHERE id = %s AND user_id = %s",
                 (key_id, user_id)
             )
             conn.commit()
-            return cur.rowcount > 0
-    finally:
-        conn.close()
+            revoked = cur.rowcount > 0
+    
+    if revoked:
+        principal_cache.invalidate_where(
+            lambda p: p.get("id") == key_id and p.get("user_id") == user_id
+        )
+    return revoked
+
+
+def get_user_tier(email: Optional[str] = None, api_key_hash: Optional[str] = None) -> Optional[str]:
+    """Return 'premium' for users with an active subscription, 'standard' for other users
+
+    Returns None when the key or email does not belong to a user (or the
+    lookup failed), so callers do not trust unverified credentials.
+    """
+    if not email and not api_key_hash:
+        return None
+    
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                subscription_check = """
+                    EXISTS (
+                        SELECT 1 FROM subscriptions s
+                        WHERE s.user_id = u.id AND s.status = 'active' AND s.end_date > NOW()
+                    )
+                """
+                if api_key_hash:
+                    cur.execute(f"""
+                        SELECT {subscription_check} FROM api_keys ak
+                        JOIN users u ON ak.user_id = u.id
+                        WHERE ak.key_hash = %s AND ak.is_active = TRUE
+                    """, (api_key_hash,))
+                else:
+                    cur.execute(f"SELECT {subscription_check} FROM users u WHERE u.email = %s", (email,))
+                row = cur.fetchone()
+                if row is None:
+                    return None
+                return "premium" if row[0] else "standard"
+    except Exception:
+        return None
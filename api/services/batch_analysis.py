@@ -0,0 +1,257 @@
+"""Batch-of-portfolios analysis for broker back offices
+
+Market data and corporate-action adjustments are fetched once for the union of
+symbols across every submitted portfolio, then each portfolio is evaluated in a
+process pool against that shared snapshot so no worker touches the network.
+Each portfolio only sees history from its own buy dates, so its metrics do not
+depend on which other portfolios share the batch. At most
+BATCH_MAX_IN_FLIGHT portfolios are queued on the pool at a time.
+"""
+import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional
+
+import pandas as pd
+
+from api.responses import dumps
+
+BATCH_ANALYSIS_WORKERS = int(os.environ.get("BATCH_ANALYSIS_WORKERS", str(os.cpu_count() or 2)))
+BATCH_FETCH_THREADS = int(os.environ.get("BATCH_FETCH_THREADS", "8"))
+BATCH_MAX_IN_FLIGHT = int(os.environ.get("BATCH_MAX_IN_FLIGHT", str(BATCH_ANALYSIS_WORKERS * 2)))
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_worker_instances = None
+
+
+class SnapshotDataFetcher:
+    """Read-only stand-in for DataFetcher backed by prefetched per-symbol data
+
+    Implements the lookups PortfolioAnalyzer.analyze_portfolio performs, so the
+    analyzer can run inside a worker process without any network access.
+    """
+
+    def __init__(self, reference: Dict[str, dict]):
+        self.reference = reference
+
+    def _info(self, stock_name: str) -> dict:
+        return self.reference.get(stock_name, {})
+
+    def get_stock_category(self, stock_name):
+        return self._info(stock_name).get("category", "Mid Cap")
+
+    def get_stock_sector(self, stock_name):
+        return self._info(stock_name).get("sector", "Others")
+
+    def get_market_cap(self, stock_name):
+        return self._info(stock_name).get("market_cap", 0)
+
+    def get_dividend_rate(self, stock_name):
+        return self._info(stock_name).get("dividend_rate", 0.0)
+
+    def get_dividend_yield(self, stock_name, buy_price=None):
+        info = self._info(stock_name)
+        dividend_rate = info.get("dividend_rate", 0.0)
+        base_price = buy_price if buy_price and buy_price > 0 else info.get("current_price")
+        if dividend_rate and base_price:
+            return round((dividend_rate / base_price) * 100, 2)
+        return 0.0
+
+
+class SnapshotCorporateActions:
+    """Read-only stand-in for CorporateActionsManager backed by prefetched adjustments"""
+
+    def __init__(self, adjustments: Dict[tuple, dict]):
+        self.adjustments = adjustments
+
+    def get_adjustment_details(self, symbol, buy_date):
+        details = self.adjustments.get((symbol, _as_date(buy_date)))
+        if details is None:
+            return {"symbol": symbol, "buy_date": buy_date, "actions_applied": [], "total_adjustment_factor": 1.0}
+        return details
+
+
+def _as_date(value):
+    return pd.Timestamp(value).date()
+
+
+def _since(frame: Optional[pd.DataFrame], start) -> Optional[pd.DataFrame]:
+    """Rows of a history frame on or after start"""
+    if frame is None or frame.empty:
+        return frame
+    start = pd.Timestamp(start)
+    if getattr(frame.index, "tz", None) is not None:
+        start = start.tz_localize(frame.index.tz)
+    return frame[frame.index >= start]
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Lazily create the shared process pool used for batch evaluation"""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=BATCH_ANALYSIS_WORKERS)
+    return _process_pool
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+def _fetch_symbol(data_fetcher, stock_name: str, start_date: str) -> dict:
+    current_price, historical_data = data_fetcher.get_stock_data(stock_name, start_date)
+    return {
+        "current_price": current_price,
+        "history": historical_data,
+        "category": data_fetcher.get_stock_category(stock_name),
+        "sector": data_fetcher.get_stock_sector(stock_name),
+        "market_cap": data_fetcher.get_market_cap(stock_name),
+        "dividend_rate": data_fetcher.get_dividend_rate(stock_name),
+    }
+
+
+def _fetch_adjustments(holdings: set) -> Dict[tuple, dict]:
+    from utils.corporate_actions import CorporateActionsManager
+
+    manager = CorporateActionsManager()
+    adjustments = {}
+    for stock_name, buy_date in holdings:
+        try:
+            adjustments[(stock_name, buy_date)] = manager.get_adjustment_details(stock_name, buy_date)
+        except Exception as e:
+            print(f"Batch corporate actions lookup failed for {stock_name}: {e}")
+    return adjustments
+
+
+def fetch_market_snapshot(portfolios: List[dict], include_benchmark: bool = True) -> dict:
+    """Fetch price, history, reference data and adjustments once for every symbol in the batch"""
+    from utils.data_fetcher import DataFetcher
+
+    earliest_buy_date: Dict[str, str] = {}
+    holdings = set()
+    for portfolio in portfolios:
+        for holding in portfolio["holdings"]:
+            stock_name = holding["stock_name"]
+            buy_date = str(holding["buy_date"])
+            holdings.add((stock_name, _as_date(holding["buy_date"])))
+            if stock_name not in earliest_buy_date or buy_date < earliest_buy_date[stock_name]:
+                earliest_buy_date[stock_name] = buy_date
+
+    data_fetcher = DataFetcher()
+    symbols: Dict[str, dict] = {}
+    with ThreadPoolExecutor(max_workers=BATCH_FETCH_THREADS) as executor:
+        futures = {
+            stock_name: executor.submit(_fetch_symbol, data_fetcher, stock_name, start_date)
+            for stock_name, start_date in earliest_buy_date.items()
+        }
+        for stock_name, future in futures.items():
+            try:
+                symbols[stock_name] = future.result()
+            except Exception as e:
+                print(f"Batch fetch failed for {stock_name}: {e}")
+
+    benchmark_data = None
+    if include_benchmark and earliest_buy_date:
+        benchmark_data = data_fetcher.get_index_data("NIFTY50", min(earliest_buy_date.values()))
+
+    return {"symbols": symbols, "benchmark": benchmark_data, "adjustments": _fetch_adjustments(holdings)}
+
+
+def portfolio_inputs(portfolio: dict, snapshot: dict) -> tuple:
+    """This portfolio's slice of the snapshot: symbols, benchmark and adjustments
+
+    Each symbol's history starts at the portfolio's earliest buy date for it
+    and the benchmark at the portfolio's earliest buy date overall, as a
+    standalone analysis of the same holdings would fetch them.
+    """
+    buy_dates: Dict[str, object] = {}
+    adjustments = {}
+    for holding in portfolio["holdings"]:
+        stock_name = holding["stock_name"]
+        buy_date = _as_date(holding["buy_date"])
+        if stock_name not in buy_dates or buy_date < buy_dates[stock_name]:
+            buy_dates[stock_name] = buy_date
+        key = (stock_name, buy_date)
+        if key in snapshot["adjustments"]:
+            adjustments[key] = snapshot["adjustments"][key]
+
+    symbols = {}
+    for stock_name, buy_date in buy_dates.items():
+        info = snapshot["symbols"].get(stock_name)
+        if info is not None:
+            symbols[stock_name] = dict(info, history=_since(info.get("history"), buy_date))
+    benchmark = _since(snapshot["benchmark"], min(buy_dates.values())) if buy_dates else None
+    return symbols, benchmark, adjustments
+
+
+def evaluate_portfolio(portfolio_id: str, holdings: List[dict], symbols: Dict[str, dict],
+                       benchmark_data: Optional[pd.DataFrame], adjustments: Dict[tuple, dict]) -> dict:
+    """Analyze one portfolio against a prefetched market snapshot (runs in a worker process)"""
+    global _worker_instances
+    from api.routers.portfolio import convert_holdings_to_dataframe
+
+    if _worker_instances is None:
+        from utils.portfolio_analyzer import PortfolioAnalyzer
+        from utils.advanced_metrics import AdvancedMetricsCalculator
+        _worker_instances = (PortfolioAnalyzer(), AdvancedMetricsCalculator())
+    analyzer, calculator = _worker_instances
+    analyzer.data_fetcher = SnapshotDataFetcher(symbols)
+    analyzer.corporate_actions = SnapshotCorporateActions(adjustments)
+
+    portfolio_df = convert_holdings_to_dataframe(holdings)
+    current_data = {
+        name: info["current_price"] for name, info in symbols.items()
+        if info.get("current_price") is not None
+    }
+    historical_data = {
+        name: info["history"] for name, info in symbols.items()
+        if info.get("history") is not None
+    }
+
+    analysis_results = analyzer.analyze_portfolio(portfolio_df, current_data, historical_data)
+    analyzed_df = pd.DataFrame(analysis_results["stock_performance"])
+    metrics = calculator.calculate_all_metrics(analyzed_df, historical_data, benchmark_data)
+
+    return {
+        "portfolio_id": portfolio_id,
+        "status": "ok",
+        "summary": analysis_results["portfolio_summary"],
+        "metrics": metrics
+    }
+
+
+async def stream_batch_analysis(portfolios: List[dict], include_benchmark: bool = True) -> AsyncIterator[bytes]:
+    """Yield one NDJSON line per portfolio as its evaluation completes"""
+    loop = asyncio.get_running_loop()
+    snapshot = await loop.run_in_executor(None, fetch_market_snapshot, portfolios, include_benchmark)
+    pool = get_process_pool()
+
+    async def run(portfolio: dict) -> dict:
+        portfolio_id = portfolio["portfolio_id"]
+        try:
+            symbols, benchmark, adjustments = portfolio_inputs(portfolio, snapshot)
+            return await loop.run_in_executor(
+                pool, evaluate_portfolio, portfolio_id, portfolio["holdings"],
+                symbols, benchmark, adjustments
+            )
+        except Exception as e:
+            return {"portfolio_id": portfolio_id, "status": "error", "error": str(e)}
+
+    # A bounded window keeps the pickled inputs of only a few portfolios alive at once
+    pending = set()
+    try:
+        for portfolio in portfolios:
+            if len(pending) >= BATCH_MAX_IN_FLIGHT:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield dumps(task.result()) + b"\n"
+            pending.add(asyncio.ensure_future(run(portfolio)))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield dumps(task.result()) + b"\n"
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,149 @@
+"""Background task that pushes price changes to websocket subscribers
+
+Each cycle fetches the union of subscribed symbols once from a shared
+PriceSource and publishes only symbols whose price moved since the last
+published value, so any number of clients watching a symbol cost one fetch.
+
+With several workers, only the pub/sub leader polls. Every worker announces
+its subscribed symbols on the "price_interest" channel; the leader polls the
+union and publishes each batch of changes once on "prices", which every
+worker (the leader included) fans out to its own websocket clients.
+"""
+import os
+import socket
+import time
+import asyncio
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from utils.price_source import PriceSource
+from utils.intraday_bars import intraday_bars
+from api.services.pubsub import PubSubBus, create_bus
+
+PRICE_BROADCAST_INTERVAL_SECONDS = float(os.environ.get("PRICE_BROADCAST_INTERVAL_SECONDS", "5"))
+PRICE_INTEREST_TTL_INTERVALS = 3
+
+
+class PriceBroadcaster:
+    def __init__(self, manager, source: Optional[PriceSource] = None,
+                 interval: float = PRICE_BROADCAST_INTERVAL_SECONDS,
+                 bus: Optional[PubSubBus] = None):
+        self.manager = manager
+        self.source = source or PriceSource()
+        self.interval = interval
+        self.bus = bus or create_bus()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.last_published: Dict[str, float] = {}
+        self.remote_interest: Dict[str, Tuple[Set[str], float]] = {}
+        self.polls = 0
+        self.updates_published = 0
+        self.updates_delivered = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            await self.bus.start(self._on_message)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self.bus.stop()
+
+    async def _run(self):
+        while True:
+            try:
+                if self.bus.is_leader:
+                    await self.poll_once()
+                else:
+                    await self.announce_interest()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Price broadcast failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _on_message(self, channel: str, payload: dict):
+        if channel == "prices":
+            updates = []
+            for symbol, price, change in payload.get("ticks", []):
+                self.last_published[symbol] = price
+                intraday_bars.on_tick(symbol, price)
+                if symbol in self.manager.symbol_subscribers:
+                    updates.append(self.manager.send_price_update(symbol, price, change))
+            if updates:
+                await asyncio.gather(*updates)
+                self.updates_delivered += len(updates)
+        elif channel == "price_interest" and payload.get("worker") != self.worker_id:
+            self.remote_interest[payload["worker"]] = (set(payload.get("symbols", [])), time.monotonic())
+
+    async def announce_interest(self):
+        await self.bus.publish("price_interest", {
+            "worker": self.worker_id,
+            "symbols": list(self.manager.symbol_subscribers)
+        })
+
+    def interested_symbols(self) -> Set[str]:
+        """Symbols subscribed in this worker plus those recently announced by other workers"""
+        cutoff = time.monotonic() - self.interval * PRICE_INTEREST_TTL_INTERVALS
+        for worker in [w for w, (_, seen) in self.remote_interest.items() if seen < cutoff]:
+            del self.remote_interest[worker]
+        symbols = set(self.manager.symbol_subscribers)
+        for worker_symbols, _ in self.remote_interest.values():
+            symbols |= worker_symbols
+        return symbols
+
+    async def fetch(self, symbols: Iterable[str]) -> Dict[str, float]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.source.fetch, list(symbols))
+
+    async def poll_once(self):
+        symbols = self.interested_symbols()
+        for symbol in set(self.last_published) - symbols:
+            del self.last_published[symbol]
+        if not symbols:
+            return
+
+        prices = await self.fetch(symbols)
+        self.polls += 1
+
+        ticks = []
+        for symbol, price in prices.items():
+            last = self.last_published.get(symbol)
+            if last is not None and price == last:
+                continue
+            change = round(price - last, 4) if last is not None else 0.0
+            ticks.append((symbol, price, change))
+        if ticks:
+            await self.bus.publish("prices", {"ticks": ticks})
+            self.updates_published += len(ticks)
+
+    def snapshot(self, symbols: Iterable[str]) -> Dict[str, float]:
+        """Last published prices for the given symbols (symbols never published are omitted)"""
+        return {symbol: self.last_published[symbol] for symbol in symbols if symbol in self.last_published}
+
+    async def get_prices(self, symbols: Iterable[str]) -> Dict[str, float]:
+        """Prices for an on-demand request: published values first, one batched fetch for the rest"""
+        symbols = list(symbols)
+        prices = self.snapshot(symbols)
+        missing = [symbol for symbol in symbols if symbol not in prices]
+        if missing:
+            prices.update(await self.fetch(missing))
+        return prices
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval_seconds": self.interval,
+            "worker": self.worker_id,
+            "tracked_symbols": len(self.last_published),
+            "remote_workers": len(self.remote_interest),
+            "polls": self.polls,
+            "updates_published": self.updates_published,
+            "updates_delivered": self.updates_delivered,
+            "pubsub": self.bus.stats()
+        }
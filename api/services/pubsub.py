@@ -0,0 +1,247 @@
+"""Pub/sub bus for fanning messages out across API workers
+
+Backends:
+- "memory": in-process only (single worker, the default)
+- "unix": workers on one host share a Unix domain socket. The worker holding
+  an flock on the lock file runs the hub and relays every message to the
+  other workers; if it exits, the lock is released and another worker takes
+  over while the rest reconnect.
+
+Additional backends (e.g. Redis for multi-host deployments) plug in through
+register_backend().
+"""
+import os
+import json
+import fcntl
+import asyncio
+import tempfile
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from api.responses import dumps
+
+PUBSUB_BACKEND = os.environ.get("PUBSUB_BACKEND", "memory")
+PUBSUB_SOCKET_PATH = os.environ.get(
+    "PUBSUB_SOCKET_PATH", os.path.join(tempfile.gettempdir(), "alphalens_pubsub.sock")
+)
+PUBSUB_RECONNECT_SECONDS = 0.5
+PUBSUB_MAX_PEER_BUFFER_BYTES = 4 * 1024 * 1024
+# Longest message line accepted from the socket; a full batch of ticks easily exceeds asyncio's 64 KiB default
+PUBSUB_MAX_LINE_BYTES = int(os.environ.get("PUBSUB_MAX_LINE_BYTES", str(4 * 1024 * 1024)))
+
+Handler = Callable[[str, dict], Awaitable[None]]
+
+
+class PubSubBus:
+    """Publish a payload on a channel; every subscriber in every worker receives it once"""
+
+    name = "base"
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+
+    @property
+    def is_leader(self) -> bool:
+        """Whether this worker should run singleton producers (e.g. price polling)"""
+        return True
+
+    async def start(self, handler: Handler):
+        self._handler = handler
+
+    async def publish(self, channel: str, payload: dict):
+        raise NotImplementedError
+
+    async def stop(self):
+        pass
+
+    async def _deliver(self, channel: str, payload: dict):
+        if self._handler is None:
+            return
+        try:
+            await self._handler(channel, payload)
+        except Exception as e:
+            print(f"Pub/sub handler failed on {channel}: {e}")
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "leader": self.is_leader}
+
+
+class InProcessBus(PubSubBus):
+    name = "memory"
+
+    async def publish(self, channel: str, payload: dict):
+        await self._deliver(channel, payload)
+
+
+class UnixSocketBus(PubSubBus):
+    name = "unix"
+
+    def __init__(self, path: str = PUBSUB_SOCKET_PATH):
+        super().__init__()
+        self.path = path
+        self.lock_path = path + ".lock"
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Set[asyncio.StreamWriter] = set()
+        self._hub_writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = asyncio.Event()
+        self.published = 0
+        self.received = 0
+        self.dropped_peers = 0
+
+    @property
+    def is_leader(self) -> bool:
+        return self._server is not None
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        self._task = asyncio.create_task(self._run())
+
+    def _try_lock(self) -> Optional[int]:
+        fd = os.open(self.lock_path, os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            os.close(fd)
+            return None
+
+    async def _run(self):
+        while not self._stopped.is_set():
+            try:
+                if await self._run_once():
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Never let one unexpected error end the bus for this worker
+                print(f"Pub/sub connection failed: {e}")
+            await asyncio.sleep(PUBSUB_RECONNECT_SECONDS)
+
+    async def _run_once(self) -> bool:
+        """Become the hub or follow it until the connection drops; True once the hub has stopped"""
+        fd = self._try_lock()
+        if fd is not None:
+            self._lock_fd = fd
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self._server = await asyncio.start_unix_server(
+                self._serve_peer, path=self.path, limit=PUBSUB_MAX_LINE_BYTES
+            )
+            await self._stopped.wait()
+            return True
+
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.path, limit=PUBSUB_MAX_LINE_BYTES)
+        except OSError:
+            return False
+
+        self._hub_writer = writer
+        try:
+            await self._read_loop(reader)
+        finally:
+            self._hub_writer = None
+            writer.close()
+        return False
+
+    async def _read_loop(self, reader: asyncio.StreamReader, origin: Optional[asyncio.StreamWriter] = None):
+        while True:
+            try:
+                line = await reader.readline()
+            except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+                # An oversized line leaves the stream unusable; drop the connection and reconnect
+                if not isinstance(e, (ConnectionError, asyncio.IncompleteReadError)):
+                    print(f"Pub/sub message exceeded {PUBSUB_MAX_LINE_BYTES} bytes: {e}")
+                return
+            if not line:
+                return
+            self.received += 1
+            if origin is not None:
+                self._relay(line, exclude=origin)
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            await self._deliver(message.get("channel", ""), message.get("payload", {}))
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._peers.add(writer)
+        try:
+            await self._read_loop(reader, origin=writer)
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    def _relay(self, line: bytes, exclude: Optional[asyncio.StreamWriter] = None):
+        for peer in list(self._peers):
+            if peer is exclude:
+                continue
+            if peer.transport.get_write_buffer_size() > PUBSUB_MAX_PEER_BUFFER_BYTES:
+                # A worker that stopped reading must not grow the hub's memory without bound
+                self.dropped_peers += 1
+                self._peers.discard(peer)
+                peer.close()
+                continue
+            peer.write(line)
+
+    async def publish(self, channel: str, payload: dict):
+        line = dumps({"channel": channel, "payload": payload}) + b"\n"
+        self.published += 1
+        if len(line) > PUBSUB_MAX_LINE_BYTES:
+            print(f"Pub/sub message on {channel} is {len(line)} bytes; delivering to this worker only")
+            await self._deliver(channel, payload)
+            return
+        if self.is_leader:
+            self._relay(line)
+        elif self._hub_writer is not None:
+            try:
+                self._hub_writer.write(line)
+                await self._hub_writer.drain()
+            except ConnectionError:
+                pass
+        await self._deliver(channel, payload)
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+        for peer in list(self._peers):
+            peer.close()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        if self._hub_writer is not None:
+            self._hub_writer.close()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update({
+            "peers": len(self._peers),
+            "connected": self.is_leader or self._hub_writer is not None,
+            "published": self.published,
+            "received": self.received,
+            "dropped_peers": self.dropped_peers
+        })
+        return stats
+
+
+BACKENDS: Dict[str, Callable[[], PubSubBus]] = {
+    "memory": InProcessBus,
+    "unix": UnixSocketBus,
+}
+
+
+def register_backend(name: str, factory: Callable[[], PubSubBus]):
+    """Register an additional bus backend, selectable with PUBSUB_BACKEND=<name>"""
+    BACKENDS[name] = factory
+
+
+def create_bus(name: str = PUBSUB_BACKEND) -> PubSubBus:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown PUBSUB_BACKEND '{name}' (available: {', '.join(sorted(BACKENDS))})")
+    return BACKENDS[name]()
@@ -0,0 +1,248 @@
+"""Sliding-window rate limiting for the API tier
+
+Requests are weighted by endpoint cost and counted per principal (API key or
+JWT subject, falling back to client IP) over a rolling window. Credentials
+only get their own bucket once they resolve to a real user; until then, and
+for unknown keys, the request is counted against the client IP. The default
+SQLite backend lives in a local file so every uvicorn worker on the host
+enforces the same budget; an in-memory backend is available for single-process
+deployments.
+"""
+import os
+import math
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict, defaultdict, deque
+from typing import Dict, Optional, Tuple
+
+RATE_LIMIT_WINDOW_SECONDS = int(os.environ.get("RATE_LIMIT_WINDOW_SECONDS", "60"))
+RATE_LIMIT_STANDARD = int(os.environ.get("RATE_LIMIT_STANDARD", "100"))
+RATE_LIMIT_PREMIUM = int(os.environ.get("RATE_LIMIT_PREMIUM", "1000"))
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "sqlite")
+RATE_LIMIT_DB_PATH = os.environ.get(
+    "RATE_LIMIT_DB_PATH", os.path.join(tempfile.gettempdir(), "alphalens_rate_limit.sqlite3")
+)
+TIER_CACHE_SECONDS = 300
+UNRESOLVED_CACHE_SECONDS = 30
+TIER_CACHE_MAX_ENTRIES = int(os.environ.get("RATE_LIMIT_TIER_CACHE_SIZE", "10000"))
+MEMORY_SWEEP_HITS = 1000
+
+# Cached tier for credentials that do not belong to any user
+UNRESOLVED_PRINCIPAL = "unresolved"
+
+TIER_LIMITS = {
+    "standard": RATE_LIMIT_STANDARD,
+    "premium": RATE_LIMIT_PREMIUM,
+}
+
+# Longest matching prefix wins; anything unlisted costs 1.
+ENDPOINT_COSTS = {
+    "/api/v1/portfolio/batch-analyze": 50,
+    "/api/v1/portfolio/analyze": 10,
+    "/api/v1/portfolio/quick-analyze": 3,
+    "/api/v1/metrics/full": 10,
+    "/api/v1/metrics/intraday/": 1,
+    "/api/v1/metrics/": 5,
+    "/api/v1/recommendations/": 10,
+    "/api/v1/rebalancing/": 5,
+    "/api/v1/stocks/": 1,
+}
+
+EXEMPT_PATHS = {"/", "/docs", "/redoc", "/openapi.json", "/api/v1/health"}
+
+
+def endpoint_cost(path: str) -> int:
+    best_prefix = ""
+    for prefix in ENDPOINT_COSTS:
+        if path.startswith(prefix) and len(prefix) > len(best_prefix):
+            best_prefix = prefix
+    return ENDPOINT_COSTS[best_prefix] if best_prefix else 1
+
+
+class RateLimitResult:
+    def __init__(self, allowed: bool, limit: int, remaining: int, reset_after: float):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset_after = reset_after
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(max(0, self.remaining)),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.reset_after)))
+        return headers
+
+
+class MemoryBackend:
+    """Per-process sliding window; limits are not shared across workers"""
+
+    def __init__(self):
+        self._events: Dict[str, deque] = defaultdict(deque)
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def _sweep(self, cutoff: float):
+        """Forget identities with no events left in the window"""
+        for identity in [i for i, events in self._events.items() if not events or events[-1][0] <= cutoff]:
+            del self._events[identity]
+
+    def hit(self, identity: str, cost: int, limit: int, window: int) -> RateLimitResult:
+        now = time.time()
+        with self._lock:
+            self._hits += 1
+            if self._hits % MEMORY_SWEEP_HITS == 0:
+                self._sweep(now - window)
+            events = self._events[identity]
+            while events and events[0][0] <= now - window:
+                events.popleft()
+            used = sum(c for _, c in events)
+            if used + cost > limit:
+                return RateLimitResult(False, limit, limit - used,
+                                       _retry_after(list(events), used, cost, limit, window, now))
+            events.append((now, cost))
+            reset_after = events[0][0] + window - now
+            return RateLimitResult(True, limit, limit - used - cost, reset_after)
+
+
+class SQLiteBackend:
+    """Sliding window stored in a local SQLite file shared by all workers on the host"""
+
+    def __init__(self, path: str = RATE_LIMIT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limit_events (
+                identity TEXT NOT NULL,
+                ts REAL NOT NULL,
+                cost INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_rate_limit_identity_ts ON rate_limit_events (identity, ts)"
+        )
+        self._hits = 0
+
+    def hit(self, identity: str, cost: int, limit: int, window: int) -> RateLimitResult:
+        now = time.time()
+        with self._lock:
+            cur = self._conn.cursor()
+            try:
+                cur.execute("BEGIN IMMEDIATE")
+                self._hits += 1
+                if self._hits % 1000 == 0:
+                    cur.execute("DELETE FROM rate_limit_events WHERE ts <= ?", (now - window,))
+                else:
+                    cur.execute(
+                        "DELETE FROM rate_limit_events WHERE identity = ? AND ts <= ?",
+                        (identity, now - window)
+                    )
+                cur.execute(
+                    "SELECT ts, cost FROM rate_limit_events WHERE identity = ? ORDER BY ts",
+                    (identity,)
+                )
+                events = cur.fetchall()
+                used = sum(c for _, c in events)
+                if used + cost > limit:
+                    cur.execute("COMMIT")
+                    return RateLimitResult(False, limit, limit - used,
+                                           _retry_after(events, used, cost, limit, window, now))
+                cur.execute(
+                    "INSERT INTO rate_limit_events (identity, ts, cost) VALUES (?, ?, ?)",
+                    (identity, now, cost)
+                )
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            finally:
+                cur.close()
+        oldest = events[0][0] if events else now
+        return RateLimitResult(True, limit, limit - used - cost, oldest + window - now)
+
+
+def _retry_after(events, used: int, cost: int, limit: int, window: int, now: float) -> float:
+    """Seconds until enough weight leaves the window for a request of this cost"""
+    if cost > limit:
+        return float(window)
+    freed = 0
+    for ts, event_cost in events:
+        freed += event_cost
+        if used - freed + cost <= limit:
+            return max(0.0, ts + window - now)
+    return float(window)
+
+
+class RateLimiter:
+    def __init__(self, backend=None, window: int = RATE_LIMIT_WINDOW_SECONDS):
+        self.window = window
+        if backend is None:
+            backend = SQLiteBackend() if RATE_LIMIT_BACKEND == "sqlite" else MemoryBackend()
+        self.backend = backend
+        self._tier_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._tier_lock = threading.Lock()
+
+    def cached_tier(self, identity: str) -> Optional[str]:
+        """Cached tier (or UNRESOLVED_PRINCIPAL) for an identity; None if it must be looked up"""
+        with self._tier_lock:
+            entry = self._tier_cache.get(identity)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._tier_cache[identity]
+                return None
+            self._tier_cache.move_to_end(identity)
+            return entry[0]
+
+    def remember_tier(self, identity: str, tier: Optional[str]):
+        if tier is None:
+            tier, ttl = UNRESOLVED_PRINCIPAL, UNRESOLVED_CACHE_SECONDS
+        else:
+            ttl = TIER_CACHE_SECONDS
+        with self._tier_lock:
+            self._tier_cache[identity] = (tier, time.time() + ttl)
+            self._tier_cache.move_to_end(identity)
+            while len(self._tier_cache) > TIER_CACHE_MAX_ENTRIES:
+                self._tier_cache.popitem(last=False)
+
+    def check(self, identity: str, tier: str, path: str) -> RateLimitResult:
+        limit = TIER_LIMITS.get(tier, RATE_LIMIT_STANDARD)
+        return self.backend.hit(identity, endpoint_cost(path), limit, self.window)
+
+
+def client_identity(client_host: Optional[str]) -> str:
+    return f"ip:{client_host or 'unknown'}"
+
+
+def request_identity(headers, client_host: Optional[str]) -> Tuple[str, Optional[dict]]:
+    """Derive the rate-limit key from the API key or JWT subject, falling back to client IP
+
+    Returns the identity and the lookup needed to resolve its tier; the
+    identity is only trusted once that lookup finds a user.
+    """
+    from api.services.auth_service import decode_token
+
+    api_key = headers.get("x-api-key")
+    if api_key:
+        key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+        return f"key:{key_hash[:32]}", {"api_key_hash": key_hash}
+
+    authorization = headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        payload = decode_token(authorization[7:].strip())
+        if payload and payload.get("sub"):
+            return f"user:{payload['sub']}", {"email": payload["sub"]}
+
+    return client_identity(client_host), None
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,142 @@
+"""Response caching with strong ETags for analysis endpoints"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+from fastapi import Request, Response
+
+from api.responses import dumps, wants_columnar
+from utils import market_calendar
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+PRICE_SNAPSHOT_SECONDS = int(os.environ.get("PRICE_SNAPSHOT_SECONDS", "60"))
+
+
+class ResponseCache:
+    """Bounded LRU of serialized response bodies keyed by ETag"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, etag: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(etag)
+            if body is not None:
+                self._entries.move_to_end(etag)
+            return body
+
+    def put(self, etag: str, body: bytes):
+        with self._lock:
+            self._entries[etag] = body
+            self._entries.move_to_end(etag)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hit_ratio, 4)
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+def price_snapshot_version() -> int:
+    """Version of the price snapshot that analysis results are computed against
+
+    Prices are treated as unchanged within a PRICE_SNAPSHOT_SECONDS window while
+    the market trades, and for the whole closed period otherwise, so identical
+    holdings polled inside one window share an ETag.
+    """
+    return market_calendar.snapshot_version(PRICE_SNAPSHOT_SECONDS)
+
+
+def holdings_hash(holdings: List[Any]) -> str:
+    """Stable hash of a holdings list (order-preserving, as results echo input order)"""
+    canonical = [h.dict() if hasattr(h, "dict") else dict(h) for h in holdings]
+    payload = json.dumps(canonical, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def analysis_etag(request: Request, holdings: List[Any]) -> str:
+    """Strong ETag for an analysis request: endpoint + query + holdings + price snapshot"""
+    key = json.dumps({
+        "path": request.url.path,
+        "query": sorted(request.query_params.multi_items()),
+        "holdings": holdings_hash(holdings),
+        "snapshot": price_snapshot_version(),
+        "columnar": wants_columnar(request)
+    }, sort_keys=True)
+    return '"' + hashlib.sha256(key.encode()).hexdigest() + '"'
+
+
+def _if_none_match(request: Request, etag: str) -> bool:
+    """Whether the client listed this exact ETag; "*" is not a match for a GET"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return etag in [tag.strip() for tag in header.split(",")]
+
+
+def _headers(etag: str) -> dict:
+    # The body shape depends on Accept (columnar opt-in)
+    return {"ETag": etag, "Vary": "Accept"}
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=_headers(etag))
+
+
+def cached_response(request: Request, etag: str) -> Optional[Response]:
+    """Return a 304 or cached 200 response for this ETag, or None on a cache miss
+
+    A 304 is only sent for a representation this server still holds, so a
+    client can never validate a body the server did not produce.
+    """
+    body = response_cache.get(etag)
+    if body is None:
+        response_cache.record(hit=False)
+        request.state.cache_status = "MISS"
+        return None
+
+    response_cache.record(hit=True)
+    request.state.cache_status = "HIT"
+    if _if_none_match(request, etag):
+        return _not_modified(etag)
+    return Response(content=body, media_type="application/json", headers=_headers(etag))
+
+
+def store_response(request: Request, etag: str, content: Any) -> Response:
+    """Serialize content, remember it under the ETag and return the response"""
+    body = dumps(content, columnar=wants_columnar(request))
+    response_cache.put(etag, body)
+    if _if_none_match(request, etag):
+        return _not_modified(etag)
+    return Response(content=body, media_type="application/json", headers=_headers(etag))
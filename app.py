@@ -7,8 +7,15 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from PIL import Image
 import os
+import uuid
 
 from utils.data_fetcher import DataFetcher
+from utils.price_source import PriceSource
+from utils.live_prices import get_live_price_service
+from utils.live_feed import live_feed, LiveValuation, LIVE_FEED_INTERVAL_SECONDS
+from utils.analysis_graph import AnalysisGraph
+from utils.quote_cache import prefetch_scheduler
+from utils.reference_data import REFERENCE_DATA_TTL_SECONDS
 from utils.portfolio_analyzer import PortfolioAnalyzer
 from utils.recommendation_engine import RecommendationEngine
 from utils.advanced_metrics import AdvancedMetricsCalculator
@@ -30,6 +37,20 @@ from components.homepage import (
 from components.portfolio_summary import render_portfolio_summary
 from components.quantamental_analysis import render_quantamental_tab
 
+SHARED_SERVICES = {
+    'data_fetcher': DataFetcher,
+    'portfolio_analyzer': PortfolioAnalyzer,
+    'recommendation_engine': RecommendationEngine,
+    'benchmark_comparison': BenchmarkComparison,
+    'pdf_generator': PDFReportGenerator,
+    'price_source': PriceSource,
+}
+
+@st.cache_resource(ttl=REFERENCE_DATA_TTL_SECONDS, show_spinner=False)
+def get_service(name):
+    """Process-wide instance of a stateless service, rebuilt when reference data may have changed"""
+    return SHARED_SERVICES[name]()
+
 def init_database():
     if os.environ.get('DATABASE_URL'):
         try:
@@ -160,6 +181,7 @@ def main():
     
     if 'db_initialized' not in st.session_state:
         st.session_state.db_initialized = init_database()
+    prefetch_scheduler.start()
     
     st.markdown("""
     <style>
@@ -733,6 +755,41 @@ def display_subscription_page():
         </div>
         """, unsafe_allow_html=True)
 
+ADMIN_PAGE_SIZE = 50
+ADMIN_CURRENCY_COLUMNS = ['total_investment', 'current_value', 'total_gain_loss']
+
+def render_admin_page(key, fetch_page, columns, empty_message):
+    """Render one keyset-paginated admin table with Previous/Next controls"""
+    cursors = st.session_state.setdefault(f'{key}_cursors', [None])
+    rows, next_cursor = fetch_page(limit=ADMIN_PAGE_SIZE, before=cursors[-1])
+    if not rows and len(cursors) == 1:
+        st.info(empty_message)
+        return
+    
+    df = pd.DataFrame(rows, columns=columns)
+    column_config = {}
+    for column in ('created_at', 'last_login'):
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column])
+            column_config[column] = st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm")
+    for column in ADMIN_CURRENCY_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+            column_config[column] = st.column_config.NumberColumn(format="₹%.2f")
+    st.dataframe(df, use_container_width=True, hide_index=True, column_config=column_config)
+    
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("← Previous", key=f"{key}_prev", disabled=len(cursors) == 1, use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with col_page:
+        st.caption(f"Page {len(cursors)}")
+    with col_next:
+        if st.button("Next →", key=f"{key}_next", disabled=next_cursor is None, use_container_width=True):
+            cursors.append(next_cursor)
+            st.rerun()
+
 def display_admin_panel():
     render_auth_header()
     
@@ -767,37 +824,27 @@ def display_admin_panel():
         
         with tab1:
             st.subheader("Registered Users")
-            users = db.get_all_users()
-            if users:
-                users_df = pd.DataFrame(users)
-                users_df['created_at'] = pd.to_datetime(users_df['created_at']).dt.strftime('%Y-%m-%d %H:%M')
-                users_df['last_login'] = pd.to_datetime(users_df['last_login']).dt.strftime('%Y-%m-%d %H:%M')
-                st.dataframe(users_df[['email', 'full_name', 'phone', 'is_admin', 'created_at', 'last_login']], use_container_width=True)
-            else:
-                st.info("No users registered yet")
+            render_admin_page(
+                'admin_users', db.get_users_page,
+                ['email', 'full_name', 'phone', 'is_admin', 'created_at', 'last_login'],
+                "No users registered yet"
+            )
         
         with tab2:
             st.subheader("Portfolio Evaluations")
-            portfolios = db.get_all_portfolio_history()
-            if portfolios:
-                portfolios_df = pd.DataFrame(portfolios)
-                portfolios_df['created_at'] = pd.to_datetime(portfolios_df['created_at']).dt.strftime('%Y-%m-%d %H:%M')
-                portfolios_df['total_investment'] = portfolios_df['total_investment'].apply(lambda x: f"₹{float(x):,.2f}" if x else "N/A")
-                portfolios_df['current_value'] = portfolios_df['current_value'].apply(lambda x: f"₹{float(x):,.2f}" if x else "N/A")
-                portfolios_df['total_gain_loss'] = portfolios_df['total_gain_loss'].apply(lambda x: f"₹{float(x):,.2f}" if x else "N/A")
-                st.dataframe(portfolios_df[['email', 'full_name', 'file_name', 'stock_count', 'total_investment', 'current_value', 'total_gain_loss', 'created_at']], use_container_width=True)
-            else:
-                st.info("No portfolio analyses recorded yet")
+            render_admin_page(
+                'admin_portfolios', db.get_portfolio_history_page,
+                ['email', 'full_name', 'file_name', 'stock_count', 'total_investment', 'current_value', 'total_gain_loss', 'created_at'],
+                "No portfolio analyses recorded yet"
+            )
         
         with tab3:
             st.subheader("User Activity Log")
-            activities = db.get_user_activity(50)
-            if activities:
-                activities_df = pd.DataFrame(activities)
-                activities_df['created_at'] = pd.to_datetime(activities_df['created_at']).dt.strftime('%Y-%m-%d %H:%M')
-                st.dataframe(activities_df[['email', 'activity_type', 'details', 'created_at']], use_container_width=True)
-            else:
-                st.info("No activity recorded yet")
+            render_admin_page(
+                'admin_activity', db.get_user_activity_page,
+                ['email', 'activity_type', 'details', 'created_at'],
+                "No activity recorded yet"
+            )
         
         with tab4:
             st.subheader("Zerodha Kite API Configuration")
@@ -876,9 +923,8 @@ def analyze_portfolio():
         portfolio_df = st.session_state.portfolio_data
         
         # Initialize analyzers
-        data_fetcher = DataFetcher()
-        portfolio_analyzer = PortfolioAnalyzer()
-        recommendation_engine = RecommendationEngine()
+        data_fetcher = get_service('data_fetcher')
+        portfolio_analyzer = get_service('portfolio_analyzer')
         
         progress_bar = st.progress(0)
         total_stocks = len(portfolio_df)
@@ -948,30 +994,21 @@ def analyze_portfolio():
             portfolio_df, current_data, historical_data
         )
         
-        # Create enriched portfolio DataFrame from analysis results
-        enriched_portfolio_df = pd.DataFrame(analysis_results['stock_performance'])
-        
-        # Generate recommendations using enriched data
-        recommendations = recommendation_engine.generate_recommendations(
-            enriched_portfolio_df, current_data, historical_data, analysis_results
-        )
-        
-        # Store results in session state
+        # Store results in session state; recommendations, benchmark and
+        # advanced metrics are computed when a section first needs them
         st.session_state.analysis_results = analysis_results
-        st.session_state.recommendations = recommendations
         st.session_state.current_data = current_data
         st.session_state.historical_data = historical_data
+        st.session_state.price_symbols = {name: data_fetcher.get_stock_symbol(name) for name in current_data}
         st.session_state.analysis_complete = True
-        
-        if 'advanced_metrics' in st.session_state:
-            del st.session_state.advanced_metrics
+        st.session_state.pop('live_valuation', None)
+        build_analysis_graph()
         
         progress_bar.progress(1.0)
         st.success("Analysis complete!")
         
         try:
-            from utils.database import Database
-            db = Database()
+            from utils.audit_writer import audit_writer
             user_id = st.session_state.user.get('id') if st.session_state.user else None
             if user_id:
                 file_name = st.session_state.get('uploaded_file_name', 'Unknown')
@@ -983,11 +1020,11 @@ def analyze_portfolio():
                 stocks_list = [{'name': stock['Stock Name'], 'qty': int(stock['Quantity'])} 
                               for _, stock in portfolio_df.iterrows()]
                 
-                db.save_portfolio_history(
+                audit_writer.save_portfolio_history(
                     user_id, file_name, stock_count, total_investment,
                     current_value, total_gain_loss, stocks_list
                 )
-                db.log_activity(user_id, 'portfolio_analysis', f'Analyzed {stock_count} stocks')
+                audit_writer.log_activity(user_id, 'portfolio_analysis', f'Analyzed {stock_count} stocks')
         except Exception as e:
             pass
         
@@ -999,47 +1036,34 @@ def analyze_portfolio():
         st.session_state.analysis_complete = False
 
 def refresh_prices():
-    """Refresh stock prices with latest market data"""
+    """Refresh stock prices with latest market data
+    
+    Only last traded prices are fetched, in one batch; the existing analysis is
+    re-valued in place and recommendations, fundamentals and history are reused.
+    """
     try:
         portfolio_df = st.session_state.portfolio_data
-        data_fetcher = DataFetcher()
-        portfolio_analyzer = PortfolioAnalyzer()
-        recommendation_engine = RecommendationEngine()
-        
-        # Fetch updated prices
-        current_data = {}
-        historical_data = st.session_state.historical_data  # Keep existing historical data
-        
-        for _, stock in portfolio_df.iterrows():
-            stock_name = stock['Stock Name']
-            buy_date = stock['Buy Date']
-            
-            # Fetch current price only
-            current_price, _ = data_fetcher.get_stock_data(stock_name, buy_date)
-            
-            # Only add if price was successfully fetched
-            if current_price is not None:
-                current_data[stock_name] = current_price
+        portfolio_analyzer = get_service('portfolio_analyzer')
         
-        # Re-analyze with updated prices
-        analysis_results = portfolio_analyzer.analyze_portfolio(
-            portfolio_df, current_data, historical_data
-        )
+        price_symbols = st.session_state.get('price_symbols')
+        if not price_symbols:
+            data_fetcher = get_service('data_fetcher')
+            price_symbols = {name: data_fetcher.get_stock_symbol(name) for name in portfolio_df['Stock Name'].unique()}
+            st.session_state.price_symbols = price_symbols
         
-        # Create enriched portfolio DataFrame from analysis results
-        enriched_portfolio_df = pd.DataFrame(analysis_results['stock_performance'])
+        # Fetch last traded prices only
+        prices = get_service('price_source').fetch(list(set(price_symbols.values())))
+        current_data = dict(st.session_state.current_data)
+        for stock_name, symbol in price_symbols.items():
+            if symbol in prices:
+                current_data[stock_name] = prices[symbol]
         
-        recommendations = recommendation_engine.generate_recommendations(
-            enriched_portfolio_df, current_data, historical_data, analysis_results
-        )
+        analysis_results = portfolio_analyzer.reprice(st.session_state.analysis_results, current_data)
         
-        # Update session state
-        st.session_state.current_data = current_data
-        st.session_state.analysis_results = analysis_results
-        st.session_state.recommendations = recommendations
-        
-        if 'advanced_metrics' in st.session_state:
-            del st.session_state.advanced_metrics
+        # Update session state; the benchmark and recommendations are kept from the last full analysis
+        update_analysis('current_data', current_data, keep=ANALYSIS_KEPT_ON_REPRICE)
+        update_analysis('analysis_results', analysis_results, keep=ANALYSIS_KEPT_ON_REPRICE)
+        st.session_state.pop('live_valuation', None)
         
         st.success("Prices updated successfully!")
         st.rerun()
@@ -1047,10 +1071,156 @@ def refresh_prices():
     except Exception as e:
         st.error(f"Error refreshing prices: {str(e)}")
 
+def get_benchmark_history(index_name='NIFTY50'):
+    """Index history since the earliest buy date, sliced from the shared index store"""
+    buy_dates = pd.to_datetime(st.session_state.portfolio_data['Buy Date'], errors='coerce')
+    if buy_dates.isna().all():
+        return None
+    history = get_service('data_fetcher').get_index_data(index_name, buy_dates.min())
+    return history if not history.empty else None
+
+ANALYSIS_SECTIONS = [
+    "📋 Summary",
+    "📊 Dashboard",
+    "🏭 Sectors",
+    "📈 Stocks",
+    "📊 Benchmark",
+    "💡 Advice",
+    "⚖️ Rebalance",
+    "🔬 Quantamental",
+    "📅 History",
+    "👤 Profile",
+    "🔬 Advanced",
+    "📐 Methodology"
+]
+DEFAULT_ANALYSIS_SECTION = "📊 Dashboard"
+ANALYSIS_INPUTS = ('portfolio_data', 'current_data', 'historical_data', 'analysis_results')
+ANALYSIS_NODES = ('benchmark', 'recommendations', 'advanced_metrics')
+# Not recomputed by a price refresh: recommendations stay as of the last full
+# analysis (they do use prices) until the portfolio is analyzed again
+ANALYSIS_KEPT_ON_REPRICE = ('benchmark', 'recommendations')
+
+def _compute_recommendations(analysis_results, current_data, historical_data):
+    enriched_portfolio_df = pd.DataFrame(analysis_results['stock_performance'])
+    return get_service('recommendation_engine').generate_recommendations(
+        enriched_portfolio_df, current_data, historical_data, analysis_results
+    )
+
+def _compute_advanced_metrics(analysis_results, historical_data, benchmark_data):
+    portfolio_for_metrics = pd.DataFrame(analysis_results.get('stock_performance', []))
+    return AdvancedMetricsCalculator().calculate_all_metrics(portfolio_for_metrics, historical_data, benchmark_data)
+
+def build_analysis_graph():
+    """Start a fresh result graph over the analysis currently in session state"""
+    graph = AnalysisGraph()
+    graph.define('benchmark', lambda portfolio_data: get_benchmark_history(), deps=('portfolio_data',))
+    graph.define('recommendations', _compute_recommendations,
+                 deps=('analysis_results', 'current_data', 'historical_data'))
+    graph.define('advanced_metrics', _compute_advanced_metrics,
+                 deps=('analysis_results', 'historical_data', 'benchmark'))
+    for name in ANALYSIS_INPUTS:
+        graph.set(name, st.session_state.get(name))
+    for name in ANALYSIS_NODES:
+        st.session_state.pop(name, None)
+    st.session_state.analysis_graph = graph
+    return graph
+
+def analysis_value(name):
+    """A derived result, computed on first access and mirrored into session state for readers there"""
+    graph = st.session_state.get('analysis_graph') or build_analysis_graph()
+    value = graph.get(name)
+    st.session_state[name] = value
+    return value
+
+def update_analysis(name, value, keep=()):
+    """Replace an analysis input and drop the results computed from it"""
+    st.session_state[name] = value
+    graph = st.session_state.get('analysis_graph') or build_analysis_graph()
+    for dropped in graph.set(name, value, keep=keep):
+        st.session_state.pop(dropped, None)
+
+def track_live_symbols():
+    """Lease this session's portfolio symbols on the process-wide live price service"""
+    if 'live_session_id' not in st.session_state:
+        st.session_state.live_session_id = uuid.uuid4().hex
+    get_live_price_service().subscribe(
+        st.session_state.live_session_id, list(st.session_state.get('price_symbols', {}).values())
+    )
+
+def sync_live_prices():
+    """Fold prices streamed in live mode into the full analysis once per full rerun"""
+    if not st.session_state.pop('live_prices_pending', False):
+        return
+    analysis_results = get_service('portfolio_analyzer').reprice(
+        st.session_state.analysis_results, st.session_state.current_data
+    )
+    # Intraday ticks are folded in without recomputing the heavier results
+    update_analysis('current_data', st.session_state.current_data, keep=ANALYSIS_NODES)
+    update_analysis('analysis_results', analysis_results, keep=ANALYSIS_NODES)
+
+@st.fragment(run_every=LIVE_FEED_INTERVAL_SECONDS)
+def render_live_valuation():
+    """Summary metrics and holdings re-valued from the live feed; reruns on its own"""
+    valuation = st.session_state.get('live_valuation')
+    if valuation is None:
+        return
+    live_feed.start(st.session_state.live_session_id, valuation.names_by_symbol)
+    changed = valuation.update_from(live_feed)
+    if changed:
+        current_data = dict(st.session_state.current_data)
+        current_data.update({name: valuation.positions[name]['price'] for name in changed})
+        st.session_state.current_data = current_data
+        st.session_state.live_prices_pending = True
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Current Value", f"₹{valuation.current_value:,.0f}",
+                  delta=f"₹{valuation.last_change:+,.0f}" if changed else None)
+    with col2:
+        st.metric("Total P&L", f"₹{valuation.total_gain_loss:+,.0f}",
+                  delta=f"{valuation.total_gain_loss_percentage:+.2f}%")
+    with col3:
+        st.metric("Updated Positions", f"{len(changed)} / {len(valuation.positions)}")
+    with col4:
+        last_poll = live_feed.last_poll
+        st.metric("Last Tick", datetime.fromtimestamp(last_poll).strftime('%H:%M:%S') if last_poll else "—")
+    
+    st.dataframe(
+        pd.DataFrame(valuation.holdings()),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            'Buy Price': st.column_config.NumberColumn(format="₹%.2f"),
+            'LTP': st.column_config.NumberColumn(format="₹%.2f"),
+            'Current Value': st.column_config.NumberColumn(format="₹%.0f"),
+            'Gain/Loss': st.column_config.NumberColumn(format="₹%.0f"),
+            'Gain/Loss %': st.column_config.NumberColumn(format="%.2f%%"),
+            'Updated': st.column_config.TextColumn(width="small")
+        }
+    )
+
+def render_live_mode():
+    """Live mode toggle; while on, the valuation fragment refreshes every feed interval"""
+    if not st.toggle("⚡ Live prices", key='live_mode',
+                     help=f"Stream last traded prices and re-value holdings every {LIVE_FEED_INTERVAL_SECONDS:g}s"):
+        if st.session_state.pop('live_valuation', None) is not None:
+            live_feed.stop(st.session_state.live_session_id)
+        return
+    if 'live_valuation' not in st.session_state:
+        price_symbols = st.session_state.get('price_symbols', {})
+        current_data = st.session_state.current_data
+        live_feed.seed({symbol: current_data.get(name) for name, symbol in price_symbols.items()})
+        st.session_state.live_valuation = LiveValuation(
+            st.session_state.analysis_results.get('stock_performance', []), price_symbols
+        )
+    render_live_valuation()
+
 def display_analysis():
     """Display comprehensive portfolio analysis"""
     
     render_auth_header()
+    track_live_symbols()
+    sync_live_prices()
     
     # Apply global styling for margins and card-based sections
     st.markdown("""
@@ -1145,7 +1315,7 @@ def display_analysis():
         if st.button("📄 Download Report", type="primary", help="Generate comprehensive PDF report", use_container_width=True):
             with st.spinner("Generating PDF report..."):
                 try:
-                    pdf_gen = PDFReportGenerator()
+                    pdf_gen = get_service('pdf_generator')
                     filename = f"portfolio_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
                     
                     # Get dividend metrics and tax data for PDF
@@ -1165,7 +1335,7 @@ def display_analysis():
                     pdf_gen.generate_report(
                         st.session_state.analysis_results,
                         st.session_state.portfolio_data,
-                        st.session_state.recommendations,
+                        analysis_value('recommendations'),
                         filename,
                         st.session_state.historical_data,
                         st.session_state.current_data,
@@ -1228,41 +1398,17 @@ def display_analysis():
     
     # Show AI Assistant modal if triggered
     if st.session_state.get('show_ai_assistant', False):
+        analysis_value('recommendations')
         render_ai_assistant_modal()
     
-    # Add CSS to make tabs scrollable and compact
-    st.markdown("""
-    <style>
-    /* Make tabs container scrollable */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 4px;
-        overflow-x: auto;
-        flex-wrap: nowrap;
-    }
-    /* Compact tab styling */
-    .stTabs [data-baseweb="tab"] {
-        padding: 8px 12px;
-        font-size: 13px;
-        white-space: nowrap;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-    
-    # Create tabs for different analysis sections
-    tab0, tab1, tab2, tab3, tab4, tab5, tab6, tab7q, tab7, tab8, tab9, tab10 = st.tabs([
-        "📋 Summary",
-        "📊 Dashboard", 
-        "🏭 Sectors", 
-        "📈 Stocks", 
-        "📊 Benchmark", 
-        "💡 Advice",
-        "⚖️ Rebalance",
-        "🔬 Quantamental",
-        "📅 History",
-        "👤 Profile",
-        "🔬 Advanced",
-        "📐 Methodology"
-    ])
+    # Only the selected section runs, so its results are computed on first visit
+    section = st.segmented_control(
+        "Analysis section",
+        ANALYSIS_SECTIONS,
+        default=DEFAULT_ANALYSIS_SECTION,
+        key="analysis_section",
+        label_visibility="collapsed"
+    ) or DEFAULT_ANALYSIS_SECTION
     
     from utils.page_explanations import render_page_explainer, render_language_selector, SUPPORTED_LANGUAGES
     
@@ -1272,34 +1418,21 @@ def display_analysis():
     lang_code = SUPPORTED_LANGUAGES.get(st.session_state.explanation_language, "en")
     
     _ar = st.session_state.analysis_results
-    _adv = st.session_state.get('advanced_metrics')
-    _rec = st.session_state.get('recommendations')
     
-    with tab0:
-        adv_for_summary = st.session_state.get('advanced_metrics')
-        if not adv_for_summary:
-            try:
-                from utils.advanced_metrics import AdvancedMetricsCalculator as AMC
-                metrics_calculator = AMC()
-                stock_perf = st.session_state.analysis_results.get('stock_performance', [])
-                portfolio_for_metrics = pd.DataFrame(stock_perf)
-                benchmark_data = st.session_state.get('historical_data', {}).get('NIFTY 50')
-                adv_for_summary = metrics_calculator.calculate_all_metrics(
-                    portfolio_for_metrics,
-                    st.session_state.get('historical_data', {}),
-                    benchmark_data
-                )
-                st.session_state.advanced_metrics = adv_for_summary
-            except Exception:
-                adv_for_summary = {}
+    if section == "📋 Summary":
+        try:
+            adv_for_summary = analysis_value('advanced_metrics')
+        except Exception:
+            adv_for_summary = {}
         render_portfolio_summary(
             st.session_state.analysis_results,
             adv_for_summary,
-            st.session_state.get('recommendations')
+            analysis_value('recommendations')
         )
 
-    with tab1:
+    elif section == "📊 Dashboard":
         render_page_explainer("dashboard", lang_code, analysis_results=_ar)
+        render_live_mode()
         dashboard = Dashboard()
         dashboard.render(
             st.session_state.analysis_results,
@@ -1308,7 +1441,7 @@ def display_analysis():
             lang_code=lang_code
         )
     
-    with tab2:
+    elif section == "🏭 Sectors":
         render_page_explainer("sectors", lang_code, analysis_results=_ar)
         sector_analysis = SectorAnalysis()
         sector_analysis.render(
@@ -1317,7 +1450,7 @@ def display_analysis():
             lang_code=lang_code
         )
     
-    with tab3:
+    elif section == "📈 Stocks":
         render_page_explainer("stocks", lang_code, analysis_results=_ar)
         stock_performance = StockPerformance()
         stock_performance.render(
@@ -1328,28 +1461,31 @@ def display_analysis():
             lang_code=lang_code
         )
     
-    with tab4:
+    elif section == "📊 Benchmark":
         render_page_explainer("benchmark", lang_code, analysis_results=_ar)
-        benchmark_comparison = BenchmarkComparison()
+        benchmark_comparison = get_service('benchmark_comparison')
         benchmark_comparison.render(
             st.session_state.analysis_results,
             st.session_state.portfolio_data,
             lang_code=lang_code
         )
     
-    with tab5:
-        render_page_explainer("advice", lang_code, analysis_results=_ar, recommendations=_rec)
+    elif section == "💡 Advice":
         if st.session_state.get('disclaimer_accepted', False):
+            with st.spinner("Generating recommendations..."):
+                recommendations_data = analysis_value('recommendations')
+            render_page_explainer("advice", lang_code, analysis_results=_ar, recommendations=recommendations_data)
             recommendations = Recommendations()
             recommendations.render(
-                st.session_state.recommendations,
+                recommendations_data,
                 st.session_state.analysis_results,
                 lang_code=lang_code
             )
         else:
+            render_page_explainer("advice", lang_code, analysis_results=_ar)
             render_disclaimer_overlay('advice')
     
-    with tab6:
+    elif section == "⚖️ Rebalance":
         render_page_explainer("rebalance", lang_code, analysis_results=_ar)
         if st.session_state.get('disclaimer_accepted', False):
             rebalancing = PortfolioRebalancing()
@@ -1362,17 +1498,17 @@ def display_analysis():
         else:
             render_disclaimer_overlay('rebalance')
     
-    with tab7q:
+    elif section == "🔬 Quantamental":
         if st.session_state.get('disclaimer_accepted', False):
             render_quantamental_tab(
                 st.session_state.analysis_results,
-                st.session_state.get('recommendations', []),
+                analysis_value('recommendations'),
                 st.session_state.get('historical_data', {})
             )
         else:
             render_disclaimer_overlay('quantamental')
     
-    with tab7:
+    elif section == "📅 History":
         render_page_explainer("history", lang_code, analysis_results=_ar)
         historical_performance = HistoricalPerformance()
         historical_performance.render(
@@ -1382,39 +1518,24 @@ def display_analysis():
             lang_code=lang_code
         )
     
-    with tab8:
+    elif section == "👤 Profile":
         render_page_explainer("profile", lang_code, analysis_results=_ar)
         customer_profile = CustomerProfile()
         customer_profile.render(
             st.session_state.analysis_results,
             st.session_state.portfolio_data,
-            st.session_state.recommendations,
+            analysis_value('recommendations'),
             lang_code=lang_code
         )
     
-    with tab9:
-        if 'advanced_metrics' not in st.session_state:
-            with st.spinner("Calculating advanced metrics..."):
-                from utils.advanced_metrics import AdvancedMetricsCalculator as AMC
-                metrics_calculator = AMC()
-                
-                stock_perf = st.session_state.analysis_results.get('stock_performance', [])
-                portfolio_for_metrics = pd.DataFrame(stock_perf)
-                
-                benchmark_data = None
-                if 'NIFTY 50' in st.session_state.historical_data:
-                    benchmark_data = st.session_state.historical_data['NIFTY 50']
-                
-                st.session_state.advanced_metrics = metrics_calculator.calculate_all_metrics(
-                    portfolio_for_metrics,
-                    st.session_state.historical_data,
-                    benchmark_data
-                )
+    elif section == "🔬 Advanced":
+        with st.spinner("Calculating advanced metrics..."):
+            advanced_metrics = analysis_value('advanced_metrics')
         
-        render_page_explainer("advanced", lang_code, analysis_results=_ar, advanced_metrics=st.session_state.advanced_metrics)
-        render_advanced_metrics_tab(st.session_state.advanced_metrics)
+        render_page_explainer("advanced", lang_code, analysis_results=_ar, advanced_metrics=advanced_metrics)
+        render_advanced_metrics_tab(advanced_metrics)
     
-    with tab10:
+    elif section == "📐 Methodology":
         render_page_explainer("methodology", lang_code, analysis_results=_ar)
         from components.methodology import Methodology
         methodology = Methodology()
@@ -364,12 +364,13 @@ class BenchmarkComparison:
         earliest_date = pd.to_datetime(stock_performance['Buy Date']).min()
         
         indices_to_fetch = selected_benchmarks if selected_benchmarks else list(self.data_fetcher.indices.keys())
+        histories = self.data_fetcher.get_index_histories(indices_to_fetch, earliest_date)
         
         for benchmark_name in indices_to_fetch:
             if benchmark_name not in self.data_fetcher.indices:
                 continue
             try:
-                benchmark_data = self.data_fetcher.get_index_data(benchmark_name, earliest_date)
+                benchmark_data = histories.get(benchmark_name, pd.DataFrame())
                 
                 if not benchmark_data.empty:
                     start_price = benchmark_data['Close'].iloc[0]
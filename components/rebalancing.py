@@ -6,6 +6,7 @@ import pandas as pd
 import numpy as np
 import os
 from utils.page_explanations import render_section_explainer
+from utils.reference_data import get_reference_snapshot
 
 class PortfolioRebalancing:
     def __init__(self):
@@ -26,16 +27,11 @@ class PortfolioRebalancing:
     
     def _load_data(self):
         if os.environ.get('DATABASE_URL'):
-            try:
-                from utils.database import Database
-                db = Database()
-                self._strategies = db.get_rebalancing_strategies()
-                self._sector_targets = db.get_sectors()
-                
-                if self._strategies and self._sector_targets:
-                    return
-            except Exception as e:
-                print(f"Database load failed for rebalancing: {e}")
+            snapshot = get_reference_snapshot()
+            if snapshot.strategies and snapshot.sectors:
+                self._strategies = snapshot.strategies
+                self._sector_targets = snapshot.sectors
+                return
         
         self._strategies = {
             'Conservative': {
@@ -0,0 +1,53 @@
+"""Lazily computed, memoized analysis results
+
+Inputs are set directly; derived nodes declare the nodes they depend on and
+are computed the first time something asks for them. Setting an input drops
+every node computed from it so it is rebuilt on next access.
+"""
+
+
+class AnalysisGraph:
+    def __init__(self):
+        self._nodes = {}
+        self._values = {}
+
+    def define(self, name, compute, deps=()):
+        """Register a derived node computed as compute(*dependency values)"""
+        self._nodes[name] = (tuple(deps), compute)
+
+    def dependents(self, name):
+        """Every node computed directly or transitively from name"""
+        found = set()
+        pending = [name]
+        while pending:
+            current = pending.pop()
+            for node, (deps, _) in self._nodes.items():
+                if current in deps and node not in found:
+                    found.add(node)
+                    pending.append(node)
+        return found
+
+    def set(self, name, value, keep=()):
+        """Set an input; returns the names of computed nodes that were dropped
+
+        Nodes listed in keep survive, e.g. results a caller knows do not
+        depend on the part of the input that changed.
+        """
+        self._values[name] = value
+        dropped = {node for node in self.dependents(name) - set(keep) if node in self._values}
+        for node in dropped:
+            del self._values[node]
+        return dropped
+
+    def get(self, name):
+        if name in self._values:
+            return self._values[name]
+        if name not in self._nodes:
+            raise KeyError(f"Analysis input '{name}' has not been set")
+        deps, compute = self._nodes[name]
+        value = compute(*[self.get(dep) for dep in deps])
+        self._values[name] = value
+        return value
+
+    def computed(self, name):
+        return name in self._values
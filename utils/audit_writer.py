@@ -0,0 +1,182 @@
+"""Write-behind buffer for activity and portfolio-history rows
+
+Audit writes are queued in memory and inserted in batches with execute_values
+from a background thread, so analysis requests never wait on them. Rows keep
+the timestamp at which they were queued. When a batch fails its rows are
+retried one at a time, so a single bad row is logged and dropped instead of
+blocking every later flush; rows are only re-queued when the database itself
+is unreachable. The buffer is capped (oldest rows are dropped and counted) and
+drained on interpreter shutdown.
+"""
+import os
+import json
+import time
+import atexit
+import threading
+from datetime import datetime
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+AUDIT_FLUSH_SECONDS = float(os.environ.get('AUDIT_FLUSH_SECONDS', '2'))
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', '500'))
+AUDIT_MAX_BUFFERED_ROWS = int(os.environ.get('AUDIT_MAX_BUFFERED_ROWS', '50000'))
+AUDIT_SHUTDOWN_RETRIES = 3
+
+HISTORY_INSERT = '''
+    INSERT INTO portfolio_history (user_id, file_name, stock_count, total_investment,
+        current_value, total_gain_loss, stocks_data, created_at)
+    VALUES %s
+'''
+ACTIVITY_INSERT = '''
+    INSERT INTO user_activity (user_id, activity_type, details, created_at)
+    VALUES %s
+'''
+
+
+class AuditWriter:
+    def __init__(self, interval=AUDIT_FLUSH_SECONDS, batch_size=AUDIT_BATCH_SIZE,
+                 max_buffered=AUDIT_MAX_BUFFERED_ROWS):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_buffered = max_buffered
+        self._activity = []
+        self._history = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self.rows_written = 0
+        self.failed_flushes = 0
+        self.rows_dropped = 0
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def _enqueue(self, buffer_name, row):
+        if not (os.environ.get('EXTERNAL_DATABASE_URL') or os.environ.get('DATABASE_URL')):
+            return
+        self._ensure_thread()
+        with self._lock:
+            getattr(self, buffer_name).append(row)
+            self._trim()
+            pending = len(self._activity) + len(self._history)
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def log_activity(self, user_id, activity_type, details=None):
+        self._enqueue('_activity', (user_id, activity_type, details, datetime.now()))
+
+    def save_portfolio_history(self, user_id, file_name, stock_count, total_investment, current_value, total_gain_loss, stocks_data):
+        self._enqueue('_history', (
+            user_id, file_name, stock_count, total_investment, current_value,
+            total_gain_loss, json.dumps(stocks_data), datetime.now()
+        ))
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def _trim(self):
+        """Drop the oldest rows beyond max_buffered; caller holds _lock"""
+        for buffer_name in ('_activity', '_history'):
+            rows = getattr(self, buffer_name)
+            overflow = len(rows) - self.max_buffered
+            if overflow > 0:
+                del rows[:overflow]
+                self.rows_dropped += overflow
+                print(f"Audit buffer full, dropped {overflow} oldest {buffer_name.lstrip('_')} rows")
+
+    def _requeue(self, activity, history):
+        with self._lock:
+            self._activity = activity + self._activity
+            self._history = history + self._history
+            self._trim()
+
+    def flush(self):
+        """Insert everything queued so far; returns False if rows had to be re-queued"""
+        with self._flush_lock:
+            with self._lock:
+                activity, self._activity = self._activity, []
+                history, self._history = self._history, []
+            if not activity and not history:
+                return True
+            try:
+                from utils.database import Database
+                with Database().get_connection() as conn:
+                    with conn.cursor() as cur:
+                        if history:
+                            execute_values(cur, HISTORY_INSERT, history, page_size=self.batch_size)
+                        if activity:
+                            execute_values(cur, ACTIVITY_INSERT, activity, page_size=self.batch_size)
+                self.rows_written += len(activity) + len(history)
+                return True
+            except Exception as e:
+                print(f"Error flushing audit batch, retrying rows individually: {e}")
+                self.failed_flushes += 1
+            return self._flush_rows(activity, history)
+
+    def _flush_rows(self, activity, history):
+        """Insert rows one by one under savepoints, dropping rows the database rejects"""
+        rows = [('_history', HISTORY_INSERT, row) for row in history]
+        rows += [('_activity', ACTIVITY_INSERT, row) for row in activity]
+        rejected = set()
+        try:
+            from utils.database import Database
+            with Database().get_connection() as conn:
+                with conn.cursor() as cur:
+                    for index, (_, sql, row) in enumerate(rows):
+                        cur.execute("SAVEPOINT audit_row")
+                        try:
+                            execute_values(cur, sql, [row])
+                        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                            raise
+                        except psycopg2.Error as e:
+                            cur.execute("ROLLBACK TO SAVEPOINT audit_row")
+                            rejected.add(index)
+                            print(f"Dropping audit row the database rejected: {e}")
+                        else:
+                            cur.execute("RELEASE SAVEPOINT audit_row")
+        except Exception as e:
+            # The transaction rolled back; keep every row the database did not reject
+            print(f"Error flushing audit rows: {e}")
+            kept = [entry for index, entry in enumerate(rows) if index not in rejected]
+            self.rows_dropped += len(rejected)
+            self._requeue([row for name, _, row in kept if name == '_activity'],
+                          [row for name, _, row in kept if name == '_history'])
+            return False
+        self.rows_dropped += len(rejected)
+        self.rows_written += len(rows) - len(rejected)
+        return True
+
+    def pending(self):
+        with self._lock:
+            return {'activity': len(self._activity), 'portfolio_history': len(self._history)}
+
+    def stop(self):
+        """Stop the background thread and drain the buffer"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread_pid == os.getpid():
+            self._thread.join(timeout=self.interval + 5)
+        for attempt in range(AUDIT_SHUTDOWN_RETRIES):
+            if self.flush():
+                return
+            time.sleep(attempt + 1)
+        remaining = self.pending()
+        print(f"Audit rows not delivered at shutdown: {remaining}")
+
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.stop)
@@ -29,27 +29,25 @@ class AuthManager:
     
     def signup(self, email: str, password: str, full_name: str = None, phone: str = None) -> dict:
         try:
-            conn = self.db.get_connection()
-            cur = conn.cursor()
+            with self.db.get_connection() as conn:
+                cur = conn.cursor()
             
-            cur.execute("SELECT id FROM users WHERE email = %s", (email.lower(),))
-            if cur.fetchone():
-                cur.close()
-                conn.close()
-                return {'success': False, 'message': 'Email already registered'}
+                cur.execute("SELECT id FROM users WHERE email = %s", (email.lower(),))
+                if cur.fetchone():
+                    cur.close()
+                    return {'success': False, 'message': 'Email already registered'}
             
-            password_hash, _ = self._hash_password(password)
+                password_hash, _ = self._hash_password(password)
             
-            cur.execute('''
-                INSERT INTO users (email, password_hash, full_name, phone, created_at)
-                VALUES (%s, %s, %s, %s, %s)
-                RETURNING id
-            ''', (email.lower(), password_hash, full_name, phone, datetime.now()))
+                cur.execute('''
+                    INSERT INTO users (email, password_hash, full_name, phone, created_at)
+                    VALUES (%s, %s, %s, %s, %s)
+                    RETURNING id
+                ''', (email.lower(), password_hash, full_name, phone, datetime.now()))
             
-            user_id = cur.fetchone()[0]
-            conn.commit()
-            cur.close()
-            conn.close()
+                user_id = cur.fetchone()[0]
+                conn.commit()
+                cur.close()
             
             return {
                 'success': True,
@@ -63,32 +61,29 @@ class AuthManager:
     
     def login(self, email: str, password: str) -> dict:
         try:
-            conn = self.db.get_connection()
-            cur = conn.cursor()
+            with self.db.get_connection() as conn:
+                cur = conn.cursor()
             
-            cur.execute('''
-                SELECT id, email, password_hash, full_name, phone, is_admin 
-                FROM users WHERE email = %s
-            ''', (email.lower(),))
+                cur.execute('''
+                    SELECT id, email, password_hash, full_name, phone, is_admin 
+                    FROM users WHERE email = %s
+                ''', (email.lower(),))
             
-            user = cur.fetchone()
+                user = cur.fetchone()
             
-            if not user:
-                cur.close()
-                conn.close()
-                return {'success': False, 'message': 'Invalid email or password'}
+                if not user:
+                    cur.close()
+                    return {'success': False, 'message': 'Invalid email or password'}
             
-            user_id, user_email, password_hash, full_name, phone, is_admin = user
+                user_id, user_email, password_hash, full_name, phone, is_admin = user
             
-            if not self._verify_password(password, password_hash):
-                cur.close()
-                conn.close()
-                return {'success': False, 'message': 'Invalid email or password'}
+                if not self._verify_password(password, password_hash):
+                    cur.close()
+                    return {'success': False, 'message': 'Invalid email or password'}
             
-            cur.execute('UPDATE users SET last_login = %s WHERE id = %s', (datetime.now(), user_id))
-            conn.commit()
-            cur.close()
-            conn.close()
+                cur.execute('UPDATE users SET last_login = %s WHERE id = %s', (datetime.now(), user_id))
+                conn.commit()
+                cur.close()
             
             return {
                 'success': True,
@@ -103,17 +98,16 @@ class AuthManager:
     
     def get_user(self, user_id: int) -> dict:
         try:
-            conn = self.db.get_connection()
-            cur = conn.cursor()
+            with self.db.get_connection() as conn:
+                cur = conn.cursor()
             
-            cur.execute('''
-                SELECT id, email, full_name, phone, created_at, last_login 
-                FROM users WHERE id = %s
-            ''', (user_id,))
+                cur.execute('''
+                    SELECT id, email, full_name, phone, created_at, last_login 
+                    FROM users WHERE id = %s
+                ''', (user_id,))
             
-            user = cur.fetchone()
-            cur.close()
-            conn.close()
+                user = cur.fetchone()
+                cur.close()
             
             if user:
                 return {
@@ -1,61 +1,215 @@
 import os
-import psycopg2
+import time
+import threading
+from bisect import bisect_left, bisect_right
+from utils.db_pool import get_pool
 from datetime import datetime, date
 from decimal import Decimal
 
+CORPORATE_ACTIONS_POLL_SECONDS = int(os.environ.get('CORPORATE_ACTIONS_POLL_SECONDS', '300'))
+
+
+class CorporateActionsCache:
+    """Process-wide corporate actions, held per symbol sorted by action_date
+
+    The table is read in full once. When it has an updated_at column, later
+    polls fetch rows at or past the last updated_at seen (so rows committed
+    later with the same timestamp are not missed) and merge them by id into
+    the per-symbol arrays; a row-count mismatch (deletes) triggers a full
+    reload. Without updated_at, edits cannot be told apart by id, so polls
+    compare a fingerprint of the table and reload it in full when it changes.
+
+    Polls after the first load run on a background thread, so readers get
+    the current arrays without waiting on the database. Per-symbol arrays
+    are replaced, never mutated, so readers need no lock.
+    """
+
+    def __init__(self, database_url=None, poll_seconds=CORPORATE_ACTIONS_POLL_SECONDS):
+        self.database_url = database_url if database_url is not None else os.environ.get('DATABASE_URL')
+        self.poll_seconds = poll_seconds
+        self._by_symbol = {}
+        self._row_count = 0
+        self._watermark_column = None
+        self._has_id = False
+        self._watermark = None
+        self._fingerprint = None
+        self._loaded = False
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
+        self._poller = None
+        self._poller_lock = threading.Lock()
+
+    def _select(self, cursor, where='', params=()):
+        id_column = 'id' if self._has_id else 'NULL'
+        watermark_column = self._watermark_column or 'NULL'
+        cursor.execute(f"""
+            SELECT symbol, action_type, action_date, ratio_from, ratio_to, dividend_amount, ex_date,
+                   {id_column}, {watermark_column}
+            FROM corporate_actions
+            {where}
+            ORDER BY action_date ASC
+        """, params)
+        return cursor.fetchall()
+
+    @staticmethod
+    def _row_to_action(row):
+        return {
+            'symbol': row[0].upper(),
+            'action_type': row[1],
+            'action_date': row[2],
+            'ratio_from': row[3],
+            'ratio_to': row[4],
+            'dividend_amount': float(row[5]) if row[5] else 0,
+            'ex_date': row[6],
+            'id': row[7]
+        }
+
+    @staticmethod
+    def _action_key(action):
+        if action['id'] is not None:
+            return action['id']
+        return (action['action_type'], action['action_date'], action['ratio_from'], action['ratio_to'])
+
+    def _advance_watermark(self, rows):
+        marks = [row[8] for row in rows if row[8] is not None]
+        if marks:
+            latest = max(marks)
+            if self._watermark is None or latest > self._watermark:
+                self._watermark = latest
+
+    def _full_load(self, cursor):
+        cursor.execute("""
+            SELECT column_name FROM information_schema.columns WHERE table_name = 'corporate_actions'
+        """)
+        columns = {row[0] for row in cursor.fetchall()}
+        self._has_id = 'id' in columns
+        self._watermark_column = 'updated_at' if 'updated_at' in columns else None
+        self._watermark = None
+        self._fingerprint = None if self._watermark_column else self._table_fingerprint(cursor)
+
+        rows = self._select(cursor)
+        by_symbol = {}
+        for row in rows:
+            action = self._row_to_action(row)
+            by_symbol.setdefault(action['symbol'], []).append(action)
+        self._by_symbol = {
+            symbol: (tuple(a['action_date'] for a in actions), tuple(actions))
+            for symbol, actions in by_symbol.items()
+        }
+        self._row_count = len(rows)
+        self._advance_watermark(rows)
+
+    def _merge(self, rows):
+        changed = {}
+        for row in rows:
+            action = self._row_to_action(row)
+            symbol = action['symbol']
+            if symbol not in changed:
+                changed[symbol] = list(self._by_symbol.get(symbol, ((), ()))[1])
+            actions = changed[symbol]
+            key = self._action_key(action)
+            replaced = False
+            for i, existing in enumerate(actions):
+                if self._action_key(existing) == key:
+                    del actions[i]
+                    replaced = True
+                    break
+            if not replaced:
+                self._row_count += 1
+            dates = [a['action_date'] for a in actions]
+            actions.insert(bisect_right(dates, action['action_date']), action)
+
+        for symbol, actions in changed.items():
+            self._by_symbol[symbol] = (tuple(a['action_date'] for a in actions), tuple(actions))
+        self._advance_watermark(rows)
+
+    @staticmethod
+    def _table_fingerprint(cursor):
+        cursor.execute("SELECT COUNT(*), md5(string_agg(ca::text, ',' ORDER BY ca::text)) FROM corporate_actions ca")
+        return tuple(cursor.fetchone())
+
+    def _poll(self, cursor):
+        if self._watermark_column is None:
+            if self._table_fingerprint(cursor) != self._fingerprint:
+                self._full_load(cursor)
+            return
+        if self._watermark is None:
+            rows = self._select(cursor, f"WHERE {self._watermark_column} IS NOT NULL")
+        else:
+            # Rows at the watermark are fetched again and replaced by id in _merge
+            rows = self._select(cursor, f"WHERE {self._watermark_column} >= %s", (self._watermark,))
+        if rows:
+            self._merge(rows)
+        cursor.execute("SELECT COUNT(*) FROM corporate_actions")
+        if cursor.fetchone()[0] != self._row_count:
+            self._full_load(cursor)
+
+    def refresh(self, force=False):
+        """Load on first use, then poll for changes at most every poll_seconds
+
+        Only the first load (or a forced refresh) blocks the caller; later
+        polls are handed to a background thread.
+        """
+        if not self.database_url:
+            return
+        if not self._loaded or force:
+            self._refresh(force)
+            return
+        if time.time() - self._last_poll < self.poll_seconds:
+            return
+        with self._poller_lock:
+            if self._poller is not None and self._poller.is_alive():
+                return
+            self._poller = threading.Thread(target=self._refresh, name='corporate-actions-poll', daemon=True)
+            self._poller.start()
+
+    def _refresh(self, force=False):
+        with self._lock:
+            if self._loaded and not force and time.time() - self._last_poll < self.poll_seconds:
+                return
+            try:
+                with get_pool(self.database_url).getconn() as conn:
+                    cursor = conn.cursor()
+                    if self._loaded:
+                        self._poll(cursor)
+                    else:
+                        self._full_load(cursor)
+                        self._loaded = True
+                    cursor.close()
+            except Exception as e:
+                print(f"Error loading corporate actions: {e}")
+            self._last_poll = time.time()
+
+    def get_actions(self, symbol, after_date=None):
+        self.refresh()
+        dates, actions = self._by_symbol.get(symbol, ((), ()))
+        if after_date is None:
+            return list(actions)
+        return list(actions[bisect_left(dates, after_date):])
+
+    def all_actions(self):
+        self.refresh()
+        return {symbol: list(actions) for symbol, (_, actions) in self._by_symbol.items()}
+
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+def get_corporate_actions_cache(database_url):
+    with _shared_caches_lock:
+        if database_url not in _shared_caches:
+            _shared_caches[database_url] = CorporateActionsCache(database_url)
+        return _shared_caches[database_url]
+
+
 class CorporateActionsManager:
     def __init__(self):
         self.database_url = os.environ.get('DATABASE_URL')
-        self._actions_cache = None
-        self._cache_loaded = False
-    
-    def _get_connection(self):
-        if not self.database_url:
-            return None
-        return psycopg2.connect(self.database_url)
+        self._cache = get_corporate_actions_cache(self.database_url)
     
     def _load_all_actions(self):
-        if self._cache_loaded:
-            return self._actions_cache
-        
-        self._actions_cache = {}
-        
-        try:
-            conn = self._get_connection()
-            if not conn:
-                return self._actions_cache
-            
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT symbol, action_type, action_date, ratio_from, ratio_to, dividend_amount, ex_date
-                FROM corporate_actions
-                ORDER BY action_date ASC
-            """)
-            
-            rows = cursor.fetchall()
-            for row in rows:
-                symbol = row[0].upper()
-                if symbol not in self._actions_cache:
-                    self._actions_cache[symbol] = []
-                
-                self._actions_cache[symbol].append({
-                    'symbol': symbol,
-                    'action_type': row[1],
-                    'action_date': row[2],
-                    'ratio_from': row[3],
-                    'ratio_to': row[4],
-                    'dividend_amount': float(row[5]) if row[5] else 0,
-                    'ex_date': row[6]
-                })
-            
-            cursor.close()
-            conn.close()
-            self._cache_loaded = True
-            
-        except Exception as e:
-            print(f"Error loading corporate actions: {e}")
-        
-        return self._actions_cache
+        return self._cache.all_actions()
     
     def _normalize_symbol(self, symbol):
         symbol = symbol.upper().strip()
@@ -82,20 +236,17 @@ class CorporateActionsManager:
         return aliases.get(symbol, symbol)
     
     def get_actions_for_symbol(self, symbol, after_date=None):
-        actions = self._load_all_actions()
         normalized = self._normalize_symbol(symbol)
         
-        symbol_actions = actions.get(normalized, [])
-        
         if after_date:
             if isinstance(after_date, str):
                 after_date = datetime.strptime(after_date, '%Y-%m-%d').date()
             elif isinstance(after_date, datetime):
                 after_date = after_date.date()
-            
-            symbol_actions = [a for a in symbol_actions if a['action_date'] >= after_date]
+        else:
+            after_date = None
         
-        return symbol_actions
+        return self._cache.get_actions(normalized, after_date)
     
     def calculate_adjustment_factor(self, symbol, buy_date):
         actions = self.get_actions_for_symbol(symbol, after_date=buy_date)
@@ -1,17 +1,32 @@
 import yfinance as yf
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import streamlit as st
 import os
+import json
+import time
+import tempfile
+from utils.reference_data import reference_data, get_reference_snapshot
+from utils.live_prices import get_live_price_service
+from utils.quote_cache import quote_cache
+from utils.index_history import index_history_store
+from utils.market_data_cache import (
+    flatten_yf_columns, ticker_info, symbol_history, symbol_history_window, fundamentals
+)
+
+ZERODHA_INSTRUMENTS_CACHE_PATH = os.environ.get(
+    'ZERODHA_INSTRUMENTS_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'alphalens_zerodha_instruments_nse.json')
+)
+ZERODHA_QUOTE_CHUNK_SIZE = int(os.environ.get('ZERODHA_QUOTE_CHUNK_SIZE', '500'))
+ZERODHA_INSTRUMENTS_RETRY_SECONDS = int(os.environ.get('ZERODHA_INSTRUMENTS_RETRY_SECONDS', '300'))
+IST = timezone(timedelta(hours=5, minutes=30))
+
+# NSE tradingsymbol -> instrument_token for the current trading day, shared by all DataFetchers in the process
+_zerodha_instrument_index = {'trading_day': None, 'tokens': {}}
+# time.monotonic() before which a failed instruments download is not retried
+_zerodha_instruments_retry_at = {'value': 0.0}
 
-def _flatten_yf_columns(df):
-    if df.empty:
-        return df
-    if isinstance(df.columns, pd.MultiIndex):
-        df = df.copy()
-        df.columns = df.columns.get_level_values(0)
-    return df
 
 
 class DataFetcher:
@@ -26,9 +41,6 @@ class DataFetcher:
         self._sector_mapping = None
         self._stock_info = None
         
-        self._truedata_client = None
-        self._truedata_initialized = False
-        
         self._alpha_vantage_client = None
         self._alpha_vantage_initialized = False
         
@@ -37,7 +49,6 @@ class DataFetcher:
         
         self._zerodha_kite = None
         self._zerodha_initialized = False
-        self._zerodha_instruments = None
         
         self._index_display_names = {
             'NIFTY50': 'NIFTY 50',
@@ -85,24 +96,16 @@ class DataFetcher:
     
     def _load_data(self):
         if self.use_database:
-            try:
-                from utils.database import Database
-                db = Database()
-                
-                self._symbol_aliases = db.get_symbol_aliases()
-                self._indices = db.get_market_indices()
-                stock_info = db.get_stock_symbols()
-                
-                self._stock_categories = {}
-                self._sector_mapping = {}
-                for symbol, info in stock_info.items():
-                    self._stock_categories[symbol] = info.get('category', 'Mid Cap')
-                    self._sector_mapping[symbol] = info.get('sector', 'Others')
-                
-                self._stock_info = stock_info
+            snapshot = get_reference_snapshot()
+            if all(table is not None for table in (snapshot.symbol_aliases, snapshot.indices, snapshot.stock_symbols)):
+                self._symbol_aliases = snapshot.symbol_aliases
+                self._indices = snapshot.indices
+                self._stock_categories = snapshot.stock_categories
+                # Copied because get_stock_sector memoizes yfinance lookups into it
+                self._sector_mapping = dict(snapshot.sector_mapping)
+                self._stock_info = snapshot.stock_symbols
                 return
-            except Exception as e:
-                print(f"Database load failed, using defaults: {e}")
+            print("Database load failed, using defaults")
         
         self._symbol_aliases = {
             'RIL': 'RELIANCE', 'ICICI': 'ICICIBANK', 'HDFC': 'HDFCBANK',
@@ -329,71 +332,81 @@ class DataFetcher:
             return False
     
     def _load_zerodha_instruments(self):
-        """Load NSE instruments for symbol lookup"""
+        """Load the NSE symbol -> instrument token index, downloading the dump at most once per trading day"""
+        trading_day = datetime.now(IST).date().isoformat()
+        if _zerodha_instrument_index['trading_day'] == trading_day:
+            return _zerodha_instrument_index['tokens']
+
+        try:
+            with open(ZERODHA_INSTRUMENTS_CACHE_PATH) as f:
+                cached = json.load(f)
+            if cached.get('trading_day') == trading_day:
+                _zerodha_instrument_index.update(cached)
+                return _zerodha_instrument_index['tokens']
+        except (OSError, ValueError):
+            pass
+
+        if time.monotonic() < _zerodha_instruments_retry_at['value']:
+            # A recent download failed; keep using the previous index until the retry window passes
+            return _zerodha_instrument_index['tokens']
+
         try:
             if self._zerodha_kite and self._zerodha_initialized:
                 instruments = self._zerodha_kite.instruments("NSE")
-                self._zerodha_instruments = {i['tradingsymbol']: i for i in instruments}
-                print(f"Loaded {len(self._zerodha_instruments)} Zerodha instruments")
+                tokens = {i['tradingsymbol']: i['instrument_token'] for i in instruments}
+                _zerodha_instrument_index.update({'trading_day': trading_day, 'tokens': tokens})
+                tmp_path = f"{ZERODHA_INSTRUMENTS_CACHE_PATH}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(_zerodha_instrument_index, f, separators=(',', ':'))
+                os.replace(tmp_path, ZERODHA_INSTRUMENTS_CACHE_PATH)
+                print(f"Loaded {len(tokens)} Zerodha instruments")
         except Exception as e:
-            print(f"Failed to load Zerodha instruments: {e}")
-            self._zerodha_instruments = {}
+            print(f"Failed to load Zerodha instruments, retrying in {ZERODHA_INSTRUMENTS_RETRY_SECONDS}s: {e}")
+            _zerodha_instruments_retry_at['value'] = time.monotonic() + ZERODHA_INSTRUMENTS_RETRY_SECONDS
+        return _zerodha_instrument_index['tokens']
     
-    def get_zerodha_price(self, symbol):
-        """Get live price from Zerodha Kite API"""
+    def get_zerodha_prices(self, symbols):
+        """Get live prices for many symbols from Zerodha using chunked multi-instrument LTP calls"""
         if not self._zerodha_initialized:
             self.init_zerodha()
         
         if not self._zerodha_kite or not self._zerodha_initialized:
-            return None
-            
-        try:
+            return {}
+        
+        tokens = self._load_zerodha_instruments()
+        keys = {}
+        for symbol in symbols:
             clean_symbol = symbol.replace('.NS', '').replace('.BO', '').replace('-', '')
-            
-            if self._zerodha_instruments and clean_symbol in self._zerodha_instruments:
-                instrument_token = self._zerodha_instruments[clean_symbol]['instrument_token']
-                quote = self._zerodha_kite.quote(f"NSE:{clean_symbol}")
-                if quote and f"NSE:{clean_symbol}" in quote:
-                    return quote[f"NSE:{clean_symbol}"]['last_price']
-            
-            quote = self._zerodha_kite.quote(f"NSE:{clean_symbol}")
-            if quote and f"NSE:{clean_symbol}" in quote:
-                return quote[f"NSE:{clean_symbol}"]['last_price']
-                
-        except Exception as e:
-            print(f"Zerodha price fetch error for {symbol}: {e}")
+            if tokens and clean_symbol not in tokens:
+                continue
+            keys.setdefault(f"NSE:{clean_symbol}", []).append(symbol)
         
-        return None
+        prices = {}
+        instruments = list(keys)
+        for i in range(0, len(instruments), ZERODHA_QUOTE_CHUNK_SIZE):
+            chunk = instruments[i:i + ZERODHA_QUOTE_CHUNK_SIZE]
+            try:
+                quotes = self._zerodha_kite.ltp(chunk) or {}
+            except Exception as e:
+                print(f"Zerodha price fetch error for {len(chunk)} symbols: {e}")
+                continue
+            for key, quote in quotes.items():
+                if key in keys and quote.get('last_price'):
+                    for symbol in keys[key]:
+                        prices[symbol] = quote['last_price']
+        return prices
     
-    def init_truedata(self, symbols=None):
-        if self._truedata_initialized:
-            return True
-        
-        try:
-            from utils.truedata_client import TrueDataPriceFetcher
-            self._truedata_client = TrueDataPriceFetcher()
-            
-            if self._truedata_client.is_available():
-                if symbols:
-                    self._truedata_client.initialize(symbols)
-                self._truedata_initialized = True
-                return True
-        except Exception as e:
-            print(f"TrueData initialization failed: {e}")
-        
-        return False
+    def get_zerodha_price(self, symbol):
+        """Get live price from Zerodha Kite API"""
+        return self.get_zerodha_prices([symbol]).get(symbol)
     
     def get_live_price(self, symbol):
         """Get live price - Priority: Zerodha → TrueData → None (fallback to Yahoo)"""
-        zerodha_price = self.get_zerodha_price(symbol)
-        if zerodha_price:
-            return zerodha_price
-        
-        if self._truedata_client and self._truedata_initialized:
-            price = self._truedata_client.get_price(symbol)
-            if price:
-                return price
-        return None
+        return get_live_price_service().get_price(symbol)
+    
+    def get_live_prices(self, symbols):
+        """Get live prices for many symbols from the process-wide live price snapshot"""
+        return get_live_price_service().get_prices(symbols)
     
     def get_stock_symbol(self, stock_name):
         stock_name = stock_name.upper().strip()
@@ -419,8 +432,7 @@ class DataFetcher:
         
         nse_symbol = f"{stock_name}{self.nse_suffix}"
         try:
-            ticker = yf.Ticker(nse_symbol)
-            info = ticker.info
+            info = ticker_info(nse_symbol)
             if info and 'regularMarketPrice' in info:
                 return nse_symbol
         except:
@@ -428,8 +440,7 @@ class DataFetcher:
         
         bse_symbol = f"{stock_name}{self.bse_suffix}"
         try:
-            ticker = yf.Ticker(bse_symbol)
-            info = ticker.info
+            info = ticker_info(bse_symbol)
             if info and 'regularMarketPrice' in info:
                 return bse_symbol
         except:
@@ -445,13 +456,10 @@ class DataFetcher:
             buy_dt = pd.to_datetime(buy_date)
             fetch_start = buy_dt - pd.Timedelta(days=10)
             fetch_end = buy_dt + pd.Timedelta(days=10)
-            hist = _flatten_yf_columns(yf.download(symbol, start=fetch_start, end=fetch_end, progress=False))
+            hist = symbol_history_window(symbol, fetch_start, fetch_end).copy()
             if hist.empty:
                 return True, None, ""
 
-            if hasattr(hist.index, 'tz') and hist.index.tz is not None:
-                hist.index = hist.index.tz_localize(None)
-
             buy_date_normalized = buy_dt.normalize()
             exact = hist[hist.index.normalize() == buy_date_normalized]
             if not exact.empty:
@@ -487,15 +495,12 @@ class DataFetcher:
         live_price = self.get_live_price(symbol)
         
         try:
-            end_date = datetime.now()
-            
-            historical_data = _flatten_yf_columns(yf.download(symbol, start=start_date, end=end_date, progress=False))
-            
-            if hasattr(historical_data.index, 'tz') and historical_data.index.tz is not None:
-                historical_data.index = historical_data.index.tz_localize(None)
+            historical_data = quote_cache.get_history(symbol, start_date)
+            if historical_data is None or historical_data.empty:
+                historical_data = symbol_history(symbol, start_date)
             
             if historical_data.empty:
-                historical_data = _flatten_yf_columns(yf.download(symbol, period="1mo", progress=False))
+                historical_data = flatten_yf_columns(yf.download(symbol, period="1mo", progress=False))
                 if hasattr(historical_data.index, 'tz') and historical_data.index.tz is not None:
                     historical_data.index = historical_data.index.tz_localize(None)
             
@@ -545,21 +550,20 @@ class DataFetcher:
         if index_name not in self.indices:
             return pd.DataFrame()
         
-        symbol = self.indices[index_name]
-        
         try:
-            ticker = yf.Ticker(symbol)
-            end_date = datetime.now()
-            historical_data = ticker.history(start=start_date, end=end_date)
-            
-            if hasattr(historical_data.index, 'tz') and historical_data.index.tz is not None:
-                historical_data.index = historical_data.index.tz_localize(None)
-            
-            return historical_data
+            return index_history_store.histories(self.indices, start_date, [index_name])[index_name]
         except Exception as e:
             st.warning(f"Could not fetch index data for {index_name}: {str(e)}")
             return pd.DataFrame()
     
+    def get_index_histories(self, index_names, start_date):
+        """Histories of several indices from start_date, served from the shared index store"""
+        try:
+            return index_history_store.histories(self.indices, start_date, list(index_names))
+        except Exception as e:
+            st.warning(f"Could not fetch index data: {str(e)}")
+            return {}
+    
     def get_stock_category(self, stock_name):
         stock_name = stock_name.upper().strip()
         base_name = stock_name.replace(self.nse_suffix, '').replace(self.bse_suffix, '')
@@ -581,10 +585,8 @@ class DataFetcher:
             return 'Others'
         try:
             symbol = self.get_stock_symbol(stock_name)
-            ticker = yf.Ticker(symbol)
-            info = ticker.fast_info if hasattr(ticker, 'fast_info') else {}
             try:
-                info = ticker.info
+                info = ticker_info(symbol)
             except Exception:
                 self._sector_lookup_failed.add(base_name)
                 self._sector_mapping[base_name] = 'Others'
@@ -675,8 +677,7 @@ class DataFetcher:
         Returns yield as percentage (e.g. 2.5 means 2.5%)"""
         try:
             symbol = self.get_stock_symbol(stock_name)
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
+            info = ticker_info(symbol)
 
             dividend_rate = info.get('dividendRate', 0) or info.get('trailingAnnualDividendRate', 0)
 
@@ -720,8 +721,7 @@ class DataFetcher:
         """Get annual dividend per share in INR for a stock"""
         try:
             symbol = self.get_stock_symbol(stock_name)
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
+            info = ticker_info(symbol)
             dividend_rate = info.get('dividendRate', 0) or info.get('trailingAnnualDividendRate', 0)
             if dividend_rate and dividend_rate > 0:
                 return round(dividend_rate, 2)
@@ -743,8 +743,7 @@ class DataFetcher:
         """Get market capitalization for a stock from yfinance. Returns value in INR."""
         try:
             symbol = self.get_stock_symbol(stock_name)
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
+            info = ticker_info(symbol)
             market_cap = info.get('marketCap', 0)
             if market_cap and market_cap > 0:
                 return market_cap
@@ -779,6 +778,13 @@ class DataFetcher:
             return None
     
     def get_stock_fundamentals(self, stock_name):
+        try:
+            return fundamentals(self._fetch_stock_fundamentals, stock_name)
+        except Exception as e:
+            st.warning(f"Could not fetch fundamentals for {stock_name}: {str(e)}")
+            return {}
+    
+    def _fetch_stock_fundamentals(self, stock_name):
         symbol = self.get_stock_symbol(stock_name)
         base_name = stock_name.upper().strip().replace(self.nse_suffix, '').replace(self.bse_suffix, '')
         
@@ -802,29 +808,25 @@ class DataFetcher:
             except Exception as e:
                 print(f"Alpha Vantage fetch failed for {stock_name}: {e}")
         
-        try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
-            
-            fundamentals = {
-                'pe_ratio': info.get('forwardPE') or info.get('trailingPE'),
-                'pb_ratio': info.get('priceToBook'),
-                'market_cap': info.get('marketCap'),
-                'dividend_yield': info.get('dividendYield'),
-                'roe': info.get('returnOnEquity'),
-                'debt_to_equity': info.get('debtToEquity'),
-                'revenue_growth': info.get('revenueGrowth'),
-                'earnings_growth': info.get('earningsGrowth'),
-                'fifty_two_week_high': info.get('fiftyTwoWeekHigh'),
-                'fifty_two_week_low': info.get('fiftyTwoWeekLow'),
-                'source': 'yahoo_finance'
-            }
-            
-            return fundamentals
-            
-        except Exception as e:
-            st.warning(f"Could not fetch fundamentals for {stock_name}: {str(e)}")
-            return {}
+        info = ticker_info(symbol)
+        
+        yahoo_fundamentals = {
+            'pe_ratio': info.get('forwardPE') or info.get('trailingPE'),
+            'pb_ratio': info.get('priceToBook'),
+            'market_cap': info.get('marketCap'),
+            'dividend_yield': info.get('dividendYield'),
+            'roe': info.get('returnOnEquity'),
+            'debt_to_equity': info.get('debtToEquity'),
+            'revenue_growth': info.get('revenueGrowth'),
+            'earnings_growth': info.get('earningsGrowth'),
+            'fifty_two_week_high': info.get('fiftyTwoWeekHigh'),
+            'fifty_two_week_low': info.get('fiftyTwoWeekLow'),
+        }
+        if all(value is None for value in yahoo_fundamentals.values()):
+            # Raising keeps an all-empty result out of the per-day fundamentals cache
+            raise ValueError(f"No fundamentals available for {stock_name}")
+        yahoo_fundamentals['source'] = 'yahoo_finance'
+        return yahoo_fundamentals
     
     def add_stock_to_database(self, symbol, name=None, sector=None, category=None):
         if not self.use_database:
@@ -833,23 +835,23 @@ class DataFetcher:
         try:
             from utils.database import Database
             db = Database()
-            conn = db.get_connection()
-            cur = conn.cursor()
+            with db.get_connection() as conn:
+                cur = conn.cursor()
             
-            cur.execute('''
-                INSERT INTO stock_symbols (symbol, name, sector, category) 
-                VALUES (%s, %s, %s, %s) 
-                ON CONFLICT (symbol) DO UPDATE SET 
-                    name = COALESCE(EXCLUDED.name, stock_symbols.name),
-                    sector = COALESCE(EXCLUDED.sector, stock_symbols.sector),
-                    category = COALESCE(EXCLUDED.category, stock_symbols.category),
-                    updated_at = CURRENT_TIMESTAMP
-            ''', (symbol.upper(), name, sector, category))
+                cur.execute('''
+                    INSERT INTO stock_symbols (symbol, name, sector, category) 
+                    VALUES (%s, %s, %s, %s) 
+                    ON CONFLICT (symbol) DO UPDATE SET 
+                        name = COALESCE(EXCLUDED.name, stock_symbols.name),
+                        sector = COALESCE(EXCLUDED.sector, stock_symbols.sector),
+                        category = COALESCE(EXCLUDED.category, stock_symbols.category),
+                        updated_at = CURRENT_TIMESTAMP
+                ''', (symbol.upper(), name, sector, category))
             
-            conn.commit()
-            cur.close()
-            conn.close()
+                conn.commit()
+                cur.close()
             
+            reference_data.invalidate()
             self._symbol_aliases = None
             self._stock_categories = None
             self._sector_mapping = None
@@ -4,356 +4,443 @@ from psycopg2.extras import RealDictCursor
 from datetime import datetime
 import hashlib
 import secrets
-import time
+from utils.db_pool import get_pool
 
 class Database:
     def __init__(self):
         self.external_db_url = os.environ.get('EXTERNAL_DATABASE_URL')
         self.database_url = os.environ.get('DATABASE_URL')
-        self.max_retries = 3
-        self.retry_delay = 1
     
     def get_connection(self):
-        last_error = None
-        db_url = self.external_db_url if self.external_db_url else self.database_url
-        
-        for attempt in range(self.max_retries):
-            try:
-                conn = psycopg2.connect(
-                    db_url,
-                    connect_timeout=15,
-                    sslmode='require'
-                )
-                return conn
-            except psycopg2.OperationalError as e:
-                last_error = e
-                if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay * (attempt + 1))
-                continue
-        raise last_error if last_error else Exception("Failed to connect to database")
+        """Check out a connection from the process-wide pool.
+
+        Use as a context manager (commit on success, rollback on error), or call
+        close() to hand the connection back to the pool.
+        """
+        return get_pool(self.external_db_url or self.database_url).getconn()
     
     def init_tables(self):
-        conn = self.get_connection()
-        cur = conn.cursor()
+        with self.get_connection() as conn:
+            cur = conn.cursor()
         
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                email VARCHAR(255) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                full_name VARCHAR(255),
-                phone VARCHAR(20),
-                is_admin BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_login TIMESTAMP
-            )
-        ''')
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id SERIAL PRIMARY KEY,
+                    email VARCHAR(255) UNIQUE NOT NULL,
+                    password_hash VARCHAR(255) NOT NULL,
+                    full_name VARCHAR(255),
+                    phone VARCHAR(20),
+                    is_admin BOOLEAN DEFAULT FALSE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_login TIMESTAMP
+                )
+            ''')
         
-        cur.execute('''
-            ALTER TABLE users ADD COLUMN IF NOT EXISTS is_admin BOOLEAN DEFAULT FALSE
-        ''')
+            cur.execute('''
+                ALTER TABLE users ADD COLUMN IF NOT EXISTS is_admin BOOLEAN DEFAULT FALSE
+            ''')
         
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS portfolio_history (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id),
-                file_name VARCHAR(255),
-                stock_count INTEGER,
-                total_investment DECIMAL(15,2),
-                current_value DECIMAL(15,2),
-                total_gain_loss DECIMAL(15,2),
-                stocks_data JSONB,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS portfolio_history (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER REFERENCES users(id),
+                    file_name VARCHAR(255),
+                    stock_count INTEGER,
+                    total_investment DECIMAL(15,2),
+                    current_value DECIMAL(15,2),
+                    total_gain_loss DECIMAL(15,2),
+                    stocks_data JSONB,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
         
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS user_activity (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id),
-                activity_type VARCHAR(50),
-                details VARCHAR(255),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS user_activity (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER REFERENCES users(id),
+                    activity_type VARCHAR(50),
+                    details VARCHAR(255),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+        
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS stock_symbols (
+                    id SERIAL PRIMARY KEY,
+                    symbol VARCHAR(50) UNIQUE NOT NULL,
+                    name VARCHAR(255),
+                    sector VARCHAR(100),
+                    category VARCHAR(50),
+                    exchange VARCHAR(10) DEFAULT 'NSE',
+                    is_active BOOLEAN DEFAULT TRUE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+        
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS symbol_aliases (
+                    id SERIAL PRIMARY KEY,
+                    alias VARCHAR(50) UNIQUE NOT NULL,
+                    symbol VARCHAR(50) NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+        
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS market_indices (
+                    id SERIAL PRIMARY KEY,
+                    name VARCHAR(100) UNIQUE NOT NULL,
+                    symbol VARCHAR(50) NOT NULL,
+                    description VARCHAR(255),
+                    is_active BOOLEAN DEFAULT TRUE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+        
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS sectors (
+                    id SERIAL PRIMARY KEY,
+                    name VARCHAR(100) UNIQUE NOT NULL,
+                    description VARCHAR(255),
+                    target_allocation DECIMAL(5,2) DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
         
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS alternative_stocks (
+                    id SERIAL PRIMARY KEY,
+                    sector VARCHAR(100) NOT NULL,
+                    symbol VARCHAR(50) NOT NULL,
+                    priority INTEGER DEFAULT 1,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(sector, symbol)
+                )
+            ''')
+        
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS rebalancing_strategies (
+                    id SERIAL PRIMARY KEY,
+                    name VARCHAR(100) UNIQUE NOT NULL,
+                    description VARCHAR(255),
+                    large_cap_target DECIMAL(5,2),
+                    mid_cap_target DECIMAL(5,2),
+                    small_cap_target DECIMAL(5,2),
+                    is_active BOOLEAN DEFAULT TRUE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+        
+            # Keyset pagination on (created_at, id) and per-user lookups for the admin panel
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_users_created_at_id ON users (created_at DESC, id DESC)")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_portfolio_history_created_at_id ON portfolio_history (created_at DESC, id DESC)")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_portfolio_history_user_id ON portfolio_history (user_id)")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_user_activity_created_at_id ON user_activity (created_at DESC, id DESC)")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_user_activity_user_id ON user_activity (user_id)")
+        
+            self._init_admin_stats(cur)
+        
+            conn.commit()
+            cur.close()
+    
+    def _init_admin_stats(self, cur):
+        """Create trigger-maintained counters behind get_admin_stats and backfill them once"""
         cur.execute('''
-            CREATE TABLE IF NOT EXISTS stock_symbols (
-                id SERIAL PRIMARY KEY,
-                symbol VARCHAR(50) UNIQUE NOT NULL,
-                name VARCHAR(255),
-                sector VARCHAR(100),
-                category VARCHAR(50),
-                exchange VARCHAR(10) DEFAULT 'NSE',
-                is_active BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CREATE TABLE IF NOT EXISTS admin_stats (
+                id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                total_users BIGINT NOT NULL DEFAULT 0,
+                total_analyses BIGINT NOT NULL DEFAULT 0,
+                active_users BIGINT NOT NULL DEFAULT 0,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
         
         cur.execute('''
-            CREATE TABLE IF NOT EXISTS symbol_aliases (
-                id SERIAL PRIMARY KEY,
-                alias VARCHAR(50) UNIQUE NOT NULL,
-                symbol VARCHAR(50) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            CREATE TABLE IF NOT EXISTS admin_active_users (
+                user_id INTEGER PRIMARY KEY
             )
         ''')
         
         cur.execute('''
-            CREATE TABLE IF NOT EXISTS market_indices (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(100) UNIQUE NOT NULL,
-                symbol VARCHAR(50) NOT NULL,
-                description VARCHAR(255),
-                is_active BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
+            CREATE OR REPLACE FUNCTION admin_stats_users_trigger() RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    UPDATE admin_stats SET total_users = total_users + 1, updated_at = NOW() WHERE id = 1;
+                ELSIF TG_OP = 'DELETE' THEN
+                    UPDATE admin_stats SET total_users = total_users - 1, updated_at = NOW() WHERE id = 1;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
         ''')
         
         cur.execute('''
-            CREATE TABLE IF NOT EXISTS sectors (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(100) UNIQUE NOT NULL,
-                description VARCHAR(255),
-                target_allocation DECIMAL(5,2) DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
+            CREATE OR REPLACE FUNCTION admin_stats_history_trigger() RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    UPDATE admin_stats SET total_analyses = total_analyses + 1, updated_at = NOW() WHERE id = 1;
+                    IF NEW.user_id IS NOT NULL THEN
+                        INSERT INTO admin_active_users (user_id) VALUES (NEW.user_id) ON CONFLICT DO NOTHING;
+                        IF FOUND THEN
+                            UPDATE admin_stats SET active_users = active_users + 1 WHERE id = 1;
+                        END IF;
+                    END IF;
+                ELSIF TG_OP = 'DELETE' THEN
+                    UPDATE admin_stats SET total_analyses = total_analyses - 1, updated_at = NOW() WHERE id = 1;
+                    IF OLD.user_id IS NOT NULL AND NOT EXISTS (
+                        SELECT 1 FROM portfolio_history WHERE user_id = OLD.user_id
+                    ) THEN
+                        DELETE FROM admin_active_users WHERE user_id = OLD.user_id;
+                        IF FOUND THEN
+                            UPDATE admin_stats SET active_users = active_users - 1 WHERE id = 1;
+                        END IF;
+                    END IF;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
         ''')
         
         cur.execute('''
-            CREATE TABLE IF NOT EXISTS alternative_stocks (
-                id SERIAL PRIMARY KEY,
-                sector VARCHAR(100) NOT NULL,
-                symbol VARCHAR(50) NOT NULL,
-                priority INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(sector, symbol)
-            )
+            DO $$
+            BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_users_admin_stats') THEN
+                    CREATE TRIGGER trg_users_admin_stats AFTER INSERT OR DELETE ON users
+                    FOR EACH ROW EXECUTE FUNCTION admin_stats_users_trigger();
+                END IF;
+                IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_portfolio_history_admin_stats') THEN
+                    CREATE TRIGGER trg_portfolio_history_admin_stats AFTER INSERT OR DELETE ON portfolio_history
+                    FOR EACH ROW EXECUTE FUNCTION admin_stats_history_trigger();
+                END IF;
+            END
+            $$
         ''')
         
+        cur.execute("SELECT 1 FROM admin_stats WHERE id = 1")
+        if cur.fetchone() is None:
+            self._backfill_admin_stats(cur)
+    
+    def _backfill_admin_stats(self, cur):
+        cur.execute("LOCK TABLE users, portfolio_history IN SHARE MODE")
+        cur.execute("DELETE FROM admin_active_users")
+        cur.execute("INSERT INTO admin_active_users (user_id) SELECT DISTINCT user_id FROM portfolio_history WHERE user_id IS NOT NULL ON CONFLICT DO NOTHING")
         cur.execute('''
-            CREATE TABLE IF NOT EXISTS rebalancing_strategies (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(100) UNIQUE NOT NULL,
-                description VARCHAR(255),
-                large_cap_target DECIMAL(5,2),
-                mid_cap_target DECIMAL(5,2),
-                small_cap_target DECIMAL(5,2),
-                is_active BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
+            INSERT INTO admin_stats (id, total_users, total_analyses, active_users, updated_at)
+            VALUES (1, (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM portfolio_history),
+                    (SELECT COUNT(*) FROM admin_active_users), NOW())
+            ON CONFLICT (id) DO UPDATE SET
+                total_users = EXCLUDED.total_users,
+                total_analyses = EXCLUDED.total_analyses,
+                active_users = EXCLUDED.active_users,
+                updated_at = EXCLUDED.updated_at
         ''')
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+    
+    def refresh_admin_stats(self):
+        """Recount the admin counters from the base tables (repair after manual data fixes)"""
+        with self.get_connection() as conn:
+            cur = conn.cursor()
+            self._backfill_admin_stats(cur)
+            cur.close()
     
     def seed_initial_data(self):
-        conn = self.get_connection()
-        cur = conn.cursor()
+        with self.get_connection() as conn:
+            cur = conn.cursor()
         
-        cur.execute("SELECT COUNT(*) FROM stock_symbols")
-        if cur.fetchone()[0] == 0:
-            stocks = [
-                ('RELIANCE', 'Reliance Industries Ltd', 'Energy', 'Large Cap', 'NSE'),
-                ('TCS', 'Tata Consultancy Services', 'Technology', 'Large Cap', 'NSE'),
-                ('HDFCBANK', 'HDFC Bank Ltd', 'Banking', 'Large Cap', 'NSE'),
-                ('INFY', 'Infosys Ltd', 'Technology', 'Large Cap', 'NSE'),
-                ('ICICIBANK', 'ICICI Bank Ltd', 'Banking', 'Large Cap', 'NSE'),
-                ('KOTAKBANK', 'Kotak Mahindra Bank', 'Banking', 'Large Cap', 'NSE'),
-                ('HINDUNILVR', 'Hindustan Unilever', 'FMCG', 'Large Cap', 'NSE'),
-                ('SBIN', 'State Bank of India', 'Banking', 'Large Cap', 'NSE'),
-                ('BHARTIARTL', 'Bharti Airtel Ltd', 'Telecom', 'Large Cap', 'NSE'),
-                ('ITC', 'ITC Ltd', 'FMCG', 'Large Cap', 'NSE'),
-                ('ASIANPAINT', 'Asian Paints Ltd', 'Paints', 'Large Cap', 'NSE'),
-                ('MARUTI', 'Maruti Suzuki India', 'Automobile', 'Large Cap', 'NSE'),
-                ('AXISBANK', 'Axis Bank Ltd', 'Banking', 'Large Cap', 'NSE'),
-                ('LT', 'Larsen & Toubro', 'Construction', 'Large Cap', 'NSE'),
-                ('SUNPHARMA', 'Sun Pharmaceutical', 'Pharmaceuticals', 'Large Cap', 'NSE'),
-                ('TITAN', 'Titan Company Ltd', 'Jewellery', 'Large Cap', 'NSE'),
-                ('ULTRACEMCO', 'UltraTech Cement', 'Cement', 'Large Cap', 'NSE'),
-                ('NESTLEIND', 'Nestle India Ltd', 'FMCG', 'Large Cap', 'NSE'),
-                ('WIPRO', 'Wipro Ltd', 'Technology', 'Large Cap', 'NSE'),
-                ('HCLTECH', 'HCL Technologies', 'Technology', 'Large Cap', 'NSE'),
-                ('BAJFINANCE', 'Bajaj Finance Ltd', 'Finance', 'Large Cap', 'NSE'),
-                ('BAJAJFINSV', 'Bajaj Finserv Ltd', 'Finance', 'Large Cap', 'NSE'),
-                ('ADANIENT', 'Adani Enterprises', 'Conglomerate', 'Large Cap', 'NSE'),
-                ('ADANIPORTS', 'Adani Ports', 'Infrastructure', 'Large Cap', 'NSE'),
-                ('ONGC', 'Oil & Natural Gas Corp', 'Energy', 'Large Cap', 'NSE'),
-                ('NTPC', 'NTPC Ltd', 'Power', 'Large Cap', 'NSE'),
-                ('POWERGRID', 'Power Grid Corp', 'Power', 'Large Cap', 'NSE'),
-                ('TATAMOTORS', 'Tata Motors Ltd', 'Automobile', 'Large Cap', 'NSE'),
-                ('TATAPOWER', 'Tata Power Company', 'Power', 'Mid Cap', 'NSE'),
-                ('TATASTEEL', 'Tata Steel Ltd', 'Metals', 'Large Cap', 'NSE'),
-                ('TECHM', 'Tech Mahindra Ltd', 'Technology', 'Large Cap', 'NSE'),
-                ('DRREDDY', 'Dr Reddys Labs', 'Pharmaceuticals', 'Large Cap', 'NSE'),
-                ('CIPLA', 'Cipla Ltd', 'Pharmaceuticals', 'Large Cap', 'NSE'),
-                ('LUPIN', 'Lupin Ltd', 'Pharmaceuticals', 'Mid Cap', 'NSE'),
-                ('BRITANNIA', 'Britannia Industries', 'FMCG', 'Large Cap', 'NSE'),
-                ('IOC', 'Indian Oil Corp', 'Energy', 'Large Cap', 'NSE'),
-                ('BPCL', 'Bharat Petroleum', 'Energy', 'Large Cap', 'NSE'),
-                ('BAJAJ-AUTO', 'Bajaj Auto Ltd', 'Automobile', 'Large Cap', 'NSE'),
-                ('M&M', 'Mahindra & Mahindra', 'Automobile', 'Large Cap', 'NSE'),
-            ]
+            cur.execute("SELECT COUNT(*) FROM stock_symbols")
+            if cur.fetchone()[0] == 0:
+                stocks = [
+                    ('RELIANCE', 'Reliance Industries Ltd', 'Energy', 'Large Cap', 'NSE'),
+                    ('TCS', 'Tata Consultancy Services', 'Technology', 'Large Cap', 'NSE'),
+                    ('HDFCBANK', 'HDFC Bank Ltd', 'Banking', 'Large Cap', 'NSE'),
+                    ('INFY', 'Infosys Ltd', 'Technology', 'Large Cap', 'NSE'),
+                    ('ICICIBANK', 'ICICI Bank Ltd', 'Banking', 'Large Cap', 'NSE'),
+                    ('KOTAKBANK', 'Kotak Mahindra Bank', 'Banking', 'Large Cap', 'NSE'),
+                    ('HINDUNILVR', 'Hindustan Unilever', 'FMCG', 'Large Cap', 'NSE'),
+                    ('SBIN', 'State Bank of India', 'Banking', 'Large Cap', 'NSE'),
+                    ('BHARTIARTL', 'Bharti Airtel Ltd', 'Telecom', 'Large Cap', 'NSE'),
+                    ('ITC', 'ITC Ltd', 'FMCG', 'Large Cap', 'NSE'),
+                    ('ASIANPAINT', 'Asian Paints Ltd', 'Paints', 'Large Cap', 'NSE'),
+                    ('MARUTI', 'Maruti Suzuki India', 'Automobile', 'Large Cap', 'NSE'),
+                    ('AXISBANK', 'Axis Bank Ltd', 'Banking', 'Large Cap', 'NSE'),
+                    ('LT', 'Larsen & Toubro', 'Construction', 'Large Cap', 'NSE'),
+                    ('SUNPHARMA', 'Sun Pharmaceutical', 'Pharmaceuticals', 'Large Cap', 'NSE'),
+                    ('TITAN', 'Titan Company Ltd', 'Jewellery', 'Large Cap', 'NSE'),
+                    ('ULTRACEMCO', 'UltraTech Cement', 'Cement', 'Large Cap', 'NSE'),
+                    ('NESTLEIND', 'Nestle India Ltd', 'FMCG', 'Large Cap', 'NSE'),
+                    ('WIPRO', 'Wipro Ltd', 'Technology', 'Large Cap', 'NSE'),
+                    ('HCLTECH', 'HCL Technologies', 'Technology', 'Large Cap', 'NSE'),
+                    ('BAJFINANCE', 'Bajaj Finance Ltd', 'Finance', 'Large Cap', 'NSE'),
+                    ('BAJAJFINSV', 'Bajaj Finserv Ltd', 'Finance', 'Large Cap', 'NSE'),
+                    ('ADANIENT', 'Adani Enterprises', 'Conglomerate', 'Large Cap', 'NSE'),
+                    ('ADANIPORTS', 'Adani Ports', 'Infrastructure', 'Large Cap', 'NSE'),
+                    ('ONGC', 'Oil & Natural Gas Corp', 'Energy', 'Large Cap', 'NSE'),
+                    ('NTPC', 'NTPC Ltd', 'Power', 'Large Cap', 'NSE'),
+                    ('POWERGRID', 'Power Grid Corp', 'Power', 'Large Cap', 'NSE'),
+                    ('TATAMOTORS', 'Tata Motors Ltd', 'Automobile', 'Large Cap', 'NSE'),
+                    ('TATAPOWER', 'Tata Power Company', 'Power', 'Mid Cap', 'NSE'),
+                    ('TATASTEEL', 'Tata Steel Ltd', 'Metals', 'Large Cap', 'NSE'),
+                    ('TECHM', 'Tech Mahindra Ltd', 'Technology', 'Large Cap', 'NSE'),
+                    ('DRREDDY', 'Dr Reddys Labs', 'Pharmaceuticals', 'Large Cap', 'NSE'),
+                    ('CIPLA', 'Cipla Ltd', 'Pharmaceuticals', 'Large Cap', 'NSE'),
+                    ('LUPIN', 'Lupin Ltd', 'Pharmaceuticals', 'Mid Cap', 'NSE'),
+                    ('BRITANNIA', 'Britannia Industries', 'FMCG', 'Large Cap', 'NSE'),
+                    ('IOC', 'Indian Oil Corp', 'Energy', 'Large Cap', 'NSE'),
+                    ('BPCL', 'Bharat Petroleum', 'Energy', 'Large Cap', 'NSE'),
+                    ('BAJAJ-AUTO', 'Bajaj Auto Ltd', 'Automobile', 'Large Cap', 'NSE'),
+                    ('M&M', 'Mahindra & Mahindra', 'Automobile', 'Large Cap', 'NSE'),
+                ]
             
-            for stock in stocks:
-                cur.execute('''
-                    INSERT INTO stock_symbols (symbol, name, sector, category, exchange) 
-                    VALUES (%s, %s, %s, %s, %s) ON CONFLICT (symbol) DO NOTHING
-                ''', stock)
+                for stock in stocks:
+                    cur.execute('''
+                        INSERT INTO stock_symbols (symbol, name, sector, category, exchange) 
+                        VALUES (%s, %s, %s, %s, %s) ON CONFLICT (symbol) DO NOTHING
+                    ''', stock)
         
-        cur.execute("SELECT COUNT(*) FROM symbol_aliases")
-        if cur.fetchone()[0] == 0:
-            aliases = [
-                ('RIL', 'RELIANCE'),
-                ('ICICI', 'ICICIBANK'),
-                ('HDFC', 'HDFCBANK'),
-                ('KOTAK', 'KOTAKBANK'),
-                ('SBI', 'SBIN'),
-                ('BHARTI', 'BHARTIARTL'),
-                ('HINDUNILEVER', 'HINDUNILVR'),
-                ('HUL', 'HINDUNILVR'),
-                ('ADANI', 'ADANIENT'),
-            ]
+            cur.execute("SELECT COUNT(*) FROM symbol_aliases")
+            if cur.fetchone()[0] == 0:
+                aliases = [
+                    ('RIL', 'RELIANCE'),
+                    ('ICICI', 'ICICIBANK'),
+                    ('HDFC', 'HDFCBANK'),
+                    ('KOTAK', 'KOTAKBANK'),
+                    ('SBI', 'SBIN'),
+                    ('BHARTI', 'BHARTIARTL'),
+                    ('HINDUNILEVER', 'HINDUNILVR'),
+                    ('HUL', 'HINDUNILVR'),
+                    ('ADANI', 'ADANIENT'),
+                ]
             
-            for alias, symbol in aliases:
-                cur.execute('''
-                    INSERT INTO symbol_aliases (alias, symbol) 
-                    VALUES (%s, %s) ON CONFLICT (alias) DO NOTHING
-                ''', (alias, symbol))
+                for alias, symbol in aliases:
+                    cur.execute('''
+                        INSERT INTO symbol_aliases (alias, symbol) 
+                        VALUES (%s, %s) ON CONFLICT (alias) DO NOTHING
+                    ''', (alias, symbol))
         
-        cur.execute("SELECT COUNT(*) FROM market_indices")
-        if cur.fetchone()[0] == 0:
-            indices = [
-                ('NIFTY50', '^NSEI', 'NSE Nifty 50 Index'),
-                ('NIFTY_MIDCAP_100', '^NSEMDCP50', 'NSE Nifty Midcap 100 Index'),
-                ('NIFTY_SMALLCAP_100', '^NSESMLCAP', 'NSE Nifty Smallcap 100 Index'),
-                ('SENSEX', '^BSESN', 'BSE Sensex Index'),
-            ]
+            cur.execute("SELECT COUNT(*) FROM market_indices")
+            if cur.fetchone()[0] == 0:
+                indices = [
+                    ('NIFTY50', '^NSEI', 'NSE Nifty 50 Index'),
+                    ('NIFTY_MIDCAP_100', '^NSEMDCP50', 'NSE Nifty Midcap 100 Index'),
+                    ('NIFTY_SMALLCAP_100', '^NSESMLCAP', 'NSE Nifty Smallcap 100 Index'),
+                    ('SENSEX', '^BSESN', 'BSE Sensex Index'),
+                ]
             
-            for name, symbol, desc in indices:
-                cur.execute('''
-                    INSERT INTO market_indices (name, symbol, description) 
-                    VALUES (%s, %s, %s) ON CONFLICT (name) DO NOTHING
-                ''', (name, symbol, desc))
+                for name, symbol, desc in indices:
+                    cur.execute('''
+                        INSERT INTO market_indices (name, symbol, description) 
+                        VALUES (%s, %s, %s) ON CONFLICT (name) DO NOTHING
+                    ''', (name, symbol, desc))
         
-        cur.execute("SELECT COUNT(*) FROM sectors")
-        if cur.fetchone()[0] == 0:
-            sectors = [
-                ('Banking', 'Financial sector including banks', 15),
-                ('Technology', 'IT and software services', 15),
-                ('Energy', 'Oil, gas and energy companies', 10),
-                ('FMCG', 'Fast moving consumer goods', 10),
-                ('Pharmaceuticals', 'Healthcare and pharma', 10),
-                ('Automobile', 'Auto manufacturers', 10),
-                ('Telecom', 'Telecommunications', 5),
-                ('Construction', 'Infrastructure and construction', 5),
-                ('Paints', 'Paint and coatings', 3),
-                ('Jewellery', 'Gems and jewellery', 3),
-                ('Cement', 'Cement manufacturers', 4),
-                ('Metals', 'Steel and metals', 5),
-                ('Power', 'Power generation and distribution', 5),
-            ]
+            cur.execute("SELECT COUNT(*) FROM sectors")
+            if cur.fetchone()[0] == 0:
+                sectors = [
+                    ('Banking', 'Financial sector including banks', 15),
+                    ('Technology', 'IT and software services', 15),
+                    ('Energy', 'Oil, gas and energy companies', 10),
+                    ('FMCG', 'Fast moving consumer goods', 10),
+                    ('Pharmaceuticals', 'Healthcare and pharma', 10),
+                    ('Automobile', 'Auto manufacturers', 10),
+                    ('Telecom', 'Telecommunications', 5),
+                    ('Construction', 'Infrastructure and construction', 5),
+                    ('Paints', 'Paint and coatings', 3),
+                    ('Jewellery', 'Gems and jewellery', 3),
+                    ('Cement', 'Cement manufacturers', 4),
+                    ('Metals', 'Steel and metals', 5),
+                    ('Power', 'Power generation and distribution', 5),
+                ]
             
-            for name, desc, target in sectors:
-                cur.execute('''
-                    INSERT INTO sectors (name, description, target_allocation) 
-                    VALUES (%s, %s, %s) ON CONFLICT (name) DO NOTHING
-                ''', (name, desc, target))
+                for name, desc, target in sectors:
+                    cur.execute('''
+                        INSERT INTO sectors (name, description, target_allocation) 
+                        VALUES (%s, %s, %s) ON CONFLICT (name) DO NOTHING
+                    ''', (name, desc, target))
         
-        cur.execute("SELECT COUNT(*) FROM alternative_stocks")
-        if cur.fetchone()[0] == 0:
-            alternatives = [
-                ('Banking', 'HDFCBANK', 1), ('Banking', 'ICICIBANK', 2), ('Banking', 'KOTAKBANK', 3), ('Banking', 'SBIN', 4), ('Banking', 'AXISBANK', 5),
-                ('Technology', 'TCS', 1), ('Technology', 'INFY', 2), ('Technology', 'WIPRO', 3), ('Technology', 'HCLTECH', 4), ('Technology', 'TECHM', 5),
-                ('Energy', 'RELIANCE', 1), ('Energy', 'ONGC', 2), ('Energy', 'IOC', 3), ('Energy', 'BPCL', 4),
-                ('FMCG', 'HINDUNILVR', 1), ('FMCG', 'ITC', 2), ('FMCG', 'NESTLEIND', 3), ('FMCG', 'BRITANNIA', 4),
-                ('Automobile', 'MARUTI', 1), ('Automobile', 'TATAMOTORS', 2), ('Automobile', 'BAJAJ-AUTO', 3), ('Automobile', 'M&M', 4),
-                ('Pharmaceuticals', 'SUNPHARMA', 1), ('Pharmaceuticals', 'DRREDDY', 2), ('Pharmaceuticals', 'CIPLA', 3), ('Pharmaceuticals', 'LUPIN', 4),
-            ]
+            cur.execute("SELECT COUNT(*) FROM alternative_stocks")
+            if cur.fetchone()[0] == 0:
+                alternatives = [
+                    ('Banking', 'HDFCBANK', 1), ('Banking', 'ICICIBANK', 2), ('Banking', 'KOTAKBANK', 3), ('Banking', 'SBIN', 4), ('Banking', 'AXISBANK', 5),
+                    ('Technology', 'TCS', 1), ('Technology', 'INFY', 2), ('Technology', 'WIPRO', 3), ('Technology', 'HCLTECH', 4), ('Technology', 'TECHM', 5),
+                    ('Energy', 'RELIANCE', 1), ('Energy', 'ONGC', 2), ('Energy', 'IOC', 3), ('Energy', 'BPCL', 4),
+                    ('FMCG', 'HINDUNILVR', 1), ('FMCG', 'ITC', 2), ('FMCG', 'NESTLEIND', 3), ('FMCG', 'BRITANNIA', 4),
+                    ('Automobile', 'MARUTI', 1), ('Automobile', 'TATAMOTORS', 2), ('Automobile', 'BAJAJ-AUTO', 3), ('Automobile', 'M&M', 4),
+                    ('Pharmaceuticals', 'SUNPHARMA', 1), ('Pharmaceuticals', 'DRREDDY', 2), ('Pharmaceuticals', 'CIPLA', 3), ('Pharmaceuticals', 'LUPIN', 4),
+                ]
             
-            for sector, symbol, priority in alternatives:
-                cur.execute('''
-                    INSERT INTO alternative_stocks (sector, symbol, priority) 
-                    VALUES (%s, %s, %s) ON CONFLICT (sector, symbol) DO NOTHING
-                ''', (sector, symbol, priority))
+                for sector, symbol, priority in alternatives:
+                    cur.execute('''
+                        INSERT INTO alternative_stocks (sector, symbol, priority) 
+                        VALUES (%s, %s, %s) ON CONFLICT (sector, symbol) DO NOTHING
+                    ''', (sector, symbol, priority))
         
-        cur.execute("SELECT COUNT(*) FROM rebalancing_strategies")
-        if cur.fetchone()[0] == 0:
-            strategies = [
-                ('Conservative', 'Low risk strategy for capital preservation', 70, 20, 10),
-                ('Balanced', 'Balanced approach for moderate growth', 50, 30, 20),
-                ('Aggressive', 'High risk strategy for maximum growth', 30, 40, 30),
-            ]
+            cur.execute("SELECT COUNT(*) FROM rebalancing_strategies")
+            if cur.fetchone()[0] == 0:
+                strategies = [
+                    ('Conservative', 'Low risk strategy for capital preservation', 70, 20, 10),
+                    ('Balanced', 'Balanced approach for moderate growth', 50, 30, 20),
+                    ('Aggressive', 'High risk strategy for maximum growth', 30, 40, 30),
+                ]
             
-            for name, desc, large, mid, small in strategies:
-                cur.execute('''
-                    INSERT INTO rebalancing_strategies (name, description, large_cap_target, mid_cap_target, small_cap_target) 
-                    VALUES (%s, %s, %s, %s, %s) ON CONFLICT (name) DO NOTHING
-                ''', (name, desc, large, mid, small))
+                for name, desc, large, mid, small in strategies:
+                    cur.execute('''
+                        INSERT INTO rebalancing_strategies (name, description, large_cap_target, mid_cap_target, small_cap_target) 
+                        VALUES (%s, %s, %s, %s, %s) ON CONFLICT (name) DO NOTHING
+                    ''', (name, desc, large, mid, small))
         
-        conn.commit()
-        cur.close()
-        conn.close()
+            conn.commit()
+            cur.close()
     
     def get_stock_symbols(self):
-        conn = self.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT symbol, name, sector, category FROM stock_symbols WHERE is_active = TRUE")
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
+        with self.get_connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("SELECT symbol, name, sector, category FROM stock_symbols WHERE is_active = TRUE")
+            results = cur.fetchall()
+            cur.close()
         return {row['symbol']: {'name': row['name'], 'sector': row['sector'], 'category': row['category']} for row in results}
     
     def get_symbol_aliases(self):
-        conn = self.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT alias, symbol FROM symbol_aliases")
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
+        with self.get_connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("SELECT alias, symbol FROM symbol_aliases")
+            results = cur.fetchall()
+            cur.close()
         return {row['alias']: row['symbol'] for row in results}
     
     def get_isin_mappings(self):
         """Get ISIN to stock symbol mappings"""
-        conn = self.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        try:
-            cur.execute("SELECT isin, symbol, company_name FROM isin_mappings")
-            results = cur.fetchall()
-            return {row['isin']: {'symbol': row['symbol'], 'name': row['company_name']} for row in results}
-        except Exception:
-            return {}
-        finally:
-            cur.close()
-            conn.close()
+        with self.get_connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            try:
+                cur.execute("SELECT isin, symbol, company_name FROM isin_mappings")
+                results = cur.fetchall()
+                return {row['isin']: {'symbol': row['symbol'], 'name': row['company_name']} for row in results}
+            except Exception:
+                return {}
+            finally:
+                cur.close()
     
     def get_market_indices(self):
-        conn = self.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT name, symbol FROM market_indices WHERE is_active = TRUE")
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
+        with self.get_connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("SELECT name, symbol FROM market_indices WHERE is_active = TRUE")
+            results = cur.fetchall()
+            cur.close()
         return {row['name']: row['symbol'] for row in results}
     
     def get_sectors(self):
-        conn = self.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT name, target_allocation FROM sectors")
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
+        with self.get_connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("SELECT name, target_allocation FROM sectors")
+            results = cur.fetchall()
+            cur.close()
         return {row['name']: float(row['target_allocation']) for row in results}
     
     def get_alternative_stocks(self):
-        conn = self.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT sector, symbol FROM alternative_stocks ORDER BY sector, priority")
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
+        with self.get_connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("SELECT sector, symbol FROM alternative_stocks ORDER BY sector, priority")
+            results = cur.fetchall()
+            cur.close()
         
         alternatives = {}
         for row in results:
@@ -364,12 +451,11 @@ class Database:
         return alternatives
     
     def get_rebalancing_strategies(self):
-        conn = self.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT name, large_cap_target, mid_cap_target, small_cap_target FROM rebalancing_strategies WHERE is_active = TRUE")
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
+        with self.get_connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("SELECT name, large_cap_target, mid_cap_target, small_cap_target FROM rebalancing_strategies WHERE is_active = TRUE")
+            results = cur.fetchall()
+            cur.close()
         
         return {row['name']: {
             'Large Cap': float(row['large_cap_target']),
@@ -380,15 +466,14 @@ class Database:
     def save_portfolio_history(self, user_id, file_name, stock_count, total_investment, current_value, total_gain_loss, stocks_data):
         try:
             import json
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute('''
-                INSERT INTO portfolio_history (user_id, file_name, stock_count, total_investment, current_value, total_gain_loss, stocks_data)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ''', (user_id, file_name, stock_count, total_investment, current_value, total_gain_loss, json.dumps(stocks_data)))
-            conn.commit()
-            cur.close()
-            conn.close()
+            with self.get_connection() as conn:
+                cur = conn.cursor()
+                cur.execute('''
+                    INSERT INTO portfolio_history (user_id, file_name, stock_count, total_investment, current_value, total_gain_loss, stocks_data)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ''', (user_id, file_name, stock_count, total_investment, current_value, total_gain_loss, json.dumps(stocks_data)))
+                conn.commit()
+                cur.close()
             return True
         except Exception as e:
             print(f"Error saving portfolio history: {e}")
@@ -396,104 +481,176 @@ class Database:
     
     def log_activity(self, user_id, activity_type, details=None):
         try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute('''
-                INSERT INTO user_activity (user_id, activity_type, details)
-                VALUES (%s, %s, %s)
-            ''', (user_id, activity_type, details))
-            conn.commit()
-            cur.close()
-            conn.close()
+            with self.get_connection() as conn:
+                cur = conn.cursor()
+                cur.execute('''
+                    INSERT INTO user_activity (user_id, activity_type, details)
+                    VALUES (%s, %s, %s)
+                ''', (user_id, activity_type, details))
+                conn.commit()
+                cur.close()
             return True
         except Exception as e:
             print(f"Error logging activity: {e}")
             return False
     
+    def get_most_held_stocks(self, limit=100, days=90):
+        """Stock names held by the most distinct users in recently analysed portfolios"""
+        with self.get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT s->>'name' AS name, COUNT(DISTINCT ph.user_id) AS holders
+                FROM portfolio_history ph
+                CROSS JOIN LATERAL jsonb_array_elements(
+                    CASE WHEN jsonb_typeof(ph.stocks_data) = 'array' THEN ph.stocks_data ELSE '[]'::jsonb END
+                ) AS s
+                WHERE ph.created_at > NOW() - make_interval(days => %s)
+                GROUP BY 1
+                HAVING s->>'name' IS NOT NULL
+                ORDER BY holders DESC
+                LIMIT %s
+            ''', (days, limit))
+            results = [row[0] for row in cur.fetchall()]
+            cur.close()
+        return results
+    
     def get_all_users(self):
-        conn = self.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute('''
-            SELECT id, email, full_name, phone, is_admin, created_at, last_login 
-            FROM users ORDER BY created_at DESC
-        ''')
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
+        with self.get_connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute('''
+                SELECT id, email, full_name, phone, is_admin, created_at, last_login 
+                FROM users ORDER BY created_at DESC
+            ''')
+            results = cur.fetchall()
+            cur.close()
         return results
     
     def get_all_portfolio_history(self):
-        conn = self.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute('''
-            SELECT ph.*, u.email, u.full_name 
-            FROM portfolio_history ph
-            JOIN users u ON ph.user_id = u.id
-            ORDER BY ph.created_at DESC
-            LIMIT 100
-        ''')
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
+        with self.get_connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute('''
+                SELECT ph.*, u.email, u.full_name 
+                FROM portfolio_history ph
+                JOIN users u ON ph.user_id = u.id
+                ORDER BY ph.created_at DESC
+                LIMIT 100
+            ''')
+            results = cur.fetchall()
+            cur.close()
         return results
     
     def get_user_activity(self, limit=100):
-        conn = self.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute('''
-            SELECT ua.*, u.email, u.full_name 
-            FROM user_activity ua
-            JOIN users u ON ua.user_id = u.id
-            ORDER BY ua.created_at DESC
-            LIMIT %s
-        ''', (limit,))
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
+        with self.get_connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute('''
+                SELECT ua.*, u.email, u.full_name 
+                FROM user_activity ua
+                JOIN users u ON ua.user_id = u.id
+                ORDER BY ua.created_at DESC
+                LIMIT %s
+            ''', (limit,))
+            results = cur.fetchall()
+            cur.close()
         return results
     
+    def _page_query(self, query, params, limit, before):
+        """Run a keyset-paginated query ordered by (created_at, id) descending
+
+        before is the cursor returned with the previous page; returns (rows, next_cursor),
+        where next_cursor is None on the last page.
+        """
+        with self.get_connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            if before:
+                cur.execute(query.format(keyset="WHERE (t.created_at, t.id) < (%s, %s)"),
+                            (*params, before[0], before[1], limit + 1))
+            else:
+                cur.execute(query.format(keyset=""), (*params, limit + 1))
+            results = cur.fetchall()
+            cur.close()
+        if len(results) > limit:
+            results = results[:limit]
+            last = results[-1]
+            return results, (last['created_at'], last['id'])
+        return results, None
+    
+    def get_users_page(self, limit=50, before=None):
+        return self._page_query('''
+            SELECT t.id, t.email, t.full_name, t.phone, t.is_admin, t.created_at, t.last_login
+            FROM users t
+            {keyset}
+            ORDER BY t.created_at DESC, t.id DESC
+            LIMIT %s
+        ''', (), limit, before)
+    
+    def get_portfolio_history_page(self, limit=50, before=None):
+        return self._page_query('''
+            SELECT t.id, t.user_id, t.file_name, t.stock_count, t.total_investment, t.current_value,
+                   t.total_gain_loss, t.created_at, u.email, u.full_name
+            FROM portfolio_history t
+            JOIN users u ON t.user_id = u.id
+            {keyset}
+            ORDER BY t.created_at DESC, t.id DESC
+            LIMIT %s
+        ''', (), limit, before)
+    
+    def get_user_activity_page(self, limit=50, before=None):
+        return self._page_query('''
+            SELECT t.id, t.user_id, t.activity_type, t.details, t.created_at, u.email, u.full_name
+            FROM user_activity t
+            JOIN users u ON t.user_id = u.id
+            {keyset}
+            ORDER BY t.created_at DESC, t.id DESC
+            LIMIT %s
+        ''', (), limit, before)
+    
     def get_admin_stats(self):
-        conn = self.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT COUNT(*) as count FROM users")
-        total_users = cur.fetchone()['count']
-        cur.execute("SELECT COUNT(*) as count FROM portfolio_history")
-        total_analyses = cur.fetchone()['count']
-        cur.execute("SELECT COUNT(DISTINCT user_id) as count FROM portfolio_history")
-        active_users = cur.fetchone()['count']
-        cur.close()
-        conn.close()
+        with self.get_connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            try:
+                cur.execute("SELECT total_users, total_analyses, active_users FROM admin_stats WHERE id = 1")
+                row = cur.fetchone()
+            except Exception:
+                conn.rollback()
+                row = None
+            if row is None:
+                cur.execute("SELECT COUNT(*) as count FROM users")
+                total_users = cur.fetchone()['count']
+                cur.execute("SELECT COUNT(*) as count FROM portfolio_history")
+                total_analyses = cur.fetchone()['count']
+                cur.execute("SELECT COUNT(DISTINCT user_id) as count FROM portfolio_history")
+                active_users = cur.fetchone()['count']
+                row = {'total_users': total_users, 'total_analyses': total_analyses, 'active_users': active_users}
+            cur.close()
         return {
-            'total_users': total_users,
-            'total_analyses': total_analyses,
-            'active_users': active_users
+            'total_users': row['total_users'],
+            'total_analyses': row['total_analyses'],
+            'active_users': row['active_users']
         }
     
     def make_admin(self, email):
         try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute("UPDATE users SET is_admin = TRUE WHERE email = %s", (email.lower(),))
-            conn.commit()
-            cur.close()
-            conn.close()
+            with self.get_connection() as conn:
+                cur = conn.cursor()
+                cur.execute("UPDATE users SET is_admin = TRUE WHERE email = %s", (email.lower(),))
+                conn.commit()
+                cur.close()
             return True
         except:
             return False
     
     def create_subscription(self, user_id, order_id, amount, plan_type='monthly'):
         try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute('''
-                INSERT INTO subscriptions (user_id, razorpay_order_id, amount, plan_type, status)
-                VALUES (%s, %s, %s, %s, 'pending')
-                RETURNING id
-            ''', (user_id, order_id, amount, plan_type))
-            sub_id = cur.fetchone()[0]
-            conn.commit()
-            cur.close()
-            conn.close()
+            with self.get_connection() as conn:
+                cur = conn.cursor()
+                cur.execute('''
+                    INSERT INTO subscriptions (user_id, razorpay_order_id, amount, plan_type, status)
+                    VALUES (%s, %s, %s, %s, 'pending')
+                    RETURNING id
+                ''', (user_id, order_id, amount, plan_type))
+                sub_id = cur.fetchone()[0]
+                conn.commit()
+                cur.close()
             return sub_id
         except Exception as e:
             print(f"Error creating subscription: {e}")
@@ -501,23 +658,22 @@ class Database:
     
     def update_subscription_payment(self, order_id, payment_id, signature):
         try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            from datetime import datetime, timedelta
-            start_date = datetime.now()
-            end_date = start_date + timedelta(days=30)
-            cur.execute('''
-                UPDATE subscriptions 
-                SET razorpay_payment_id = %s, 
-                    razorpay_signature = %s, 
-                    status = 'active',
-                    start_date = %s,
-                    end_date = %s
-                WHERE razorpay_order_id = %s
-            ''', (payment_id, signature, start_date, end_date, order_id))
-            conn.commit()
-            cur.close()
-            conn.close()
+            with self.get_connection() as conn:
+                cur = conn.cursor()
+                from datetime import datetime, timedelta
+                start_date = datetime.now()
+                end_date = start_date + timedelta(days=30)
+                cur.execute('''
+                    UPDATE subscriptions 
+                    SET razorpay_payment_id = %s, 
+                        razorpay_signature = %s, 
+                        status = 'active',
+                        start_date = %s,
+                        end_date = %s
+                    WHERE razorpay_order_id = %s
+                ''', (payment_id, signature, start_date, end_date, order_id))
+                conn.commit()
+                cur.close()
             return True
         except Exception as e:
             print(f"Error updating subscription: {e}")
@@ -525,16 +681,15 @@ class Database:
     
     def get_active_subscription(self, user_id):
         try:
-            conn = self.get_connection()
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            cur.execute('''
-                SELECT * FROM subscriptions 
-                WHERE user_id = %s AND status = 'active' AND end_date > NOW()
-                ORDER BY created_at DESC LIMIT 1
-            ''', (user_id,))
-            result = cur.fetchone()
-            cur.close()
-            conn.close()
+            with self.get_connection() as conn:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute('''
+                    SELECT * FROM subscriptions 
+                    WHERE user_id = %s AND status = 'active' AND end_date > NOW()
+                    ORDER BY created_at DESC LIMIT 1
+                ''', (user_id,))
+                result = cur.fetchone()
+                cur.close()
             return result
         except Exception as e:
             print(f"Error fetching subscription: {e}")
@@ -542,17 +697,16 @@ class Database:
     
     def get_all_subscriptions(self):
         try:
-            conn = self.get_connection()
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            cur.execute('''
-                SELECT s.*, u.email, u.full_name 
-                FROM subscriptions s
-                JOIN users u ON s.user_id = u.id
-                ORDER BY s.created_at DESC
-            ''')
-            results = cur.fetchall()
-            cur.close()
-            conn.close()
+            with self.get_connection() as conn:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute('''
+                    SELECT s.*, u.email, u.full_name 
+                    FROM subscriptions s
+                    JOIN users u ON s.user_id = u.id
+                    ORDER BY s.created_at DESC
+                ''')
+                results = cur.fetchall()
+                cur.close()
             return results
         except Exception as e:
             print(f"Error fetching subscriptions: {e}")
@@ -0,0 +1,279 @@
+"""Process-wide PostgreSQL connection pooling shared by the app and API"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+
+DB_POOL_MIN_CONN = int(os.environ.get('DB_POOL_MIN_CONN', '1'))
+DB_POOL_MAX_CONN = int(os.environ.get('DB_POOL_MAX_CONN', '10'))
+DB_POOL_MAX_LIFETIME = int(os.environ.get('DB_POOL_MAX_LIFETIME', '1800'))
+DB_POOL_IDLE_CHECK = int(os.environ.get('DB_POOL_IDLE_CHECK', '30'))
+DB_POOL_CHECKOUT_TIMEOUT = int(os.environ.get('DB_POOL_CHECKOUT_TIMEOUT', '30'))
+DB_SSLMODE = os.environ.get('DB_SSLMODE', 'require')
+
+
+def resolve_database_url():
+    return os.environ.get('EXTERNAL_DATABASE_URL') or os.environ.get('DATABASE_URL')
+
+
+class _TrackedPool(ThreadedConnectionPool):
+    """ThreadedConnectionPool that remembers when each connection was opened and last returned
+
+    minconn connections are opened up front, but returned connections stay
+    idle up to maxconn; the base class would close everything beyond minconn
+    and pay a new TLS handshake on the next checkout.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.created_at = {}
+        self.last_returned = {}
+        self.connections_created = 0
+        super().__init__(*args, **kwargs)
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        self.created_at[id(conn)] = time.monotonic()
+        self.connections_created += 1
+        return conn
+
+    def _forget(self, conn):
+        self.created_at.pop(id(conn), None)
+        self.last_returned.pop(id(conn), None)
+
+    def _putconn(self, conn, key=None, close=False):
+        # Called under the pool lock, so swapping minconn is safe
+        minconn, self.minconn = self.minconn, self.maxconn
+        try:
+            super()._putconn(conn, key, close)
+        finally:
+            self.minconn = minconn
+            if conn.closed:
+                self._forget(conn)
+
+    def _closeall(self):
+        super()._closeall()
+        self.created_at.clear()
+        self.last_returned.clear()
+
+
+class PooledConnection:
+    """A checked-out psycopg2 connection.
+
+    Behaves like the underlying connection; close() returns it to the pool.
+    As a context manager it commits on success, rolls back on error and then
+    returns the connection.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool.putconn(self._conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if not self._conn.closed:
+                if exc_type is None:
+                    self._conn.commit()
+                else:
+                    self._conn.rollback()
+        finally:
+            self.close()
+        return False
+
+
+class ConnectionPool:
+    """Process-wide PostgreSQL pool with health checks and max-lifetime recycling"""
+
+    def __init__(self, dsn, min_conn=DB_POOL_MIN_CONN, max_conn=DB_POOL_MAX_CONN,
+                 max_lifetime=DB_POOL_MAX_LIFETIME, idle_check=DB_POOL_IDLE_CHECK,
+                 checkout_timeout=DB_POOL_CHECKOUT_TIMEOUT, max_retries=3, retry_delay=1,
+                 sslmode=None):
+        self.dsn = dsn
+        self.sslmode = sslmode
+        self.max_conn = max_conn
+        self.max_lifetime = max_lifetime
+        self.idle_check = idle_check
+        self.checkout_timeout = checkout_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._slots = threading.BoundedSemaphore(max_conn)
+        self._lock = threading.Lock()
+        self._metrics = {
+            'checkouts': 0,
+            'checkout_wait_seconds': 0.0,
+            'recycled': 0,
+            'health_check_failures': 0,
+            'timeouts': 0,
+        }
+        self._pool = self._create_pool(min_conn, max_conn)
+
+    def _create_pool(self, min_conn, max_conn):
+        last_error = None
+        for attempt in range(self.max_retries):
+            try:
+                connect_kwargs = {'connect_timeout': 15}
+                if self.sslmode and 'sslmode' not in self.dsn:
+                    connect_kwargs['sslmode'] = self.sslmode
+                return _TrackedPool(min_conn, max_conn, self.dsn, **connect_kwargs)
+            except psycopg2.OperationalError as e:
+                last_error = e
+                if attempt < self.max_retries - 1:
+                    time.sleep(self.retry_delay * (attempt + 1))
+        raise last_error if last_error else Exception("Failed to connect to database")
+
+    def _discard(self, conn):
+        try:
+            self._pool.putconn(conn, close=True)
+        except PoolError:
+            pass
+        self._pool._forget(conn)
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        age = time.monotonic() - self._pool.created_at.get(id(conn), time.monotonic())
+        if self.max_lifetime and age > self.max_lifetime:
+            with self._lock:
+                self._metrics['recycled'] += 1
+            return False
+        idle = time.monotonic() - self._pool.last_returned.get(id(conn), time.monotonic())
+        if idle > self.idle_check:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                with self._lock:
+                    self._metrics['health_check_failures'] += 1
+                return False
+        return True
+
+    def _checkout_raw(self):
+        last_error = None
+        for attempt in range(self.max_retries):
+            try:
+                conn = self._pool.getconn()
+            except psycopg2.OperationalError as e:
+                last_error = e
+                if attempt < self.max_retries - 1:
+                    time.sleep(self.retry_delay * (attempt + 1))
+                continue
+            if self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+        raise last_error if last_error else Exception("Failed to obtain a healthy database connection")
+
+    def getconn(self):
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self._metrics['timeouts'] += 1
+            raise PoolError(f"No database connection available within {self.checkout_timeout}s")
+        try:
+            conn = self._checkout_raw()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._metrics['checkouts'] += 1
+            self._metrics['checkout_wait_seconds'] += time.monotonic() - started
+        return PooledConnection(self, conn)
+
+    def putconn(self, conn):
+        try:
+            if conn.closed:
+                self._discard(conn)
+                return
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    self._discard(conn)
+                    return
+            self._pool.last_returned[id(conn)] = time.monotonic()
+            self._pool.putconn(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        with conn:
+            yield conn
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics.update({
+            'max_connections': self.max_conn,
+            'in_use': len(self._pool._used),
+            'idle': len(self._pool._pool),
+            'connections_created': self._pool.connections_created,
+        })
+        return metrics
+
+    def close(self):
+        self._pool.closeall()
+
+
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def get_pool(dsn=None):
+    """Return this process's pool for dsn, creating it on first use (and again after a fork)
+
+    Every caller of a DSN shares one pool. DB_SSLMODE applies unless the DSN
+    sets sslmode itself.
+    """
+    global _pools, _pools_pid
+    dsn = dsn or resolve_database_url()
+    if not dsn:
+        raise Exception("DATABASE_URL is not configured")
+    pool = _pools.get(dsn)
+    if pool is not None and _pools_pid == os.getpid():
+        return pool
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools = {}
+            _pools_pid = os.getpid()
+        if dsn not in _pools:
+            _pools[dsn] = ConnectionPool(dsn, sslmode=DB_SSLMODE)
+        return _pools[dsn]
+
+
+def get_connection(dsn=None):
+    """Check out a pooled connection; use as a context manager or call close() to return it"""
+    return get_pool(dsn).getconn()
+
+
+def pool_stats():
+    if _pools_pid != os.getpid():
+        return {}
+    return {f"pool_{i}": pool.stats() for i, pool in enumerate(list(_pools.values()))}
+
+
+def close_all_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            try:
+                pool.close()
+            except Exception as e:
+                print(f"Error closing connection pool: {e}")
+        _pools.clear()
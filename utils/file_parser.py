@@ -19,9 +19,8 @@ class PortfolioFileParser:
     def isin_mappings(self):
         if self._isin_mappings is None:
             try:
-                from utils.database import Database
-                db = Database()
-                self._isin_mappings = db.get_isin_mappings()
+                from utils.reference_data import get_reference_snapshot
+                self._isin_mappings = get_reference_snapshot().isin_mappings or {}
             except Exception:
                 self._isin_mappings = {}
         return self._isin_mappings
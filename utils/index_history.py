@@ -0,0 +1,140 @@
+"""Shared daily history of every tracked market index
+
+The whole index set is downloaded in one batched, threaded yfinance call and
+kept in process memory. Later requests for an earlier start date backfill
+the set, and once the price snapshot moves on (every INDEX_HISTORY_TOPUP_SECONDS
+while the market trades) only the trailing few days are re-downloaded and
+merged. Consumers slice the shared frames for their own start date.
+
+Coverage is tracked per symbol and only recorded for symbols a download
+actually returned (yfinance reports failures as an empty frame); symbols Yahoo
+did not return are retried after INDEX_HISTORY_RETRY_SECONDS rather than on
+every call.
+"""
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+import yfinance as yf
+
+from utils import market_calendar
+from utils.market_data_cache import flatten_yf_columns
+
+INDEX_HISTORY_TOPUP_SECONDS = int(os.environ.get('INDEX_HISTORY_TOPUP_SECONDS', '900'))
+INDEX_HISTORY_TOPUP_OVERLAP_DAYS = 5
+INDEX_HISTORY_RETRY_SECONDS = int(os.environ.get('INDEX_HISTORY_RETRY_SECONDS', '300'))
+
+
+class IndexHistoryStore:
+    def __init__(self):
+        self._frames = {}
+        # symbol -> earliest start date a download has covered
+        self._starts = {}
+        # symbol -> monotonic time before which a failed symbol is not requested again
+        self._retry_after = {}
+        self._version = None
+        self._lock = threading.Lock()
+        self.downloads = 0
+
+    def _download(self, symbols, start, end=None):
+        if not symbols:
+            return {}
+        data = yf.download(list(symbols), start=start, end=end or datetime.now(), progress=False,
+                           group_by='ticker', threads=True)
+        self.downloads += 1
+        if data is None or data.empty:
+            return {}
+
+        frames = {}
+        for symbol in symbols:
+            if isinstance(data.columns, pd.MultiIndex):
+                if symbol not in data.columns.get_level_values(0):
+                    continue
+                frame = data[symbol]
+            else:
+                frame = flatten_yf_columns(data)
+            frame = frame.dropna(how='all')
+            if getattr(frame.index, 'tz', None) is not None:
+                frame.index = frame.index.tz_localize(None)
+            if not frame.empty:
+                frames[symbol] = frame
+        return frames
+
+    def _merge(self, frames):
+        for symbol, frame in frames.items():
+            current = self._frames.get(symbol)
+            if current is None:
+                self._frames[symbol] = frame
+            else:
+                combined = pd.concat([current, frame])
+                self._frames[symbol] = combined[~combined.index.duplicated(keep='last')].sort_index()
+
+    def ensure(self, symbols, start_date):
+        """Make sure every symbol is covered from start_date up to the current price snapshot"""
+        start = pd.Timestamp(start_date).normalize()
+        symbols = list(dict.fromkeys(symbols))
+        version = market_calendar.snapshot_version(INDEX_HISTORY_TOPUP_SECONDS)
+        with self._lock:
+            now = time.monotonic()
+            backfill = [
+                symbol for symbol in symbols
+                if (symbol not in self._starts or start < self._starts[symbol])
+                and self._retry_after.get(symbol, 0) <= now
+            ]
+            if backfill:
+                # One batch for every symbol not yet covered from this start
+                try:
+                    frames = self._download(backfill, start)
+                except Exception as e:
+                    print(f"Index history download failed: {e}")
+                    frames = {}
+                self._merge(frames)
+                for symbol in backfill:
+                    if symbol in frames:
+                        self._starts[symbol] = min(start, self._starts.get(symbol, start))
+                        self._retry_after.pop(symbol, None)
+                    else:
+                        self._retry_after[symbol] = now + INDEX_HISTORY_RETRY_SECONDS
+                if self._version is None:
+                    self._version = version
+
+            if version != self._version:
+                topup = [s for s in symbols if s in self._frames and self._retry_after.get(s, 0) <= now]
+                if topup:
+                    topup_start = min(self._frames[s].index[-1] for s in topup) - timedelta(days=INDEX_HISTORY_TOPUP_OVERLAP_DAYS)
+                    try:
+                        self._merge(self._download(topup, topup_start))
+                    except Exception as e:
+                        # Keep serving the frames we have; the next snapshot tries again
+                        print(f"Index history top-up failed: {e}")
+                self._version = version
+
+    def get(self, symbol, start_date):
+        start = pd.Timestamp(start_date)
+        frame = self._frames.get(symbol)
+        if frame is None:
+            return pd.DataFrame()
+        return frame[frame.index >= start].copy()
+
+    def histories(self, indices, start_date, names=None):
+        """{index name: history from start_date} for names (default: all) of an {index name: symbol} map
+
+        The whole map is fetched together so every consumer shares one batch.
+        """
+        self.ensure(indices.values(), start_date)
+        names = names if names is not None else list(indices)
+        return {name: self.get(indices[name], start_date) for name in names if name in indices}
+
+    def stats(self):
+        starts = list(self._starts.values())
+        return {
+            'indices': len(self._frames),
+            'start': min(starts).date().isoformat() if starts else None,
+            'retrying': len(self._retry_after),
+            'downloads': self.downloads
+        }
+
+
+index_history_store = IndexHistoryStore()
@@ -0,0 +1,206 @@
+"""Rolling intraday OHLCV bars built from live ticks
+
+Ticks from the live feeds (TrueData stream, polled Zerodha/Yahoo LTPs) are
+folded into fixed-capacity NumPy ring buffers per symbol and bar interval, so
+intraday P&L, drawdown and volatility are computed without any historical
+data request. Bars reset at the start of each IST trading day.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+INTRADAY_BAR_INTERVALS = tuple(
+    int(s) for s in os.environ.get('INTRADAY_BAR_INTERVALS', '60,300').split(',') if s.strip()
+)
+INTRADAY_SESSION_MINUTES = 375
+TRADING_DAYS_PER_YEAR = 252
+IST = timezone(timedelta(hours=5, minutes=30))
+
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(5)
+
+
+class BarSeries:
+    """OHLCV bars of one interval for one symbol, stored in a ring buffer"""
+
+    def __init__(self, interval, capacity):
+        self.interval = interval
+        self.capacity = capacity
+        self.start = np.zeros(capacity, dtype=np.int64)
+        self.ohlcv = np.zeros((capacity, 5), dtype=np.float64)
+        self.count = 0
+
+    def update(self, timestamp, price, volume=0.0):
+        bucket = int(timestamp) // self.interval * self.interval
+        if self.count:
+            i = (self.count - 1) % self.capacity
+            if bucket == self.start[i]:
+                row = self.ohlcv[i]
+                if price > row[HIGH]:
+                    row[HIGH] = price
+                if price < row[LOW]:
+                    row[LOW] = price
+                row[CLOSE] = price
+                row[VOLUME] += volume
+                return
+            if bucket < self.start[i]:
+                # Late tick for a bar that is already closed
+                return
+        i = self.count % self.capacity
+        self.start[i] = bucket
+        self.ohlcv[i] = (price, price, price, price, volume)
+        self.count += 1
+
+    def arrays(self):
+        """Bars in chronological order as a dict of NumPy arrays"""
+        if self.count <= self.capacity:
+            idx = np.arange(self.count)
+        else:
+            idx = (np.arange(self.capacity) + self.count) % self.capacity
+        data = self.ohlcv[idx]
+        return {
+            'start': self.start[idx],
+            'open': data[:, OPEN],
+            'high': data[:, HIGH],
+            'low': data[:, LOW],
+            'close': data[:, CLOSE],
+            'volume': data[:, VOLUME]
+        }
+
+
+class IntradayBarAggregator:
+    def __init__(self, intervals=INTRADAY_BAR_INTERVALS, session_minutes=INTRADAY_SESSION_MINUTES):
+        self.intervals = tuple(intervals)
+        self.session_minutes = session_minutes
+        self._series = {}
+        self._session_day = {}
+        self._last_cumulative_volume = {}
+        self._lock = threading.Lock()
+        self.ticks = 0
+
+    def _new_series(self):
+        # One extra bar so pre-open/post-close ticks do not evict the session open
+        return {
+            interval: BarSeries(interval, self.session_minutes * 60 // interval + 2)
+            for interval in self.intervals
+        }
+
+    def on_tick(self, symbol, price, cumulative_volume=None, timestamp=None):
+        """Fold one tick into every bar interval; cumulative_volume is the feed's day volume"""
+        if not price:
+            return
+        timestamp = timestamp or time.time()
+        day = datetime.fromtimestamp(timestamp, IST).date()
+        symbol = symbol.replace('.NS', '').replace('.BO', '')
+
+        with self._lock:
+            if self._session_day.get(symbol) != day:
+                self._series[symbol] = self._new_series()
+                self._session_day[symbol] = day
+                self._last_cumulative_volume.pop(symbol, None)
+
+            volume = 0.0
+            if cumulative_volume is not None:
+                last = self._last_cumulative_volume.get(symbol)
+                if last is not None and cumulative_volume >= last:
+                    volume = float(cumulative_volume - last)
+                self._last_cumulative_volume[symbol] = cumulative_volume
+
+            for series in self._series[symbol].values():
+                series.update(timestamp, float(price), volume)
+            self.ticks += 1
+
+    def symbols(self):
+        with self._lock:
+            return list(self._series)
+
+    def bars(self, symbol, interval=60):
+        """Chronological bars for a symbol, or None if no ticks were seen today"""
+        symbol = symbol.replace('.NS', '').replace('.BO', '')
+        today = datetime.now(IST).date()
+        with self._lock:
+            if self._session_day.get(symbol) != today:
+                # The series resets on the first tick of a day; until then it holds an earlier session
+                return None
+            series = self._series.get(symbol, {}).get(interval)
+            if series is None or series.count == 0:
+                return None
+            return {key: value.copy() for key, value in series.arrays().items()}
+
+    def _volatility(self, closes, reference_price, interval):
+        returns = np.diff(np.log(np.concatenate(([reference_price], closes))))
+        if len(returns) < 2:
+            return 0.0, 0.0
+        vol = float(returns.std(ddof=1))
+        bars_per_day = self.session_minutes * 60 / interval
+        return float(vol * np.sqrt(len(returns))), float(vol * np.sqrt(bars_per_day * TRADING_DAYS_PER_YEAR))
+
+    def metrics(self, symbol, quantity=1, interval=60, reference_price=None):
+        """Intraday P&L, drawdown and volatility for a position
+
+        reference_price defaults to the first traded price of the session; pass
+        the previous close to measure P&L against it instead.
+        """
+        bars = self.bars(symbol, interval)
+        if bars is None:
+            return None
+        closes = bars['close']
+        reference_price = reference_price or float(bars['open'][0])
+        last = float(closes[-1])
+        peak = np.maximum.accumulate(np.maximum(closes, reference_price))
+        session_vol, annual_vol = self._volatility(closes, reference_price, interval)
+        return {
+            'symbol': symbol,
+            'interval_seconds': interval,
+            'bars': int(len(closes)),
+            'reference_price': reference_price,
+            'last_price': last,
+            'day_high': float(bars['high'].max()),
+            'day_low': float(bars['low'].min()),
+            'volume': float(bars['volume'].sum()),
+            'pnl': (last - reference_price) * quantity,
+            'pnl_pct': (last / reference_price - 1) * 100,
+            'max_drawdown_pct': float((closes / peak - 1).min() * 100),
+            'realized_volatility_pct': session_vol * 100,
+            'annualized_volatility_pct': annual_vol * 100
+        }
+
+    def portfolio_metrics(self, holdings, interval=60, reference_prices=None):
+        """Intraday P&L and drawdown of a portfolio given {symbol: quantity}"""
+        reference_prices = reference_prices or {}
+        series = {}
+        for symbol, quantity in holdings.items():
+            bars = self.bars(symbol, interval)
+            if bars is not None and quantity:
+                series[symbol] = (quantity, bars)
+        if not series:
+            return None
+
+        timeline = np.unique(np.concatenate([bars['start'] for _, bars in series.values()]))
+        opening_value = 0.0
+        values = np.zeros(len(timeline))
+        for symbol, (quantity, bars) in series.items():
+            reference = reference_prices.get(symbol) or float(bars['open'][0])
+            # Carry each symbol's last close forward onto the shared timeline
+            idx = np.searchsorted(bars['start'], timeline, side='right') - 1
+            closes = np.where(idx >= 0, bars['close'][np.maximum(idx, 0)], reference)
+            values += closes * quantity
+            opening_value += reference * quantity
+
+        peak = np.maximum.accumulate(np.maximum(values, opening_value))
+        session_vol, annual_vol = self._volatility(values, opening_value, interval)
+        return {
+            'symbols': len(series),
+            'opening_value': opening_value,
+            'current_value': float(values[-1]),
+            'pnl': float(values[-1] - opening_value),
+            'pnl_pct': float((values[-1] / opening_value - 1) * 100) if opening_value else 0.0,
+            'max_drawdown_pct': float((values / peak - 1).min() * 100),
+            'realized_volatility_pct': session_vol * 100,
+            'annualized_volatility_pct': annual_vol * 100
+        }
+
+
+intraday_bars = IntradayBarAggregator()
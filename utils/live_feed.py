@@ -0,0 +1,240 @@
+"""Background LTP feed and incremental valuation for the dashboard's live mode
+
+One daemon thread per process polls the symbols of the sessions that are in
+live mode and keeps the latest price of each with a version number, so
+dashboard fragments only read memory. Symbols keep their exchange suffix
+(.NS/.BO) so BSE-only holdings are priced from the right ticker. A session
+drops out once it has not asked for prices for a few intervals, and the
+thread idles when none are left.
+
+Set LIVE_FEED_SOURCE=simulated to drive live mode from a random walk around
+the portfolio's current prices instead of market data (useful off-hours and
+in development).
+"""
+import os
+import time
+import random
+import threading
+
+
+LIVE_FEED_SOURCE = os.environ.get('LIVE_FEED_SOURCE', 'market')
+LIVE_FEED_INTERVAL_SECONDS = float(os.environ.get('LIVE_FEED_INTERVAL_SECONDS', '5'))
+LIVE_FEED_IDLE_INTERVALS = 3
+LIVE_FEED_SIMULATED_VOLATILITY = float(os.environ.get('LIVE_FEED_SIMULATED_VOLATILITY', '0.002'))
+
+
+class SimulatedPriceSource:
+    """Random-walk prices around seeded starting values"""
+
+    def __init__(self, volatility=LIVE_FEED_SIMULATED_VOLATILITY, seed=None):
+        self.volatility = volatility
+        self._random = random.Random(seed)
+        self._prices = {}
+        self._lock = threading.Lock()
+
+    def seed(self, prices):
+        """Set starting prices for symbols the walk has not seen yet"""
+        with self._lock:
+            for symbol, price in prices.items():
+                if price and symbol not in self._prices:
+                    self._prices[symbol] = float(price)
+
+    def fetch(self, symbols):
+        prices = {}
+        with self._lock:
+            for symbol in symbols:
+                price = self._prices.get(symbol)
+                if price is None:
+                    continue
+                price = round(price * (1 + self._random.gauss(0, self.volatility)), 2)
+                self._prices[symbol] = price
+                prices[symbol] = price
+        return prices
+
+
+class LiveFeed:
+    def __init__(self, source=None, interval=LIVE_FEED_INTERVAL_SECONDS):
+        self._source = source
+        self.interval = interval
+        # symbol -> (price, version); replaced wholesale so readers never lock
+        self._prices = {}
+        # session id -> (symbols, last request time) for sessions in live mode
+        self._sessions = {}
+        self.version = 0
+        self.polls = 0
+        self.last_poll = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def source(self):
+        if self._source is None:
+            if LIVE_FEED_SOURCE == 'simulated':
+                self._source = SimulatedPriceSource()
+            else:
+                from utils.price_source import PriceSource
+                self._source = PriceSource()
+        return self._source
+
+    def start(self, session_id, symbols):
+        """Keep polling a live-mode session's symbols for a few more intervals, starting the thread if needed"""
+        with self._lock:
+            self._sessions[session_id] = (set(symbols), time.monotonic())
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='live-feed', daemon=True)
+                self._thread.start()
+
+    def stop(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def seed(self, prices):
+        """Hand known prices to sources that need a starting point (the simulated feed)"""
+        if hasattr(self.source, 'seed'):
+            self.source.seed(prices)
+
+    def watched_symbols(self):
+        """Symbols of sessions that asked for prices within the last few intervals"""
+        cutoff = time.monotonic() - self.interval * LIVE_FEED_IDLE_INTERVALS
+        with self._lock:
+            for session_id in [sid for sid, (_, seen) in self._sessions.items() if seen < cutoff]:
+                del self._sessions[session_id]
+            symbols = set()
+            for session_symbols, _ in self._sessions.values():
+                symbols |= session_symbols
+        return symbols
+
+    def _run(self):
+        while True:
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"Live feed poll failed: {e}")
+            time.sleep(self.interval)
+
+    def poll_once(self):
+        symbols = self.watched_symbols()
+        snapshot = self._prices
+        if not symbols.issuperset(snapshot):
+            # Forget symbols nobody watches so the snapshot does not grow with churn
+            snapshot = {symbol: entry for symbol, entry in snapshot.items() if symbol in symbols}
+            self._prices = snapshot
+        if not symbols:
+            return
+        prices = self.source.fetch(sorted(symbols))
+        self.polls += 1
+        self.last_poll = time.time()
+
+        changed = {symbol: float(price) for symbol, price in prices.items()
+                   if price and snapshot.get(symbol, (None,))[0] != float(price)}
+        if not changed:
+            return
+        version = self.version + 1
+        snapshot = dict(snapshot)
+        for symbol, price in changed.items():
+            snapshot[symbol] = (price, version)
+        self._prices = snapshot
+        self.version = version
+
+    def changes_since(self, symbols, version):
+        """Return ({symbol: price} updated after version, current version)"""
+        current = self.version
+        snapshot = self._prices
+        changes = {}
+        for symbol in symbols:
+            entry = snapshot.get(symbol)
+            if entry is not None and version < entry[1] <= current:
+                changes[symbol] = entry[0]
+        return changes, current
+
+    def stats(self):
+        return {
+            'source': type(self.source).__name__,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'sessions': len(self._sessions),
+            'interval_seconds': self.interval,
+            'symbols': len(self._prices),
+            'version': self.version,
+            'polls': self.polls,
+            'last_poll': self.last_poll
+        }
+
+
+class LiveValuation:
+    """Portfolio totals kept current one position at a time
+
+    Each update touches only the positions whose price changed and adjusts the
+    running totals by their delta, so a tick costs O(changed positions).
+    """
+
+    def __init__(self, stock_performance, price_symbols):
+        self.positions = {}
+        self.names_by_symbol = {}
+        for stock in stock_performance:
+            name = stock['Stock Name']
+            symbol = price_symbols.get(name)
+            self.positions[name] = {
+                'quantity': float(stock['Quantity']),
+                'buy_price': float(stock['Buy Price']),
+                'price': float(stock['Current Price'])
+            }
+            if symbol:
+                self.names_by_symbol.setdefault(symbol, []).append(name)
+        self.total_investment = sum(p['quantity'] * p['buy_price'] for p in self.positions.values())
+        self.current_value = sum(p['quantity'] * p['price'] for p in self.positions.values())
+        self.last_change = 0.0
+        self.changed = set()
+        self.version = 0
+
+    def apply(self, prices):
+        """Apply {stock name: price}; returns the names whose price changed"""
+        changed = set()
+        delta = 0.0
+        for name, price in prices.items():
+            position = self.positions.get(name)
+            if position is None or price == position['price']:
+                continue
+            delta += (price - position['price']) * position['quantity']
+            position['price'] = price
+            changed.add(name)
+        self.current_value += delta
+        self.last_change = delta
+        self.changed = changed
+        return changed
+
+    def update_from(self, feed):
+        """Pull prices the feed published since the last update"""
+        changes, self.version = feed.changes_since(self.names_by_symbol, self.version)
+        prices = {name: price for symbol, price in changes.items() for name in self.names_by_symbol[symbol]}
+        return self.apply(prices)
+
+    @property
+    def total_gain_loss(self):
+        return self.current_value - self.total_investment
+
+    @property
+    def total_gain_loss_percentage(self):
+        return self.total_gain_loss / self.total_investment * 100 if self.total_investment else 0
+
+    def prices(self):
+        return {name: position['price'] for name, position in self.positions.items()}
+
+    def holdings(self):
+        rows = []
+        for name, position in self.positions.items():
+            investment = position['quantity'] * position['buy_price']
+            value = position['quantity'] * position['price']
+            rows.append({
+                'Stock Name': name,
+                'Quantity': position['quantity'],
+                'Buy Price': position['buy_price'],
+                'LTP': position['price'],
+                'Current Value': value,
+                'Gain/Loss': value - investment,
+                'Gain/Loss %': (value - investment) / investment * 100 if investment else 0,
+                'Updated': '●' if name in self.changed else ''
+            })
+        return rows
+
+
+live_feed = LiveFeed()
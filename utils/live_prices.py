@@ -0,0 +1,199 @@
+"""Process-wide live price service shared by every session
+
+Streamlit builds a new DataFetcher on each rerun, so broker clients must not
+live on DataFetcher instances. This module owns the single Zerodha client and
+TrueData stream of the process, reference-counts the symbols sessions are
+watching, and serves LTPs from one shared snapshot.
+"""
+import os
+import time
+import threading
+from collections import Counter
+
+from utils import market_calendar
+
+LIVE_PRICE_MAX_AGE_SECONDS = float(os.environ.get('LIVE_PRICE_MAX_AGE_SECONDS', '5'))
+LIVE_PRICE_SESSION_TTL_SECONDS = int(os.environ.get('LIVE_PRICE_SESSION_TTL_SECONDS', '1800'))
+
+
+def _clean(symbol):
+    return symbol.upper().strip().replace('.NS', '').replace('.BO', '')
+
+
+class LivePriceService:
+    def __init__(self, max_age=LIVE_PRICE_MAX_AGE_SECONDS, session_ttl=LIVE_PRICE_SESSION_TTL_SECONDS):
+        self.max_age = max_age
+        self.session_ttl = session_ttl
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._broker = None
+        self._truedata = None
+        self._truedata_checked = False
+        self._sessions = {}
+        self._refcounts = Counter()
+        # symbol -> (price, fetched_at); replaced wholesale so readers never lock
+        self._snapshot = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def broker(self):
+        """The one DataFetcher whose Zerodha client is shared by the process"""
+        if self._broker is None:
+            with self._lock:
+                if self._broker is None:
+                    from utils.data_fetcher import DataFetcher
+                    self._broker = DataFetcher(use_database=False)
+        return self._broker
+
+    @property
+    def truedata(self):
+        if not self._truedata_checked:
+            with self._lock:
+                if not self._truedata_checked:
+                    try:
+                        from utils.truedata_client import TrueDataPriceFetcher
+                        client = TrueDataPriceFetcher()
+                        self._truedata = client if client.is_available() else None
+                    except Exception as e:
+                        print(f"TrueData initialization failed: {e}")
+                    self._truedata_checked = True
+        return self._truedata
+
+    def _expire_sessions(self, now):
+        expired = [sid for sid, (_, seen) in self._sessions.items() if now - seen > self.session_ttl]
+        released = set()
+        for session_id in expired:
+            symbols, _ = self._sessions.pop(session_id)
+            released |= self._decrement(symbols)
+        return released
+
+    def _decrement(self, symbols):
+        released = set()
+        for symbol in symbols:
+            self._refcounts[symbol] -= 1
+            if self._refcounts[symbol] <= 0:
+                del self._refcounts[symbol]
+                released.add(symbol)
+        return released
+
+    def subscribe(self, session_id, symbols):
+        """Set the symbols a session is watching; calling it again refreshes the session's lease"""
+        symbols = {_clean(s) for s in symbols}
+        now = time.time()
+        with self._lock:
+            released = self._expire_sessions(now)
+            previous, _ = self._sessions.get(session_id, (set(), now))
+            added = symbols - previous
+            for symbol in added:
+                self._refcounts[symbol] += 1
+            released |= self._decrement(previous - symbols)
+            self._sessions[session_id] = (symbols, now)
+            started = [s for s in added if self._refcounts[s] == 1]
+            released = [s for s in released if s not in self._refcounts]
+        self._apply_stream_changes(started, released)
+
+    def release(self, session_id):
+        with self._lock:
+            symbols, _ = self._sessions.pop(session_id, (set(), 0))
+            released = list(self._decrement(symbols))
+        self._apply_stream_changes([], released)
+
+    def _apply_stream_changes(self, started, released):
+        if released:
+            snapshot = dict(self._snapshot)
+            for symbol in released:
+                snapshot.pop(symbol, None)
+            self._snapshot = snapshot
+        truedata = self.truedata
+        if truedata is None:
+            return
+        try:
+            if started:
+                truedata.initialize(started)
+            if released:
+                truedata.client.unsubscribe(released)
+        except Exception as e:
+            print(f"TrueData subscription update failed: {e}")
+
+    def subscribed_symbols(self):
+        with self._lock:
+            return set(self._refcounts)
+
+    def get_prices(self, symbols):
+        """Return {symbol: price} for the symbols a live feed could price; others are omitted
+
+        Zerodha quotes are served from the shared snapshot while younger than
+        max_age (or, with the market closed, if taken after the last close) and
+        fetched in one batch otherwise; TrueData fills the gaps.
+        """
+        now = time.time()
+        if market_calendar.is_market_open():
+            cutoff = now - self.max_age
+        else:
+            # Quotes taken after the last close stay valid until the next open
+            cutoff = market_calendar.last_close().timestamp()
+        snapshot = self._snapshot
+        prices, missing = {}, {}
+        for symbol in symbols:
+            key = _clean(symbol)
+            cached = snapshot.get(key)
+            if cached is not None and cached[1] >= cutoff:
+                prices[symbol] = cached[0]
+            else:
+                missing.setdefault(key, []).append(symbol)
+
+        self.hits += len(prices)
+        if not missing:
+            return prices
+        self.misses += len(missing)
+
+        with self._fetch_lock:
+            fetched = self.broker.get_zerodha_prices(list(missing))
+        if fetched:
+            fetched_at = time.time()
+            snapshot = dict(self._snapshot)
+            for key, price in fetched.items():
+                snapshot[key] = (price, fetched_at)
+            self._snapshot = snapshot
+
+        truedata = self.truedata
+        for key, requested in missing.items():
+            price = fetched.get(key)
+            if not price and truedata is not None:
+                price = truedata.get_price(key)
+            if price:
+                for symbol in requested:
+                    prices[symbol] = price
+        return prices
+
+    def get_price(self, symbol):
+        return self.get_prices([symbol]).get(symbol)
+
+    def stats(self):
+        with self._lock:
+            sessions = len(self._sessions)
+            subscribed = len(self._refcounts)
+        truedata = self._truedata
+        return {
+            'sessions': sessions,
+            'subscribed_symbols': subscribed,
+            'snapshot_symbols': len(self._snapshot),
+            'hits': self.hits,
+            'misses': self.misses,
+            'truedata': truedata.stats() if truedata is not None else None
+        }
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_live_price_service():
+    """The process-wide LivePriceService, created on first use"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = LivePriceService()
+    return _service
@@ -0,0 +1,97 @@
+"""NSE trading calendar used to decide how long prices stay fresh
+
+The cash market trades 09:15-15:30 IST on weekdays that are not exchange
+holidays. Holidays are read from NSE_HOLIDAYS (comma-separated ISO dates) so
+the yearly NSE circular can be applied without a release.
+"""
+import os
+from datetime import date, datetime, time, timedelta, timezone
+
+IST = timezone(timedelta(hours=5, minutes=30))
+MARKET_OPEN = time(9, 15)
+MARKET_CLOSE = time(15, 30)
+QUOTE_TTL_MARKET_OPEN_SECONDS = int(os.environ.get('QUOTE_TTL_MARKET_OPEN_SECONDS', '5'))
+QUOTE_TTL_MIN_CLOSED_SECONDS = 60
+
+
+def _load_holidays():
+    holidays = set()
+    for value in os.environ.get('NSE_HOLIDAYS', '').split(','):
+        value = value.strip()
+        if not value:
+            continue
+        try:
+            holidays.add(date.fromisoformat(value))
+        except ValueError:
+            print(f"Ignoring invalid NSE_HOLIDAYS entry: {value}")
+    return frozenset(holidays)
+
+
+NSE_HOLIDAYS = _load_holidays()
+
+
+def now_ist():
+    return datetime.now(IST)
+
+
+def as_ist(moment):
+    if moment is None:
+        return now_ist()
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=IST)
+    return moment.astimezone(IST)
+
+
+def is_trading_day(day):
+    return day.weekday() < 5 and day not in NSE_HOLIDAYS
+
+
+def is_market_open(moment=None):
+    moment = as_ist(moment)
+    return is_trading_day(moment.date()) and MARKET_OPEN <= moment.time() < MARKET_CLOSE
+
+
+def next_open(moment=None):
+    """Start of the next trading session strictly after `moment` (or now)"""
+    moment = as_ist(moment)
+    day = moment.date()
+    if moment.time() >= MARKET_OPEN:
+        day += timedelta(days=1)
+    while not is_trading_day(day):
+        day += timedelta(days=1)
+    return datetime.combine(day, MARKET_OPEN, IST)
+
+
+def next_close(moment=None):
+    """End of the current session if the market is open, otherwise of the next one"""
+    moment = as_ist(moment)
+    if is_market_open(moment):
+        return datetime.combine(moment.date(), MARKET_CLOSE, IST)
+    return datetime.combine(next_open(moment).date(), MARKET_CLOSE, IST)
+
+
+def last_close(moment=None):
+    """End of the most recent completed session"""
+    moment = as_ist(moment)
+    day = moment.date()
+    if moment.time() < MARKET_CLOSE:
+        day -= timedelta(days=1)
+    while not is_trading_day(day):
+        day -= timedelta(days=1)
+    return datetime.combine(day, MARKET_CLOSE, IST)
+
+
+def quote_ttl(moment=None):
+    """Seconds a quote stays fresh: short while trading, until the next open otherwise"""
+    moment = as_ist(moment)
+    if is_market_open(moment):
+        return QUOTE_TTL_MARKET_OPEN_SECONDS
+    return max(QUOTE_TTL_MIN_CLOSED_SECONDS, int((next_open(moment) - moment).total_seconds()))
+
+
+def snapshot_version(bucket_seconds, moment=None):
+    """Cache-key component that changes every bucket_seconds while trading and not at all while closed"""
+    moment = as_ist(moment)
+    if is_market_open(moment):
+        return int(moment.timestamp() // bucket_seconds)
+    return int(last_close(moment).timestamp())
@@ -0,0 +1,116 @@
+"""Streamlit caches for market data fetched from Yahoo Finance
+
+Keys are plain strings plus a snapshot version from the NSE calendar, so every
+rerun, tab switch, language change and user in the process shares one fetch
+per symbol: histories refresh every MARKET_DATA_TTL_SECONDS while the market
+trades and stay put while it is closed. Failed fetches raise and are therefore
+never cached. Index histories are kept in utils.index_history instead.
+"""
+import os
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+import yfinance as yf
+
+from utils import market_calendar
+
+MARKET_DATA_TTL_SECONDS = int(os.environ.get('MARKET_DATA_TTL_SECONDS', '900'))
+TICKER_INFO_TTL_SECONDS = int(os.environ.get('TICKER_INFO_TTL_SECONDS', '21600'))
+MARKET_DATA_MAX_ENTRIES = int(os.environ.get('MARKET_DATA_MAX_ENTRIES', '2000'))
+
+
+def flatten_yf_columns(df):
+    if df.empty:
+        return df
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.copy()
+        df.columns = df.columns.get_level_values(0)
+    return df
+
+
+def _strip_tz(df):
+    if hasattr(df.index, 'tz') and df.index.tz is not None:
+        df.index = df.index.tz_localize(None)
+    return df
+
+
+def _start_key(start_date):
+    return pd.Timestamp(start_date).date().isoformat()
+
+
+def _version():
+    return market_calendar.snapshot_version(MARKET_DATA_TTL_SECONDS)
+
+
+@st.cache_data(ttl=TICKER_INFO_TTL_SECONDS, max_entries=MARKET_DATA_MAX_ENTRIES, show_spinner=False)
+def _ticker_info(symbol, day):
+    info = dict(yf.Ticker(symbol).info or {})
+    if len(info) <= 1:
+        # Throttled or unknown symbols come back empty (or with only trailingPegRatio)
+        raise ValueError(f"No ticker info returned for {symbol}")
+    return info
+
+
+def ticker_info(symbol):
+    """yfinance Ticker.info, refreshed at most once per TICKER_INFO_TTL_SECONDS and IST day
+
+    Empty responses are not cached; callers get {} and the next call retries.
+    """
+    try:
+        return _ticker_info(symbol, market_calendar.now_ist().date().isoformat())
+    except Exception as e:
+        print(f"Ticker info unavailable for {symbol}: {e}")
+        return {}
+
+
+def _download_history(symbol, start, end):
+    history = _strip_tz(flatten_yf_columns(yf.download(symbol, start=start, end=end, progress=False)))
+    if history.empty:
+        # yfinance reports failures and throttling as an empty frame
+        raise ValueError(f"No history returned for {symbol}")
+    return history
+
+
+@st.cache_data(ttl=MARKET_DATA_TTL_SECONDS * 4, max_entries=MARKET_DATA_MAX_ENTRIES, show_spinner=False)
+def _symbol_history(symbol, start, version):
+    return _download_history(symbol, start, datetime.now())
+
+
+@st.cache_data(ttl=TICKER_INFO_TTL_SECONDS, max_entries=MARKET_DATA_MAX_ENTRIES, show_spinner=False)
+def _symbol_history_window(symbol, start, end, version):
+    return _download_history(symbol, start, end)
+
+
+def symbol_history(symbol, start_date):
+    """Daily history of a stock ticker from start_date; empty (and not cached) if the download failed"""
+    try:
+        return _symbol_history(symbol, _start_key(start_date), _version())
+    except Exception as e:
+        print(f"History unavailable for {symbol}: {e}")
+        return pd.DataFrame()
+
+
+def symbol_history_window(symbol, start_date, end_date):
+    """Daily history of a stock ticker between start_date and end_date (exclusive)
+
+    Windows that end in the past never change, so they are cached without a
+    snapshot version; empty (and not cached) if the download failed.
+    """
+    end = _start_key(end_date)
+    version = _version() if end > market_calendar.now_ist().date().isoformat() else None
+    try:
+        return _symbol_history_window(symbol, _start_key(start_date), end, version)
+    except Exception as e:
+        print(f"History unavailable for {symbol}: {e}")
+        return pd.DataFrame()
+
+
+@st.cache_data(ttl=TICKER_INFO_TTL_SECONDS, max_entries=MARKET_DATA_MAX_ENTRIES, show_spinner=False)
+def _fundamentals(_fetch, stock_name, day):
+    return _fetch(stock_name)
+
+
+def fundamentals(fetch, stock_name):
+    """Result of fetch(stock_name), cached per stock and IST day; fetch itself is not part of the key"""
+    return _fundamentals(fetch, stock_name, market_calendar.now_ist().date().isoformat())
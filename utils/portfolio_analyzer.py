@@ -77,15 +77,7 @@ class PortfolioAnalyzer:
         
         portfolio_df['Current Price'] = portfolio_df['Current Price'].fillna(portfolio_df['Buy Price'])
         
-        portfolio_df['Investment Value'] = portfolio_df['Buy Price'] * portfolio_df['Quantity']
-        portfolio_df['Current Value'] = portfolio_df['Current Price'] * portfolio_df['Quantity']
-        portfolio_df['Absolute Gain/Loss'] = portfolio_df['Current Value'] - portfolio_df['Investment Value']
-        
-        # Safely calculate percentage with division by zero protection
-        portfolio_df['Percentage Gain/Loss'] = portfolio_df.apply(
-            lambda row: (row['Absolute Gain/Loss'] / row['Investment Value'] * 100) if row['Investment Value'] != 0 else 0,
-            axis=1
-        )
+        self._apply_price_columns(portfolio_df)
         
         # Add stock categories and sectors
         portfolio_df['Category'] = portfolio_df['Stock Name'].apply(self.data_fetcher.get_stock_category)
@@ -105,6 +97,26 @@ class PortfolioAnalyzer:
         portfolio_df['All Time High Since Purchase'] = self.calculate_ath_since_purchase(portfolio_df, historical_data)
         portfolio_df['Potential Gain from ATH'] = ((portfolio_df['All Time High Since Purchase'] - portfolio_df['Buy Price']) / portfolio_df['Buy Price']) * 100
         
+        self._summarize(portfolio_df, results)
+        
+        # Correlation analysis
+        results['correlation_matrix'] = self.calculate_correlation_matrix(historical_data)
+        
+        return results
+    
+    def _apply_price_columns(self, portfolio_df):
+        """Columns that depend on the current price, computed in place"""
+        portfolio_df['Investment Value'] = portfolio_df['Buy Price'] * portfolio_df['Quantity']
+        portfolio_df['Current Value'] = portfolio_df['Current Price'] * portfolio_df['Quantity']
+        portfolio_df['Absolute Gain/Loss'] = portfolio_df['Current Value'] - portfolio_df['Investment Value']
+        
+        # Safely calculate percentage with division by zero protection
+        investment = portfolio_df['Investment Value']
+        percentage = portfolio_df['Absolute Gain/Loss'] / investment * 100
+        portfolio_df['Percentage Gain/Loss'] = percentage.where(investment != 0, 0)
+    
+    def _summarize(self, portfolio_df, results):
+        """Portfolio-level summaries derived from the per-stock columns"""
         total_annual_dividend = portfolio_df['Annual Dividend'].sum()
         current_value_total = portfolio_df['Current Value'].sum()
         investment_value_total = portfolio_df['Investment Value'].sum()
@@ -149,10 +161,29 @@ class PortfolioAnalyzer:
         
         # Stock performance
         results['stock_performance'] = portfolio_df.to_dict('records')
+    
+    def reprice(self, analysis_results, current_data):
+        """Re-value an existing analysis at new prices without refetching fundamentals or history
         
-        # Correlation analysis
-        results['correlation_matrix'] = self.calculate_correlation_matrix(historical_data)
+        Only price-dependent columns and the summaries built from them are
+        recomputed; categories, sectors, dividends and correlations are reused.
+        The ATH since purchase is raised to the new price when it exceeds it.
+        """
+        portfolio_df = pd.DataFrame(analysis_results['stock_performance'])
+        if portfolio_df.empty:
+            return analysis_results
+        
+        new_prices = portfolio_df['Stock Name'].map(current_data)
+        portfolio_df['Current Price'] = new_prices.fillna(portfolio_df['Current Price'])
+        self._apply_price_columns(portfolio_df)
+        if 'All Time High Since Purchase' in portfolio_df:
+            portfolio_df['All Time High Since Purchase'] = portfolio_df[
+                ['All Time High Since Purchase', 'Current Price']
+            ].max(axis=1)
+            portfolio_df['Potential Gain from ATH'] = ((portfolio_df['All Time High Since Purchase'] - portfolio_df['Buy Price']) / portfolio_df['Buy Price']) * 100
         
+        results = dict(analysis_results)
+        self._summarize(portfolio_df, results)
         return results
     
     def calculate_ath_since_purchase(self, portfolio_df, historical_data):
@@ -0,0 +1,85 @@
+"""Batched last-price lookups shared by live-price consumers"""
+import threading
+
+import pandas as pd
+import yfinance as yf
+
+from utils.quote_cache import quote_cache
+
+
+class PriceSource:
+    """Fetch last traded prices for many symbols in as few upstream calls as possible
+
+    Broker feeds (Zerodha, then TrueData) are tried first through one shared
+    DataFetcher; symbols they do not cover are fetched from Yahoo Finance in a
+    single batched download. Results are kept in the market-hours-aware
+    quote cache, so off-hours lookups do not hit the network.
+    """
+
+    def __init__(self, data_fetcher=None):
+        self._data_fetcher = data_fetcher
+        self._lock = threading.Lock()
+
+    @property
+    def data_fetcher(self):
+        if self._data_fetcher is None:
+            from utils.data_fetcher import DataFetcher
+            self._data_fetcher = DataFetcher()
+        return self._data_fetcher
+
+    def yahoo_symbol(self, symbol):
+        symbol = symbol.upper().strip()
+        if symbol.endswith('.NS') or symbol.endswith('.BO'):
+            return symbol
+        aliases = self.data_fetcher.symbol_aliases
+        base = aliases.get(symbol) or aliases.get(symbol.replace(' ', '')) or symbol.replace(' ', '')
+        return f"{base}.NS"
+
+    def _fetch_live(self, symbols):
+        try:
+            prices = self.data_fetcher.get_live_prices(symbols)
+        except Exception as e:
+            print(f"Live price fetch failed for {len(symbols)} symbols: {e}")
+            return {}
+        return {symbol: float(price) for symbol, price in prices.items() if price}
+
+    def _fetch_yahoo(self, symbols):
+        tickers = {self.yahoo_symbol(symbol): symbol for symbol in symbols}
+        try:
+            data = yf.download(list(tickers), period="1d", interval="1m", progress=False,
+                               group_by="column", threads=True)
+        except Exception as e:
+            print(f"Batch price download failed: {e}")
+            return {}
+        if data is None or data.empty:
+            return {}
+
+        if isinstance(data.columns, pd.MultiIndex):
+            closes = data['Close']
+        else:
+            closes = data[['Close']].rename(columns={'Close': next(iter(tickers))})
+
+        prices = {}
+        last_row = closes.ffill().iloc[-1]
+        for ticker, value in last_row.items():
+            if ticker in tickers and pd.notna(value):
+                prices[tickers[ticker]] = float(value)
+        return prices
+
+    def fetch(self, symbols):
+        """Return {symbol: last price} for the symbols that could be priced"""
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return {}
+        prices = quote_cache.get_quotes(symbols)
+        remaining = [symbol for symbol in symbols if symbol not in prices]
+        if not remaining:
+            return prices
+        with self._lock:
+            fetched = self._fetch_live(remaining)
+            missing = [symbol for symbol in remaining if symbol not in fetched]
+            if missing:
+                fetched.update(self._fetch_yahoo(missing))
+        quote_cache.put_quotes(fetched)
+        prices.update(fetched)
+        return prices
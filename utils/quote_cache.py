@@ -0,0 +1,187 @@
+"""Market-hours-aware cache of quotes and daily histories, plus a prefetch scheduler
+
+Entries expire according to the NSE calendar: a few seconds while the market
+trades, and at the next open otherwise, since nothing can change in between.
+The scheduler warms the most-held symbols shortly after the close and before
+the open so off-hours analyses are served without network calls.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+import pandas as pd
+import yfinance as yf
+
+from utils import market_calendar
+
+QUOTE_CACHE_MAX_ENTRIES = int(os.environ.get('QUOTE_CACHE_MAX_ENTRIES', '4000'))
+PREFETCH_SYMBOL_LIMIT = int(os.environ.get('PREFETCH_SYMBOL_LIMIT', '100'))
+PREFETCH_AFTER_CLOSE_MINUTES = int(os.environ.get('PREFETCH_AFTER_CLOSE_MINUTES', '20'))
+PREFETCH_BEFORE_OPEN_MINUTES = int(os.environ.get('PREFETCH_BEFORE_OPEN_MINUTES', '20'))
+PREFETCH_HISTORY_YEARS = int(os.environ.get('PREFETCH_HISTORY_YEARS', '5'))
+HISTORY_TTL_MARKET_OPEN_SECONDS = int(os.environ.get('HISTORY_TTL_MARKET_OPEN_SECONDS', '300'))
+
+
+class QuoteCache:
+    def __init__(self, max_entries=QUOTE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key, record=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                if record:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if record:
+                self.hits += 1
+            return entry[0]
+
+    def _put(self, key, value, ttl=None):
+        ttl = market_calendar.quote_ttl() if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_quotes(self, symbols):
+        """Cached {symbol: price} for the symbols that are still fresh"""
+        prices = {}
+        for symbol in symbols:
+            price = self._get(('quote', symbol))
+            if price is not None:
+                prices[symbol] = price
+        return prices
+
+    def put_quotes(self, prices, ttl=None):
+        for symbol, price in prices.items():
+            self._put(('quote', symbol), price, ttl)
+
+    def get_history(self, symbol, start_date):
+        """Cached daily history from start_date, if the cached frame reaches back that far"""
+        entry = self._get(('history', symbol))
+        if entry is None:
+            return None
+        cached_start, history = entry
+        start = pd.Timestamp(start_date)
+        if start < cached_start:
+            return None
+        return history[history.index >= start].copy()
+
+    def put_history(self, symbol, start_date, history, ttl=None):
+        if history is None or history.empty:
+            return
+        if ttl is None and market_calendar.is_market_open():
+            # Daily bars only move in today's row while trading; no need to refetch every few seconds
+            ttl = HISTORY_TTL_MARKET_OPEN_SECONDS
+        start = pd.Timestamp(start_date)
+        current = self._get(('history', symbol), record=False)
+        if current is not None and current[0] < start:
+            # Keep the fresh frame that reaches further back until it expires
+            return
+        self._put(('history', symbol), (start, history), ttl)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+quote_cache = QuoteCache()
+
+
+class PrefetchScheduler:
+    """Daemon thread that warms quotes and histories of the most-held symbols"""
+
+    def __init__(self, cache=quote_cache, limit=PREFETCH_SYMBOL_LIMIT):
+        self.cache = cache
+        self.limit = limit
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+        self.last_run = None
+        self.last_count = 0
+
+    def start(self):
+        if not (os.environ.get('EXTERNAL_DATABASE_URL') or os.environ.get('DATABASE_URL')):
+            return
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="quote-prefetch", daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def next_run(self, moment=None):
+        moment = market_calendar.as_ist(moment)
+        after_close = market_calendar.last_close(moment) + timedelta(minutes=PREFETCH_AFTER_CLOSE_MINUTES)
+        if after_close <= moment:
+            after_close = market_calendar.next_close(moment) + timedelta(minutes=PREFETCH_AFTER_CLOSE_MINUTES)
+        before_open = market_calendar.next_open(moment) - timedelta(minutes=PREFETCH_BEFORE_OPEN_MINUTES)
+        if before_open <= moment:
+            before_open = after_close
+        return min(after_close, before_open)
+
+    def _run(self):
+        while True:
+            wait = (self.next_run() - market_calendar.now_ist()).total_seconds()
+            time.sleep(max(wait, 1))
+            try:
+                self.prefetch()
+            except Exception as e:
+                print(f"Quote prefetch failed: {e}")
+
+    def most_held_symbols(self):
+        from utils.database import Database
+        from utils.data_fetcher import DataFetcher
+        names = Database().get_most_held_stocks(self.limit)
+        data_fetcher = DataFetcher()
+        return list(dict.fromkeys(data_fetcher.get_stock_symbol(name) for name in names))
+
+    def prefetch(self, symbols=None):
+        """Fetch last prices and daily histories for symbols (default: most held) in batched downloads"""
+        symbols = symbols or self.most_held_symbols()
+        if not symbols:
+            return 0
+        start = (market_calendar.now_ist() - timedelta(days=365 * PREFETCH_HISTORY_YEARS)).date()
+        data = yf.download(symbols, start=start.isoformat(), progress=False, group_by='ticker', threads=True)
+        if data is None or data.empty:
+            return 0
+
+        prices = {}
+        for symbol in symbols:
+            if isinstance(data.columns, pd.MultiIndex):
+                if symbol not in data.columns.get_level_values(0):
+                    continue
+                history = data[symbol].dropna(how='all')
+            else:
+                history = data.dropna(how='all')
+            if history.empty:
+                continue
+            if getattr(history.index, 'tz', None) is not None:
+                history.index = history.index.tz_localize(None)
+            self.cache.put_history(symbol, start, history)
+            prices[symbol] = float(history['Close'].iloc[-1])
+
+        if not market_calendar.is_market_open():
+            self.cache.put_quotes(prices)
+        self.last_run = market_calendar.now_ist()
+        self.last_count = len(prices)
+        print(f"Prefetched {len(prices)} symbols")
+        return len(prices)
+
+
+prefetch_scheduler = PrefetchScheduler()
@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from utils.data_fetcher import DataFetcher
+from utils.reference_data import get_reference_snapshot
 import os
 
 class RecommendationEngine:
@@ -17,16 +18,12 @@ class RecommendationEngine:
     
     def _load_alternatives(self):
         if os.environ.get('DATABASE_URL'):
-            try:
-                from utils.database import Database
-                db = Database()
-                self._alternative_stocks = db.get_alternative_stocks()
-                if self._alternative_stocks:
-                    if 'Others' not in self._alternative_stocks:
-                        self._alternative_stocks['Others'] = ['RELIANCE', 'TCS', 'HDFCBANK', 'INFY']
-                    return
-            except Exception as e:
-                print(f"Database load failed for alternatives: {e}")
+            alternatives = get_reference_snapshot().alternatives
+            if alternatives:
+                self._alternative_stocks = dict(alternatives)
+                if 'Others' not in self._alternative_stocks:
+                    self._alternative_stocks['Others'] = ['RELIANCE', 'TCS', 'HDFCBANK', 'INFY']
+                return
         
         self._alternative_stocks = {
             'Banking': ['HDFCBANK', 'ICICIBANK', 'KOTAKBANK', 'SBIN', 'AXISBANK'],
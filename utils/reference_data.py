@@ -0,0 +1,197 @@
+"""Process-wide snapshot of reference tables
+
+Symbols, aliases, indices, sectors, alternatives, ISIN mappings and rebalancing
+strategies change rarely, so they are read once per process into an immutable,
+versioned snapshot shared by every DataFetcher, RecommendationEngine,
+PortfolioFileParser and PortfolioRebalancing instance. A snapshot older than
+REFERENCE_DATA_TTL_SECONDS keeps being served while a background thread
+reloads it; invalidate() forces a reload on the next access. A table that
+fails to load keeps its previously loaded value, and the snapshot is retried
+after REFERENCE_DATA_RETRY_SECONDS until every table has loaded.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from types import MappingProxyType
+
+REFERENCE_DATA_TTL_SECONDS = int(os.environ.get('REFERENCE_DATA_TTL_SECONDS', '900'))
+REFERENCE_DATA_RETRY_SECONDS = int(os.environ.get('REFERENCE_DATA_RETRY_SECONDS', '60'))
+
+# Snapshot table name -> Database loader method
+TABLE_LOADERS = {
+    'stock_symbols': 'get_stock_symbols',
+    'symbol_aliases': 'get_symbol_aliases',
+    'indices': 'get_market_indices',
+    'sectors': 'get_sectors',
+    'alternatives': 'get_alternative_stocks',
+    'isin_mappings': 'get_isin_mappings',
+    'strategies': 'get_rebalancing_strategies',
+}
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _checksum(tables):
+    payload = json.dumps(tables, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+class ReferenceSnapshot:
+    """Read-only view of the reference tables at one version
+
+    A table is None when it could not be loaded, so callers can fall back to
+    their built-in defaults exactly as they did before.
+    """
+
+    def __init__(self, version, tables, checksum, expires_at):
+        self.version = version
+        self.checksum = checksum
+        self.loaded_at = time.time()
+        self.expires_at = expires_at
+        self._tables = {name: (_freeze(data) if data is not None else None) for name, data in tables.items()}
+
+        stock_symbols = tables.get('stock_symbols')
+        if stock_symbols is not None:
+            self._tables['stock_categories'] = _freeze(
+                {symbol: info.get('category', 'Mid Cap') for symbol, info in stock_symbols.items()}
+            )
+            self._tables['sector_mapping'] = _freeze(
+                {symbol: info.get('sector', 'Others') for symbol, info in stock_symbols.items()}
+            )
+        else:
+            self._tables['stock_categories'] = None
+            self._tables['sector_mapping'] = None
+
+    def table(self, name):
+        return self._tables.get(name)
+
+    @property
+    def stock_symbols(self):
+        return self._tables.get('stock_symbols')
+
+    @property
+    def symbol_aliases(self):
+        return self._tables.get('symbol_aliases')
+
+    @property
+    def indices(self):
+        return self._tables.get('indices')
+
+    @property
+    def sectors(self):
+        return self._tables.get('sectors')
+
+    @property
+    def alternatives(self):
+        return self._tables.get('alternatives')
+
+    @property
+    def isin_mappings(self):
+        return self._tables.get('isin_mappings')
+
+    @property
+    def strategies(self):
+        return self._tables.get('strategies')
+
+    @property
+    def stock_categories(self):
+        return self._tables.get('stock_categories')
+
+    @property
+    def sector_mapping(self):
+        return self._tables.get('sector_mapping')
+
+
+class ReferenceDataStore:
+    """Holds the current ReferenceSnapshot and refreshes it on TTL or invalidation"""
+
+    def __init__(self, ttl=REFERENCE_DATA_TTL_SECONDS, retry=REFERENCE_DATA_RETRY_SECONDS):
+        self.ttl = ttl
+        self.retry = retry
+        self._snapshot = None
+        # table name -> last successfully loaded data, reused when a reload of it fails
+        self._loaded_tables = {}
+        self._stale = False
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _load_tables(self):
+        tables = {name: None for name in TABLE_LOADERS}
+        if not (os.environ.get('EXTERNAL_DATABASE_URL') or os.environ.get('DATABASE_URL')):
+            return tables
+        try:
+            from utils.database import Database
+            db = Database()
+        except Exception as e:
+            print(f"Reference data load failed: {e}")
+            return tables
+        for name, loader in TABLE_LOADERS.items():
+            try:
+                tables[name] = getattr(db, loader)()
+            except Exception as e:
+                print(f"Reference data load failed for {name}: {e}")
+        return tables
+
+    def _reload(self):
+        tables = self._load_tables()
+        loaded_all = all(data is not None for data in tables.values())
+        for name, data in tables.items():
+            if data is not None:
+                self._loaded_tables[name] = data
+            else:
+                tables[name] = self._loaded_tables.get(name)
+        checksum = _checksum(tables)
+        previous = self._snapshot
+        if previous is None:
+            version = 1
+        else:
+            version = previous.version if previous.checksum == checksum else previous.version + 1
+        expires_at = time.time() + (self.ttl if loaded_all else self.retry)
+        self._snapshot = ReferenceSnapshot(version, tables, checksum, expires_at)
+        self._stale = False
+
+    def _background_refresh(self):
+        try:
+            with self._lock:
+                self._reload()
+        except Exception as e:
+            print(f"Reference data refresh failed: {e}")
+        finally:
+            self._refreshing = False
+
+    def get(self):
+        """Return the current snapshot, loading it synchronously on first use"""
+        snapshot = self._snapshot
+        if snapshot is None or self._stale:
+            with self._lock:
+                if self._snapshot is None or self._stale:
+                    self._reload()
+                return self._snapshot
+
+        if time.time() >= snapshot.expires_at and not self._refreshing:
+            self._refreshing = True
+            threading.Thread(target=self._background_refresh, name="reference-data-refresh", daemon=True).start()
+        return snapshot
+
+    def invalidate(self):
+        """Force a reload on next access, e.g. after reference tables are edited"""
+        self._stale = True
+
+    @property
+    def version(self):
+        return self._snapshot.version if self._snapshot is not None else 0
+
+
+reference_data = ReferenceDataStore()
+
+
+def get_reference_snapshot():
+    return reference_data.get()
@@ -1,13 +1,33 @@
 import os
 import json
+import time
+import random
 import asyncio
 import websockets
 from datetime import datetime
+from collections import deque, namedtuple
 import threading
-import queue
+
+from utils.intraday_bars import intraday_bars
+
+TRUEDATA_TICK_BUFFER_SIZE = int(os.environ.get('TRUEDATA_TICK_BUFFER_SIZE', '256'))
+TRUEDATA_RECONNECT_MIN_SECONDS = 1
+TRUEDATA_RECONNECT_MAX_SECONDS = int(os.environ.get('TRUEDATA_RECONNECT_MAX_SECONDS', '60'))
+TICK_RATE_WINDOW_SECONDS = 10
+
+Tick = namedtuple('Tick', ['ltp', 'open', 'high', 'low', 'close', 'volume', 'timestamp'])
+
 
 class TrueDataClient:
-    def __init__(self):
+    """Streaming TrueData client
+
+    The listener thread is the only writer of latest_ticks and replaces whole
+    immutable Tick entries, so price reads never take a lock. Recent ticks are
+    kept in fixed-size per-symbol ring buffers. Dropped connections are retried
+    with exponential backoff and every subscribed symbol is re-subscribed.
+    """
+
+    def __init__(self, buffer_size=TRUEDATA_TICK_BUFFER_SIZE):
         self.username = os.environ.get('TRUEDATA_USERNAME')
         self.password = os.environ.get('TRUEDATA_PASSWORD')
         self.realtime_port = 8084
@@ -15,109 +35,243 @@ class TrueDataClient:
         self.base_url = "push.truedata.in"
         self.ws = None
         self.is_connected = False
-        self.price_cache = {}
-        self.message_queue = queue.Queue()
+        self.buffer_size = buffer_size
+        self.latest_ticks = {}
+        self._tick_buffers = {}
+        self._buffer_lock = threading.Lock()
+        self._symbols = set()
+        self._symbols_lock = threading.Lock()
+        self._loop = None
+        self._thread = None
         self._running = False
-    
+        # Guards _running/_exiting so a restart cannot race the stream thread's decision to exit
+        self._lifecycle_lock = threading.Lock()
+        self._exiting = False
+
+        self.ticks_total = 0
+        self.reconnects = 0
+        self.last_tick_at = None
+        self.connected_since = None
+        self._tick_rate = deque(maxlen=TICK_RATE_WINDOW_SECONDS)
+
     def get_websocket_url(self):
         return f"wss://{self.base_url}:{self.websocket_port}?user={self.username}&password={self.password}"
-    
+
     async def _connect(self):
         try:
             url = self.get_websocket_url()
             self.ws = await websockets.connect(url, ping_interval=30, ping_timeout=10)
             self.is_connected = True
+            self.connected_since = time.time()
             print(f"TrueData WebSocket connected at {datetime.now()}")
             return True
         except Exception as e:
             print(f"TrueData connection error: {e}")
             self.is_connected = False
             return False
-    
+
     async def _subscribe(self, symbols: list):
-        if not self.is_connected or not self.ws:
+        return await self._send({"method": "addsymbol", "symbols": symbols})
+
+    async def _send(self, message: dict):
+        if not self.is_connected or not self.ws or not message.get("symbols"):
             return False
-        
+
         try:
-            subscribe_msg = {
-                "method": "addsymbol",
-                "symbols": symbols
-            }
-            await self.ws.send(json.dumps(subscribe_msg))
+            await self.ws.send(json.dumps(message))
             return True
         except Exception as e:
             print(f"Subscribe error: {e}")
             return False
-    
+
     async def _listen(self):
         try:
-            while self._running and self.ws:
-                message = await self.ws.recv()
-                data = json.loads(message)
-                self._process_message(data)
+            async for message in self.ws:
+                if not self._running:
+                    break
+                self._process_message(json.loads(message))
         except websockets.exceptions.ConnectionClosed:
-            self.is_connected = False
             print("TrueData connection closed")
         except Exception as e:
             print(f"Listen error: {e}")
-    
+        finally:
+            self.is_connected = False
+
+    async def _stream(self):
+        backoff = TRUEDATA_RECONNECT_MIN_SECONDS
+        first_attempt = True
+        while self._keep_running():
+            if not first_attempt:
+                self.reconnects += 1
+            first_attempt = False
+
+            if await self._connect():
+                backoff = TRUEDATA_RECONNECT_MIN_SECONDS
+                with self._symbols_lock:
+                    symbols = sorted(self._symbols)
+                await self._subscribe(symbols)
+                await self._listen()
+
+            if not self._keep_running():
+                break
+            delay = backoff * (0.5 + random.random() / 2)
+            print(f"TrueData reconnecting in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            backoff = min(backoff * 2, TRUEDATA_RECONNECT_MAX_SECONDS)
+
+    def _keep_running(self):
+        with self._lifecycle_lock:
+            if not self._running:
+                self._exiting = True
+            return self._running
+
+    def _record_rate(self, now):
+        second = int(now)
+        if self._tick_rate and self._tick_rate[-1][0] == second:
+            self._tick_rate[-1][1] += 1
+        else:
+            self._tick_rate.append([second, 1])
+
     def _process_message(self, data):
         try:
             if isinstance(data, dict):
                 symbol = data.get('symbol')
                 if symbol:
-                    self.price_cache[symbol] = {
-                        'ltp': data.get('ltp', data.get('close')),
-                        'open': data.get('open'),
-                        'high': data.get('high'),
-                        'low': data.get('low'),
-                        'close': data.get('close'),
-                        'volume': data.get('volume'),
-                        'timestamp': data.get('timestamp', datetime.now().isoformat())
-                    }
-                    self.message_queue.put(data)
+                    tick = Tick(
+                        ltp=data.get('ltp', data.get('close')),
+                        open=data.get('open'),
+                        high=data.get('high'),
+                        low=data.get('low'),
+                        close=data.get('close'),
+                        volume=data.get('volume'),
+                        timestamp=data.get('timestamp', datetime.now().isoformat())
+                    )
+                    self.latest_ticks[symbol] = tick
+                    with self._buffer_lock:
+                        buffer = self._tick_buffers.get(symbol)
+                        if buffer is None:
+                            buffer = self._tick_buffers[symbol] = deque(maxlen=self.buffer_size)
+                        buffer.append(tick)
+                    now = time.time()
+                    self.ticks_total += 1
+                    self.last_tick_at = now
+                    self._record_rate(now)
+                    intraday_bars.on_tick(symbol, tick.ltp, tick.volume, now)
         except Exception as e:
             print(f"Process message error: {e}")
-    
+
     def get_live_price(self, symbol: str):
         nse_symbol = symbol.replace('.NS', '').replace('.BO', '')
-        return self.price_cache.get(nse_symbol, {}).get('ltp')
-    
+        tick = self.latest_ticks.get(nse_symbol)
+        return tick.ltp if tick else None
+
     def get_cached_prices(self):
-        return self.price_cache.copy()
-    
+        return {symbol: tick._asdict() for symbol, tick in self.latest_ticks.copy().items()}
+
+    def get_recent_ticks(self, symbol: str, limit: int = None):
+        """Most recent ticks for a symbol, oldest first (at most buffer_size)"""
+        nse_symbol = symbol.replace('.NS', '').replace('.BO', '')
+        with self._buffer_lock:
+            ticks = list(self._tick_buffers.get(nse_symbol, ()))
+        return ticks[-limit:] if limit else ticks
+
+    def subscribe(self, symbols: list):
+        """Add symbols to the stream; they are also re-subscribed after every reconnect"""
+        clean_symbols = [s.replace('.NS', '').replace('.BO', '') for s in symbols]
+        with self._symbols_lock:
+            new_symbols = [s for s in clean_symbols if s not in self._symbols]
+            self._symbols.update(new_symbols)
+        if new_symbols and self._loop is not None and self.is_connected:
+            asyncio.run_coroutine_threadsafe(self._subscribe(new_symbols), self._loop)
+
+    def unsubscribe(self, symbols: list):
+        clean_symbols = [s.replace('.NS', '').replace('.BO', '') for s in symbols]
+        with self._symbols_lock:
+            removed = [s for s in clean_symbols if s in self._symbols]
+            self._symbols.difference_update(removed)
+        for symbol in removed:
+            self.latest_ticks.pop(symbol, None)
+        with self._buffer_lock:
+            for symbol in removed:
+                self._tick_buffers.pop(symbol, None)
+        if removed and self._loop is not None and self.is_connected:
+            asyncio.run_coroutine_threadsafe(self._send({"method": "removesymbol", "symbols": removed}), self._loop)
+
     def start_streaming(self, symbols: list):
-        def run_async():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            async def stream():
-                self._running = True
-                if await self._connect():
-                    clean_symbols = [s.replace('.NS', '').replace('.BO', '') for s in symbols]
-                    await self._subscribe(clean_symbols)
-                    await self._listen()
-            
-            loop.run_until_complete(stream())
-        
-        thread = threading.Thread(target=run_async, daemon=True)
-        thread.start()
-    
+        self.subscribe(symbols)
+        with self._lifecycle_lock:
+            self._running = True
+            # A thread that has not yet decided to exit (e.g. sleeping in backoff
+            # after stop_streaming) sees _running again and keeps streaming
+            if self._thread is not None and self._thread.is_alive() and not self._exiting:
+                return
+            self._exiting = False
+
+            def run_async():
+                loop = asyncio.new_event_loop()
+                self._loop = loop
+                asyncio.set_event_loop(loop)
+                try:
+                    loop.run_until_complete(self._stream())
+                finally:
+                    loop.close()
+                    if self._loop is loop:
+                        self._loop = None
+
+            self._thread = threading.Thread(target=run_async, name="truedata-stream", daemon=True)
+            self._thread.start()
+
     def stop_streaming(self):
-        self._running = False
+        with self._lifecycle_lock:
+            self._running = False
+        if self._loop is not None and self.ws is not None:
+            asyncio.run_coroutine_threadsafe(self.ws.close(), self._loop)
         self.is_connected = False
-    
+
+    def ticks_per_second(self):
+        now = int(time.time())
+        recent = [count for second, count in list(self._tick_rate) if now - second < TICK_RATE_WINDOW_SECONDS]
+        return sum(recent) / TICK_RATE_WINDOW_SECONDS
+
+    def staleness_seconds(self, symbol: str = None):
+        """Seconds since the last tick (for one symbol when given); None if nothing was received"""
+        if symbol is None:
+            return time.time() - self.last_tick_at if self.last_tick_at else None
+        with self._buffer_lock:
+            buffer = self._tick_buffers.get(symbol.replace('.NS', '').replace('.BO', ''))
+            last = buffer[-1] if buffer else None
+        if last is None:
+            return None
+        try:
+            return (datetime.now() - datetime.fromisoformat(str(last.timestamp))).total_seconds()
+        except ValueError:
+            return None
+
+    def stats(self):
+        with self._symbols_lock:
+            subscribed = len(self._symbols)
+        return {
+            'connected': self.is_connected,
+            'subscribed_symbols': subscribed,
+            'symbols_with_ticks': len(self.latest_ticks),
+            'ticks_total': self.ticks_total,
+            'ticks_per_second': round(self.ticks_per_second(), 2),
+            'reconnects': self.reconnects,
+            'staleness_seconds': self.staleness_seconds(),
+            'connected_since': self.connected_since
+        }
+
     def get_historical_data(self, symbol: str, start_date: str, end_date: str, timeframe: str = "1D"):
         pass
-    
+
     def is_market_open(self):
         now = datetime.now()
         if now.weekday() >= 5:
             return False
-        
+
         market_open = now.replace(hour=9, minute=15, second=0, microsecond=0)
         market_close = now.replace(hour=15, minute=30, second=0, microsecond=0)
-        
+
         return market_open <= now <= market_close
 
 
@@ -125,9 +279,12 @@ class TrueDataPriceFetcher:
     def __init__(self):
         self.client = TrueDataClient()
         self._initialized = False
-    
+
     def initialize(self, symbols: list):
-        if not self._initialized and self.client.username and self.client.password:
+        if self._initialized:
+            self.client.subscribe(symbols)
+            return True
+        if self.client.username and self.client.password:
             try:
                 self.client.start_streaming(symbols)
                 self._initialized = True
@@ -136,15 +293,21 @@ class TrueDataPriceFetcher:
                 print(f"TrueData initialization failed: {e}")
                 return False
         return self._initialized
-    
+
     def get_price(self, symbol: str):
         return self.client.get_live_price(symbol)
-    
+
     def get_all_prices(self):
         return self.client.get_cached_prices()
-    
+
+    def get_recent_ticks(self, symbol: str, limit: int = None):
+        return self.client.get_recent_ticks(symbol, limit)
+
     def is_available(self):
         return bool(self.client.username and self.client.password)
-    
+
     def is_connected(self):
         return self.client.is_connected
+
+    def stats(self):
+        return self.client.stats()
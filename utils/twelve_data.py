@@ -2,6 +2,8 @@ import os
 import requests
 import time
 
+from utils import market_calendar
+
 class TwelveDataClient:
     def __init__(self):
         self.api_key = os.environ.get('TWELVE_DATA_API_KEY')
@@ -15,13 +17,13 @@ class TwelveDataClient:
     
     def _get_cached(self, key):
         if key in self._cache:
-            if time.time() - self._cache_time.get(key, 0) < self._cache_duration:
+            if time.time() < self._cache_time.get(key, 0):
                 return self._cache[key]
         return None
     
-    def _set_cache(self, key, value):
+    def _set_cache(self, key, value, ttl=None):
         self._cache[key] = value
-        self._cache_time[key] = time.time()
+        self._cache_time[key] = time.time() + (self._cache_duration if ttl is None else ttl)
     
     def _convert_symbol(self, symbol):
         symbol = symbol.upper().strip()
@@ -77,7 +79,7 @@ class TwelveDataClient:
                 'fifty_two_week_low': self._safe_float(data.get('fifty_two_week', {}).get('low')),
             }
             
-            self._set_cache(cache_key, quote_data)
+            self._set_cache(cache_key, quote_data, ttl=market_calendar.quote_ttl())
             return quote_data
             
         except Exception as e: